@@ -0,0 +1,310 @@
+"""Local stand-in for the Vistopia API and its media hosts.
+
+`MockVistopia` serves generated shows shaped like the real endpoints
+(`content/catalog/{id}`, `content/content-show/{id}`, `search/web`,
+`user/subscriptions-list`), together with synthetic MP3 files made of
+valid MPEG frames, cover images and transcript pages. Every response can
+be delayed by a fixed latency and sent at a capped bandwidth, and the
+server counts the requests and bytes it served so that a benchmark can
+report them per command.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# One MPEG-1 layer III frame, 128 kbit/s at 44.1 kHz.
+MP3_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+COURSE_CSS = "/assets/article/course.css"
+SEND_CHUNK = 16 * 1024
+
+
+class Settings(NamedTuple):
+    shows: int = 2
+    episodes: int = 50          # per show
+    part_size: int = 20         # episodes per catalog part
+    media_bytes: int = 256 * 1024
+    transcript_bytes: int = 16 * 1024
+    cover_bytes: int = 32 * 1024
+    page_size: int = 20         # items per search/subscriptions page
+    latency: float = 0.0        # seconds before every response
+    bandwidth: Optional[float] = None   # bytes/second per response
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    app: "MockVistopia"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def do_GET(self):
+        self.server.app.handle(self)
+
+    def do_HEAD(self):
+        self.server.app.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+class MockVistopia:
+    """Generated Vistopia API, media and transcript server."""
+
+    def __init__(self, settings: Settings = Settings(),
+                 host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings
+        self.calls: Counter = Counter()
+        self.bytes_sent: Counter = Counter()
+        self._lock = threading.Lock()
+        self._catalogs: Dict[int, dict] = {}
+        self._media = _repeat(MP3_FRAME, settings.media_bytes)
+        self._cover = PNG_HEADER + bytes(max(0, settings.cover_bytes - len(PNG_HEADER)))
+        self._routes: List[Tuple[Pattern, Callable[..., Response]]] = [
+            (re.compile(r"/api/v1/content/catalog/(\d+)"), self._catalog),
+            (re.compile(r"/api/v1/content/content-show/(\d+)"), self._content_show),
+            (re.compile(r"/api/v1/search/web"), self._search),
+            (re.compile(r"/api/v1/user/subscriptions-list"), self._subscriptions),
+            (re.compile(r"/media/(\d+)/(\d+)\.mp3"), self._mp3),
+            (re.compile(r"/covers/(\d+)\.png"), self._cover_image),
+            (re.compile(r"/article/(\d+)\.html"), self._transcript),
+            (re.compile(re.escape(COURSE_CSS)), self._css),
+        ]
+        self.host = host
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.app = self
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True
+        )
+
+    def url(self, path: str = "/") -> str:
+        return f"http://{self.host}:{self._httpd.server_port}{path}"
+
+    @property
+    def base_url(self) -> str:
+        return self.url("/api/v1/")
+
+    @property
+    def api_calls(self) -> int:
+        return self.calls["api"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.bytes_sent.clear()
+
+    # Generated data
+
+    def article_id(self, show: int, number: int) -> str:
+        return str(show * 1000000 + number)
+
+    def catalog(self, show: int) -> dict:
+        with self._lock:
+            catalog = self._catalogs.get(show)
+        if catalog is not None:
+            return catalog
+
+        settings = self.settings
+        articles = [
+            {
+                "article_id": self.article_id(show, i),
+                "content_id": show,
+                "sort_number": str(i),
+                "title": f"节目 {show} 第 {i} 集",
+                "duration_str": "12:34",
+                "media_key_full_url": self.url(f"/media/{show}/{i}.mp3"),
+                "content_url": self.url(f"/article/{self.article_id(show, i)}.html"),
+                "share_desc": f"第 {i} 集的简介",
+                "is_listened": i % 3 == 0,
+            }
+            for i in range(1, settings.episodes + 1)
+        ]
+        size = max(1, settings.part_size)
+        catalog = {
+            "id": show,
+            "author": "作者",
+            "title": f"节目 {show}",
+            "type": "free",
+            "background_img": self.url(f"/covers/{show}.png"),
+            "catalog": [
+                {
+                    "catalog_id": n + 1,
+                    "catalog_number": str(n + 1),
+                    "catalog_title": f"第 {n + 1} 部分",
+                    "part": articles[start:start + size],
+                }
+                for n, start in enumerate(range(0, len(articles), size))
+            ],
+        }
+        with self._lock:
+            self._catalogs[show] = catalog
+        return catalog
+
+    def _show(self, show: int) -> dict:
+        return {
+            "content_id": show,
+            "author": "作者",
+            "title": f"节目 {show}",
+            "subtitle": "模拟数据",
+            "share_desc": f"第 {show} 个模拟节目",
+            "article_count": self.settings.episodes,
+        }
+
+    # Routes
+
+    def _catalog(self, handler, show: str) -> Response:
+        if not 1 <= int(show) <= self.settings.shows:
+            return _json({"status": "fail", "message": "not found"})
+        return _json({"status": "success", "data": self.catalog(int(show))})
+
+    def _content_show(self, handler, show: str) -> Response:
+        if not 1 <= int(show) <= self.settings.shows:
+            return _json({"status": "fail", "message": "not found"})
+        return _json({"status": "success", "data": self._show(int(show))})
+
+    def _search(self, handler) -> Response:
+        return self._page(handler, [
+            {
+                "id": show, "author": "作者", "title": f"节目 {show}",
+                "share_desc": f"第 {show} 个模拟节目", "data_type": "content",
+            }
+            for show in range(1, self.settings.shows + 1)
+        ])
+
+    def _subscriptions(self, handler) -> Response:
+        return self._page(handler, [
+            {"content_id": show, "title": f"节目 {show}", "subtitle": "模拟数据"}
+            for show in range(1, self.settings.shows + 1)
+        ])
+
+    def _page(self, handler, items: list) -> Response:
+        query = parse_qs(urlsplit(handler.path).query)
+        page = int(query.get("page", ["1"])[0])
+        size = max(1, self.settings.page_size)
+        last_page = max(1, -(-len(items) // size))
+        return _json({"status": "success", "data": {
+            "data": items[(page - 1) * size:page * size],
+            "current_page": page,
+            "last_page": last_page,
+            "per_page": size,
+            "total": len(items),
+        }})
+
+    def _mp3(self, handler, show: str, number: str) -> Response:
+        return _ranged(handler, self._media, "audio/mpeg")
+
+    def _cover_image(self, handler, show: str) -> Response:
+        return 200, {"Content-Type": "image/png"}, self._cover
+
+    def _transcript(self, handler, article_id: str) -> Response:
+        head = (
+            "<html><head><meta charset=\"utf-8\">"
+            f"<link rel=\"stylesheet\" href=\"{COURSE_CSS}\"></head><body>"
+        )
+        tail = "</body></html>"
+        paragraph = f"<p>文稿 {article_id}：知识只求八分饱。</p>"
+        size = max(0, self.settings.transcript_bytes - len(head) - len(tail))
+        body = (head + _repeat(paragraph, size // 3) + tail).encode()
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, body
+
+    def _css(self, handler) -> Response:
+        return 200, {"Content-Type": "text/css"}, b"p { margin: 0; }\n"
+
+    # Server
+
+    def handle(self, handler: BaseHTTPRequestHandler) -> None:
+        path = urlsplit(handler.path).path
+        kind = "api" if path.startswith("/api/") else path.split("/")[1]
+
+        for pattern, route in self._routes:
+            match = pattern.fullmatch(path)
+            if match:
+                status, headers, body = route(handler, *match.groups())
+                break
+        else:
+            status, headers, body = 404, {}, b"not found"
+
+        with self._lock:
+            self.calls[kind] += 1
+
+        if self.settings.latency:
+            time.sleep(self.settings.latency)
+
+        try:
+            handler.send_response(status)
+            for key, value in headers.items():
+                handler.send_header(key, value)
+            if "Content-Length" not in headers:
+                handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            if handler.command != "HEAD":
+                self._send(handler, kind, body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients that only want the first bytes hang up early.
+            handler.close_connection = True
+
+    def _send(self, handler, kind: str, body: bytes) -> None:
+        bandwidth = self.settings.bandwidth
+        start = time.monotonic()
+        for offset in range(0, len(body), SEND_CHUNK):
+            chunk = body[offset:offset + SEND_CHUNK]
+            if bandwidth:
+                # Hold each chunk back until the rate allows all of it.
+                delay = (offset + len(chunk)) / bandwidth - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            handler.wfile.write(chunk)
+            with self._lock:
+                self.bytes_sent[kind] += len(chunk)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def _repeat(unit, size: int):
+    """`unit` repeated to at most `size` (and at least one copy).
+
+    >>> len(_repeat(MP3_FRAME, 1000))
+    834
+    """
+    return unit * max(1, size // len(unit))
+
+
+def _json(payload) -> Response:
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    return 200, {"Content-Type": "application/json"}, body
+
+
+def _ranged(handler, body: bytes, content_type: str) -> Response:
+    headers = {"Content-Type": content_type, "Accept-Ranges": "bytes"}
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", handler.headers.get("Range", ""))
+    if not match or not any(match.groups()):
+        return 200, headers, body
+
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, len(body) - int(last)), len(body) - 1
+    else:
+        start = int(first)
+        end = min(int(last), len(body) - 1) if last else len(body) - 1
+    if start >= len(body) or start > end:
+        headers["Content-Range"] = f"bytes */{len(body)}"
+        return 416, headers, b""
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+    return 206, headers, body[start:end + 1]
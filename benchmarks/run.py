@@ -0,0 +1,253 @@
+"""Benchmark CLI commands against a local mock of the Vistopia API.
+
+Each command runs in a fresh `vistopian` process pointed at
+`MockVistopia`, in an empty working directory, so that timings include
+startup and peak RSS is that of the command alone::
+
+    python -m benchmarks.run --shows 4 --episodes 200 -j 8
+    python -m benchmarks.run --command save-show --latency 0.05 --bandwidth 2M
+
+For every command the report gives the wall time, episodes per second,
+MB per second of media and transcripts received, the number of API
+calls and the peak RSS. With `--parse`, parsing the mock catalogs into
+full models and into the lean records of `--fast-parse` is compared
+in-process as well.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import click
+
+from vistopia.utils import parse_size
+
+from .mock_api import MockVistopia, Settings
+
+ROOT = Path(__file__).parent.parent
+
+
+class Benchmark(NamedTuple):
+    args: Callable[[List[int], int], List[str]]
+    episodes: bool      # whether the command processes every episode
+
+
+def _ids(ids: List[int]) -> List[str]:
+    return [arg for id in ids for arg in ("--id", str(id))]
+
+
+COMMANDS: Dict[str, Benchmark] = {
+    "save-show": Benchmark(
+        lambda ids, jobs: ["save-show", *_ids(ids), "-j", str(jobs)], True),
+    "save-transcript": Benchmark(
+        lambda ids, jobs: ["save-transcript", *_ids(ids), "-j", str(jobs)], True),
+    "search": Benchmark(lambda ids, jobs: ["search", "-k", "节目"], False),
+    "subscriptions": Benchmark(lambda ids, jobs: ["subscriptions"], False),
+}
+
+
+class Result(NamedTuple):
+    command: str
+    seconds: float
+    episodes: int
+    episodes_per_second: Optional[float]
+    megabytes: float
+    megabytes_per_second: float
+    api_calls: int
+    peak_rss_mb: Optional[float]
+    exit_code: int
+
+
+def run_command(server: MockVistopia, name: str, jobs: int = 4,
+                extra_args: Sequence[str] = ()) -> Result:
+    """Run one benchmark command in a subprocess and measure it."""
+
+    benchmark = COMMANDS[name]
+    ids = list(range(1, server.settings.shows + 1))
+    env = dict(
+        os.environ,
+        VISTOPIA_API_BASE_URL=server.base_url,
+        VISTOPIA_API_TOKEN="benchmark",
+        PYTHONPATH=os.pathsep.join(
+            filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+    )
+    args = [
+        sys.executable, "-m", "vistopia.main", "-v", "WARNING", "--no-cache",
+        *extra_args, *benchmark.args(ids, jobs),
+    ]
+
+    server.reset()
+    with tempfile.TemporaryDirectory() as workdir, \
+            tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            args, cwd=workdir, env=env,
+            stdout=subprocess.DEVNULL, stderr=stderr,
+        )
+        code, peak_rss = _wait(process)
+        seconds = time.perf_counter() - start
+        if code != 0:
+            stderr.seek(0)
+            sys.stderr.write(stderr.read().decode(errors="replace"))
+
+    episodes = server.settings.shows * server.settings.episodes \
+        if benchmark.episodes else 0
+    received = server.bytes_sent["media"] + server.bytes_sent["article"]
+    megabytes = received / 1024 / 1024
+    return Result(
+        command=name,
+        seconds=round(seconds, 3),
+        episodes=episodes,
+        episodes_per_second=round(episodes / seconds, 1) if episodes else None,
+        megabytes=round(megabytes, 2),
+        megabytes_per_second=round(megabytes / seconds, 2),
+        api_calls=server.api_calls,
+        peak_rss_mb=peak_rss,
+        exit_code=code,
+    )
+
+
+def _wait(process: subprocess.Popen) -> Tuple[int, Optional[float]]:
+    """Wait for `process`; return its exit code and peak RSS in MB
+    (`None` where the platform cannot tell)."""
+
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+
+    _, status, usage = os.wait4(process.pid, 0)
+    if os.WIFEXITED(status):
+        process.returncode = os.WEXITSTATUS(status)
+    else:
+        process.returncode = -os.WTERMSIG(status)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return process.returncode, round(usage.ru_maxrss * scale / 1024 / 1024, 1)
+
+
+def run(settings: Settings, commands: Sequence[str], jobs: int = 4,
+        extra_args: Sequence[str] = ()) -> List[Result]:
+    with MockVistopia(settings) as server:
+        return [
+            run_command(server, name, jobs=jobs, extra_args=extra_args)
+            for name in commands
+        ]
+
+
+class ParseResult(NamedTuple):
+    mode: str
+    seconds: float
+    articles_per_second: float
+
+
+def compare_parsing(settings: Settings, repeat: int = 5) -> List[ParseResult]:
+    """Time parsing the mock catalogs with and without `fast_parse`.
+
+    Every article's download fields are read, as `save-show` does, and
+    the best of `repeat` rounds is reported for each mode.
+    """
+
+    from vistopia.models import Catalog, parse_model
+
+    with MockVistopia(settings) as server:
+        payloads = [server.catalog(show) for show in range(1, settings.shows + 1)]
+
+    results = []
+    for mode, fast in (("full", False), ("fast", True)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            articles = sum(
+                _read_download_fields(parse_model(Catalog, payload, fast=fast))
+                for payload in payloads
+            )
+            best = min(best, time.perf_counter() - start)
+        results.append(ParseResult(
+            mode, round(best, 4), round(articles / max(best, 1e-9), 1),
+        ))
+    return results
+
+
+def _read_download_fields(catalog) -> int:
+    fields = [
+        (article.article_id, article.title, article.media_key_full_url)
+        for part in catalog.catalog for article in part.part
+    ]
+    return len(fields)
+
+
+def _size(ctx, param, value):
+    try:
+        return parse_size(value) if value else None
+    except ValueError:
+        raise click.BadParameter(f"invalid size {value!r}")
+
+
+@click.command()
+@click.option(
+    "--command", "commands", type=click.Choice(list(COMMANDS)), multiple=True,
+    help="Command to benchmark (repeatable; default: all).",
+)
+@click.option("--shows", type=click.IntRange(min=1), default=2, help="Number of shows.")
+@click.option("--episodes", type=click.IntRange(min=1), default=50, help="Episodes per show.")
+@click.option("--part-size", type=click.IntRange(min=1), default=20, help="Episodes per catalog part.")
+@click.option("--media-size", callback=_size, default="256K", help="Size of each MP3 file.")
+@click.option("--transcript-size", callback=_size, default="16K", help="Size of each transcript page.")
+@click.option("--cover-size", callback=_size, default="32K", help="Size of each cover image.")
+@click.option("--page-size", type=click.IntRange(min=1), default=20, help="Items per search/subscriptions page.")
+@click.option("--latency", type=click.FLOAT, default=0.0, help="Seconds added to every response.")
+@click.option("--bandwidth", callback=_size, help="Bytes/second per response, e.g. 2M.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1), default=4, help="Parallel downloads.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Print results as JSON lines.")
+@click.option("--parse", "parse", is_flag=True, default=False,
+              help="Also compare full and fast parsing of the catalogs.")
+@click.argument("vistopian_args", nargs=-1)
+def main(commands, jobs, as_json, parse, vistopian_args, **argv):
+    """Benchmark vistopian against a local mock server.
+
+    Arguments after `--` are passed to vistopian before the command,
+    e.g. `-- --fast-parse`.
+    """
+
+    settings = Settings(
+        shows=argv.pop("shows"),
+        episodes=argv.pop("episodes"),
+        part_size=argv.pop("part_size"),
+        media_bytes=argv.pop("media_size"),
+        transcript_bytes=argv.pop("transcript_size"),
+        cover_bytes=argv.pop("cover_size"),
+        page_size=argv.pop("page_size"),
+        latency=argv.pop("latency"),
+        bandwidth=argv.pop("bandwidth"),
+    )
+    results = run(settings, commands or list(COMMANDS), jobs, vistopian_args)
+    parsing = compare_parsing(settings) if parse else []
+
+    if as_json:
+        for result in results:
+            click.echo(json.dumps(result._asdict()))
+        for parsed in parsing:
+            click.echo(json.dumps(parsed._asdict()))
+    else:
+        from tabulate import tabulate
+
+        click.echo(tabulate(
+            [result[:-1] for result in results],
+            headers=["Command", "Seconds", "Episodes", "Episodes/s", "MB",
+                     "MB/s", "API calls", "Peak RSS (MB)"],
+        ))
+        if parsing:
+            click.echo()
+            click.echo(tabulate(
+                parsing, headers=["Parsing", "Seconds", "Articles/s"],
+            ))
+    if any(result.exit_code for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import pytest
+
+MP3_PATH = Path(__file__).parent / "4" / "data" / "id3_removed.mp3"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    app: "LocalServer"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def do_GET(self):
+        self.server.app.handle(self)
+
+    def do_HEAD(self):
+        self.server.app.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """Tiny in-process HTTP server for offline tests.
+
+    `routes` maps a path to the response body (`bytes`, or anything
+    JSON-serializable) or to a callable taking the request handler and
+    returning `(status, headers, body)`.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.clients = set()
+        self._httpd = _Server(("127.0.0.1", 0), _Handler)
+        self._httpd.app = self
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True
+        )
+
+    def url(self, path: str = "/") -> str:
+        return f"http://127.0.0.1:{self._httpd.server_port}{path}"
+
+    def api(self, uri: str, data) -> None:
+        self.routes["/api/v1/" + uri] = {"status": "success", "data": data}
+
+    def file(self, path: str, body: bytes, truncate_once: bool = False,
+             etag=None) -> None:
+        """Serve `body` at `path`, honouring `Range` requests.
+
+        With `truncate_once`, the first response is cut off halfway
+        through, as if the connection dropped. With `etag`, it is sent
+        along, and a `Range` whose `If-Range` does not match is ignored.
+        """
+        state = {"truncate": truncate_once}
+
+        def route(handler):
+            start = 0
+            range_header = handler.headers.get("Range")
+            if_range = handler.headers.get("If-Range")
+            if if_range is not None and if_range != etag:
+                range_header = None
+            if range_header:
+                start = int(range_header.split("=")[1].split("-")[0])
+                if start >= len(body):
+                    return 416, {"Content-Range": f"bytes */{len(body)}"}, b""
+            chunk = body[start:]
+            headers = {"Content-Length": str(len(chunk))}
+            if etag:
+                headers["ETag"] = etag
+            if range_header:
+                headers["Content-Range"] = \
+                    f"bytes {start}-{len(body) - 1}/{len(body)}"
+            if state["truncate"]:
+                state["truncate"] = False
+                handler.close_connection = True
+                chunk = chunk[:len(chunk) // 2]
+            return 206 if range_header else 200, headers, chunk
+
+        self.routes[path] = route
+
+    def handle(self, handler: BaseHTTPRequestHandler) -> None:
+        path = urlsplit(handler.path).path
+        self.requests.append((handler.command, handler.path, dict(handler.headers)))
+        self.clients.add(handler.client_address)
+
+        route = self.routes.get(path)
+        if route is None:
+            status, headers, body = 404, {}, b"not found"
+        elif callable(route):
+            status, headers, body = route(handler)
+        elif isinstance(route, bytes):
+            status, headers, body = 200, {}, route
+        else:
+            status, headers, body = 200, {"Content-Type": "application/json"}, \
+                json.dumps(route).encode()
+
+        handler.send_response(status)
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        if "Content-Length" not in headers:
+            handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(body)
+
+    def paths(self):
+        return [urlsplit(path).path for _, path, _ in self.requests]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def http_server():
+    with LocalServer() as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def mp3() -> bytes:
+    """A short MP3 file without ID3 tags."""
+    return MP3_PATH.read_bytes()
+
+
+@pytest.fixture
+def catalog_payload():
+    """Factory of `content/catalog` payloads for "Show A" by "Author A".
+
+    `catalog_payload(count)` has one part, "Part One", holding episodes
+    1 to `count` with article ids 101, 102, ... Their media are at
+    `/{n}.mp3` on `server` (default: example.com); other keyword
+    arguments are added to the payload.
+    """
+
+    def make(count: int, server=None, **fields) -> dict:
+        def url(path: str) -> str:
+            return server.url(path) if server else f"https://example.com{path}"
+
+        return dict({
+            "author": "Author A",
+            "title": "Show A",
+            "type": "free",
+            "catalog": [{
+                "catalog_number": "01",
+                "catalog_title": "Part One",
+                "part": [
+                    {
+                        "article_id": str(100 + i),
+                        "sort_number": str(i),
+                        "title": f"Episode {i}",
+                        "duration_str": "1:00",
+                        "media_key_full_url": url(f"/{i}.mp3"),
+                        "content_url": url(f"/{i}.html"),
+                    }
+                    for i in range(1, count + 1)
+                ],
+            }],
+        }, **fields)
+
+    return make
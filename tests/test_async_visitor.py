@@ -0,0 +1,91 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from vistopia.async_visitor import AsyncVisitor
+from vistopia.models import Catalog
+from vistopia.ratelimit import TokenBucket
+from vistopia.visitor import Visitor
+
+
+def _catalog_route(state):
+    def route(handler):
+        with state["lock"]:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.05)
+        with state["lock"]:
+            state["active"] -= 1
+        id = urlsplit(handler.path).path.rsplit("/", 1)[1]
+        data = {"author": "A", "title": f"Show {id}", "type": "free", "catalog": []}
+        return 200, {}, json.dumps({"status": "success", "data": data}).encode()
+    return route
+
+
+def test_async_visitor_bounds_concurrency(http_server):
+    state: dict = {"active": 0, "peak": 0, "lock": threading.Lock()}
+    for id in range(12):
+        http_server.routes[f"/api/v1/content/catalog/{id}"] = _catalog_route(state)
+
+    async def crawl():
+        async with AsyncVisitor(
+            token="", concurrency=4, base_url=http_server.url("/api/v1/")
+        ) as visitor:
+            return await visitor.get_catalogs(range(12))
+
+    catalogs = asyncio.run(crawl())
+
+    assert all(isinstance(catalog, Catalog) for catalog in catalogs)
+    assert [catalog.title for catalog in catalogs] == [f"Show {id}" for id in range(12)]
+    assert 1 < state["peak"] <= 4
+
+
+def test_async_visitor_fetches_all_search_pages(http_server):
+    def search(handler):
+        page = int(parse_qs(urlsplit(handler.path).query).get("page", ["1"])[0])
+        data = {
+            "current_page": page,
+            "last_page": 3,
+            "data": [{
+                "id": page, "author": "A", "title": f"T{page}",
+                "share_desc": "", "data_type": "content",
+            }],
+        }
+        return 200, {}, json.dumps({"status": "success", "data": data}).encode()
+
+    http_server.routes["/api/v1/search/web"] = search
+
+    async def run():
+        async with AsyncVisitor(token="", base_url=http_server.url("/api/v1/")) as visitor:
+            return await visitor.search("八分")
+
+    assert [item.id for item in asyncio.run(run())] == [1, 2, 3]
+
+
+def test_async_visitor_rejects_options_for_a_given_visitor():
+    visitor = Visitor(token="")
+    assert AsyncVisitor(visitor=visitor).visitor is visitor
+    with pytest.raises(ValueError):
+        AsyncVisitor(visitor=visitor, rate=5)
+    with pytest.raises(ValueError):
+        AsyncVisitor(visitor=visitor, timeout=5)
+
+
+def test_token_bucket_spaces_out_requests():
+    bucket = TokenBucket(rate=20, burst=1)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*[bucket.acquire_async() for _ in range(5)])
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 4 / 20 * 0.9
+
+
+def test_token_bucket_unlimited():
+    bucket = TokenBucket(rate=None)
+    assert [bucket.reserve() for _ in range(100)] == [0.0] * 100
@@ -0,0 +1,56 @@
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+TESTS_DIR = Path(__file__).parent
+sys.path.insert(0, str(TESTS_DIR.parent))
+from benchmarks.mock_api import MockVistopia, Settings
+from benchmarks.run import compare_parsing, run
+
+
+def test_mock_api_serves_ranges_with_latency_and_bandwidth():
+    settings = Settings(shows=1, episodes=3, media_bytes=64 * 1024,
+                        latency=0.05, bandwidth=256 * 1024)
+    with MockVistopia(settings) as server:
+        catalog = requests.get(server.base_url + "content/catalog/1").json()["data"]
+        url = catalog["catalog"][0]["part"][2]["media_key_full_url"]
+
+        start = time.monotonic()
+        response = requests.get(url, headers={"Range": "bytes=10-"})
+        elapsed = time.monotonic() - start
+
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == "bytes 10-65468/65469"
+        assert response.content[:2] == bytes(2)
+        # 50 ms of latency, then about 250 ms to send 64 KB at 256 KB/s.
+        assert elapsed > 0.25
+        assert server.calls == {"api": 1, "media": 1}
+
+
+def test_benchmark_reports_every_command():
+    settings = Settings(shows=3, episodes=4, part_size=3, page_size=2,
+                        media_bytes=8 * 1024, transcript_bytes=1024)
+    results = {
+        result.command: result
+        for result in run(settings, ["save-show", "save-transcript",
+                                     "search", "subscriptions"])
+    }
+
+    assert all(result.exit_code == 0 for result in results.values())
+    assert results["save-show"].episodes == 12
+    assert results["save-show"].megabytes > 0
+    assert results["save-show"].api_calls == 6
+    assert results["save-transcript"].api_calls == 3
+    assert results["search"].api_calls == 2
+    assert results["subscriptions"].api_calls == 2
+    assert results["search"].episodes_per_second is None
+    assert all(result.peak_rss_mb for result in results.values())
+
+
+def test_benchmark_compares_fast_and_full_parsing():
+    results = compare_parsing(Settings(shows=2, episodes=30, part_size=7), repeat=2)
+
+    assert [result.mode for result in results] == ["full", "fast"]
+    assert all(result.seconds > 0 and result.articles_per_second > 0 for result in results)
@@ -0,0 +1,146 @@
+import os
+import time
+
+from vistopia.cache import ResponseCache
+from vistopia.visitor import Visitor
+
+
+def test_cache_roundtrip_and_ttl(tmp_path):
+    cache = ResponseCache(tmp_path, ttls={"content/catalog/": 60})
+    params = {"api_token": "secret"}
+
+    assert cache.get("content/catalog/1", params) is None
+    cache.put("content/catalog/1", params, {"title": "八分"}, etag='"v1"')
+
+    entry = cache.get("content/catalog/1", params)
+    assert entry is not None
+    assert entry.data == {"title": "八分"}
+    assert entry.fresh
+    assert entry.validators() == {"If-None-Match": '"v1"'}
+
+    # A different account must not see the entry.
+    assert cache.get("content/catalog/1", {"api_token": "other"}) is None
+
+    cache.expire("content/catalog/1")
+    entry = cache.get("content/catalog/1", params)
+    assert entry is not None and not entry.fresh
+    assert entry.validators() == {"If-None-Match": '"v1"'}
+
+
+def test_cache_ignores_uncached_endpoints(tmp_path):
+    cache = ResponseCache(tmp_path, ttls={"content/catalog/": 60})
+    cache.put("user/subscriptions-list", {}, [1, 2, 3])
+    assert cache.get("user/subscriptions-list", {}) is None
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, ttls={"": 60}, max_bytes=300)
+    payload = os.urandom(100).hex()
+
+    cache.put("a", {}, payload)
+    time.sleep(0.01)
+    cache.put("b", {}, payload)
+    time.sleep(0.01)
+    assert cache.get("a", {}) is not None
+    time.sleep(0.01)
+    cache.put("c", {}, payload)
+
+    assert cache.get("a", {}) is not None
+    assert cache.get("b", {}) is None
+    assert cache.get("c", {}) is not None
+
+
+def test_visitor_uses_persistent_cache(http_server, tmp_path):
+    http_server.api("content/catalog/1", {"title": "A"})
+    base_url = http_server.url("/api/v1/")
+
+    for _ in range(2):
+        visitor = Visitor(
+            token="", base_url=base_url, cache=ResponseCache(tmp_path)
+        )
+        assert visitor.get_api_response("content/catalog/1") == {"title": "A"}
+
+    assert http_server.paths() == ["/api/v1/content/catalog/1"]
+
+
+def test_visitor_revalidates_stale_entries(http_server, tmp_path):
+    def catalog(handler):
+        if handler.headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        body = b'{"status": "success", "data": {"title": "A"}}'
+        return 200, {"ETag": '"v1"'}, body
+
+    http_server.routes["/api/v1/content/catalog/1"] = catalog
+    cache = ResponseCache(tmp_path, ttls={"content/catalog/": 0})
+    visitor = Visitor(
+        token="", base_url=http_server.url("/api/v1/"), cache=cache
+    )
+
+    assert visitor.get_api_response("content/catalog/1") == {"title": "A"}
+    assert visitor.get_api_response("content/catalog/1") == {"title": "A"}
+
+    assert len(http_server.requests) == 2
+    assert http_server.requests[1][2]["If-None-Match"] == '"v1"'
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 16
+
+
+def _fetch_logged(log_path, url):
+    with open(log_path, "a") as fp:
+        fp.write(url + "\n")
+    time.sleep(0.05)
+    return PNG
+
+
+def _get_cover_in_process(cache_dir, log_path):
+    from functools import partial
+    from vistopia.cache import CoverCache
+
+    cover = CoverCache(cache_dir).get(
+        "http://example.com/c.png", partial(_fetch_logged, log_path)
+    )
+    return cover.mime
+
+
+def test_cover_cache_fetches_once_across_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+    from vistopia.cache import CoverCache
+
+    log = tmp_path / "fetches.log"
+    cache = CoverCache()
+    fetch = partial(_fetch_logged, log)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        covers = list(executor.map(
+            lambda _: cache.get("http://example.com/c.png", fetch), range(8)
+        ))
+
+    assert {cover.mime for cover in covers} == {"image/png"}
+    assert log.read_text().splitlines() == ["http://example.com/c.png"]
+
+
+def test_cover_cache_is_shared_across_processes(tmp_path):
+    from concurrent.futures import ProcessPoolExecutor
+
+    log = tmp_path / "fetches.log"
+    cache_dir = tmp_path / "covers"
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        mimes = list(executor.map(
+            _get_cover_in_process, [cache_dir] * 4, [log] * 4
+        ))
+
+    assert mimes == ["image/png"] * 4
+    assert len(log.read_text().splitlines()) == 1
+
+
+def test_cover_cache_dedupes_identical_images(tmp_path):
+    from vistopia.cache import CoverCache
+
+    cache = CoverCache(tmp_path)
+    cache.get("http://example.com/a.png", lambda url: PNG)
+    cache.get("http://example.com/b.png", lambda url: PNG)
+
+    assert len(list((tmp_path / "blobs").iterdir())) == 1
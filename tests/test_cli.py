@@ -1,6 +1,7 @@
 import sys
 from pathlib import Path
 import click.testing
+import pytest
 
 TESTS_DIR = Path(__file__).parent
 sys.path.insert(0, str(TESTS_DIR.parent))
@@ -37,4 +38,187 @@ def test_cli_version(
     ])
 
     assert result.exit_code == 0
-    assert len(result.stdout.strip().split(".")) == 3
\ No newline at end of file
+    assert len(result.stdout.strip().split(".")) == 3
+
+
+def _serve_show(server, id, episodes):
+    server.api(f"content/catalog/{id}", {
+        "author": "A", "title": f"Show {id}", "type": "free",
+        "catalog": [{"part": [
+            {
+                "article_id": f"{id}{i}", "sort_number": str(i),
+                "title": f"Episode {i}", "duration_str": "1:00",
+                "media_key_full_url": server.url(f"/{id}/{i}.mp3"),
+            }
+            for i in range(1, episodes + 1)
+        ]}],
+    })
+    server.api(f"content/content-show/{id}", {"author": "A", "title": f"Show {id}"})
+    for i in range(1, episodes + 1):
+        server.routes[f"/{id}/{i}.mp3"] = b"\0" * 128
+
+
+def test_cli_save_show_many_ids(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    _serve_show(http_server, 2, 3)
+    http_server.api("user/subscriptions-list", {
+        "data": [{"content_id": 2, "title": "Show 2"}, {"content_id": 3, "title": "Show 3"}],
+    })
+    _serve_show(http_server, 3, 1)
+
+    result = cli_runner.invoke(main, [
+        "--no-cache", "save-show", "--id", "1", "--all-subscriptions",
+        "--no-tag", "-j", "4",
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert sorted(p.name for p in (tmp_path / "Show 2").iterdir()) == \
+        ["Episode 1.mp3", "Episode 2.mp3", "Episode 3.mp3"]
+    assert (tmp_path / "Show 1" / "Episode 2.mp3").exists()
+    assert (tmp_path / "Show 3" / "Episode 1.mp3").exists()
+    assert http_server.paths().count("/api/v1/content/catalog/2") == 1
+
+
+def test_cli_requires_a_content_id(cli_runner):
+    result = cli_runner.invoke(main, ["--no-cache", "show-content"])
+    assert result.exit_code == 2
+    assert "--all-subscriptions" in result.output
+
+
+@pytest.mark.parametrize("args, api_calls", [
+    (["show-content", "--id", "1"], 1),
+    (["save-show", "--id", "1", "--no-tag"], 2),
+    (["save-transcript", "--id", "1"], 1),
+    (["subscriptions"], 1),
+    (["search", "-k", "A"], 1),
+])
+def test_cli_api_calls_per_command(
+    cli_runner, http_server, tmp_path, monkeypatch, args, api_calls
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    http_server.api("user/subscriptions-list", {
+        "data": [{"content_id": 1, "title": "Show 1"}],
+    })
+    http_server.api("search/web", {"data": [{
+        "id": 1, "author": "A", "title": "Show 1", "share_desc": "",
+        "data_type": "content",
+    }]})
+
+    result = cli_runner.invoke(main, ["--no-cache"] + args)
+
+    assert result.exit_code == 0, result.output
+    calls = [path for path in http_server.paths() if path.startswith("/api/")]
+    assert len(calls) == api_calls, calls
+
+
+def test_cli_local_search(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    cache_dir = str(tmp_path / "cache")
+
+    assert cli_runner.invoke(main, ["--cache-dir", cache_dir, "show-content", "--id", "1"]).exit_code == 0
+    result = cli_runner.invoke(main, ["--cache-dir", cache_dir, "index"])
+    assert result.exit_code == 0, result.output
+    assert "Indexed 3 documents" in result.output
+
+    requests = len(http_server.requests)
+    result = cli_runner.invoke(main, ["--cache-dir", cache_dir, "search", "--local", "-k", "Episode 2"])
+    assert result.exit_code == 0, result.output
+    assert "12" in result.output and "Episode 2" in result.output
+    assert len(http_server.requests) == requests
+
+    result = cli_runner.invoke(main, ["--no-cache", "search", "--local", "-k", "Episode"])
+    assert result.exit_code == 2
+
+
+def test_cli_verify_dry_run_reports_bad_files(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+
+    assert cli_runner.invoke(main, ["--no-cache", "save-show", "--id", "1", "--no-tag"]).exit_code == 0
+    result = cli_runner.invoke(main, ["--no-cache", "verify", "--id", "1", "--dry-run", "-j", "1"])
+
+    assert result.exit_code == 1
+    assert "no MPEG audio frames found" in result.output
+    assert "2 files checked, 2 bad" in result.output
+
+
+def test_cli_sync_dry_run_survives_failed_size_checks(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    del http_server.routes["/1/2.mp3"]
+
+    result = cli_runner.invoke(main, ["--no-cache", "sync", "--id", "1", "--dry-run"])
+
+    assert result.exit_code == 0, result.output
+    assert "2 articles, 0.0 MB to download" in result.output
+
+
+def test_cli_save_show_exits_non_zero_on_failures(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    del http_server.routes["/1/2.mp3"]
+
+    result = cli_runner.invoke(main, [
+        "--no-cache", "save-show", "--id", "1", "--no-tag",
+    ])
+
+    assert result.exit_code == 1, result.output
+    assert (tmp_path / "Show 1" / "Episode 1.mp3").exists()
+
+
+def test_cli_sync_exits_non_zero_on_failures(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    del http_server.routes["/1/1.mp3"]
+
+    result = cli_runner.invoke(main, ["--no-cache", "sync", "--id", "1", "--no-tag"])
+
+    assert result.exit_code == 1, result.output
+    assert "1 failed" in result.output
+
+
+def test_cli_stats(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 2)
+    prom = tmp_path / "metrics.prom"
+
+    result = cli_runner.invoke(main, [
+        "--no-cache", "--stats", "--metrics-prom", str(prom),
+        "save-show", "--id", "1", "--no-tag",
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert "api.request" in result.output
+    assert "download.bytes: 256" in result.output
+    assert "vistopia_download_seconds_count 2" in prom.read_text()
+
+
+def test_cli_episode_selector(cli_runner, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("VISTOPIA_API_BASE_URL", http_server.url("/api/v1/"))
+    _serve_show(http_server, 1, 5)
+
+    result = cli_runner.invoke(main, [
+        "--no-cache", "save-show", "--id", "1", "--no-tag",
+        "--episode-id", "latest:2,1",
+    ])
+    assert result.exit_code == 0, result.output
+    assert sorted(p.name for p in (tmp_path / "Show 1").iterdir()) == \
+        ["Episode 1.mp3", "Episode 4.mp3", "Episode 5.mp3"]
+
+    result = cli_runner.invoke(main, [
+        "--no-cache", "save-show", "--id", "1", "--episode-id", "latest:x",
+    ])
+    assert result.exit_code == 2
+    assert "latest:x" in result.output
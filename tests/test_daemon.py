@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+
+import requests
+
+from vistopia.cache import ResponseCache
+from vistopia.daemon import Daemon
+from vistopia.manifest import MANIFEST_NAME
+from vistopia.visitor import Visitor
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def _start(daemon):
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    return thread
+
+
+def test_daemon_downloads_new_episodes(http_server, tmp_path, monkeypatch, mp3,
+                                       catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("user/subscriptions-list", {
+        "data": [{"content_id": 1, "title": "Show A"}],
+    })
+    http_server.api("content/catalog/1", catalog_payload(2, http_server))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    for i in range(1, 4):
+        http_server.file(f"/{i}.mp3", mp3)
+
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+    daemon = Daemon(visitor, interval=0.2, jitter=0, no_tag=True,
+                    status_address=("127.0.0.1", 0))
+    thread = _start(daemon)
+    try:
+        _wait_for(lambda: daemon.saved == 2)
+        http_server.api("content/catalog/1", catalog_payload(3, http_server))
+        _wait_for(lambda: daemon.saved == 3)
+
+        assert daemon.status_url is not None
+        status = requests.get(daemon.status_url).json()
+        assert requests.get(daemon.status_url[:-len("status")] + "nope").status_code == 404
+    finally:
+        daemon.stop()
+        thread.join()
+
+    assert sorted(p.name for p in (tmp_path / "Show A").glob("*.mp3")) == \
+        ["Episode 1.mp3", "Episode 2.mp3", "Episode 3.mp3"]
+    # Each file is downloaded once, however many polls saw it.
+    assert http_server.paths().count("/1.mp3") == 1
+    assert status["saved"] == 3 and status["pending"] == 0
+    assert [(show["content_id"], show["queued"]) for show in status["shows"]] == [(1, 3)]
+
+
+def test_daemon_keeps_polling_after_errors(http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"), retries=0)
+    daemon = Daemon(visitor, ids=[7], interval=0.1, jitter=0, status_address=None)
+    thread = _start(daemon)
+    try:
+        _wait_for(lambda: daemon.polls >= 2)
+    finally:
+        daemon.stop()
+        thread.join()
+
+    assert daemon.shows[7].error
+    assert daemon.status_url is None
+
+
+def test_daemon_resubscribed_show_is_scheduled_once(http_server):
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+    daemon = Daemon(visitor, interval=60, jitter=0, status_address=None)
+
+    for subscribed in ([1, 2], [2], [1, 2]):
+        http_server.api("user/subscriptions-list", {
+            "data": [{"content_id": id, "title": f"Show {id}"} for id in subscribed],
+        })
+        daemon.poll_subscriptions()
+
+    assert sorted(key for _, key in daemon._due) == [1, 2]
+    assert sorted(daemon.shows) == [1, 2]
+
+
+def test_stopped_daemon_skips_queued_batches(http_server, tmp_path, monkeypatch, mp3,
+                                             catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", catalog_payload(2, http_server))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    for i in range(1, 3):
+        http_server.file(f"/{i}.mp3", mp3)
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+    daemon = Daemon(visitor, ids=[1], no_tag=True, status_address=None)
+    daemon._watch(1)
+    daemon.poll_show(1)
+
+    daemon.stop()
+    daemon._queue.put(None)
+    daemon._work()
+
+    assert daemon.saved == 0 and daemon.wait_idle(0)
+    assert daemon.status()["pending"] == 0
+    assert "/1.mp3" not in http_server.paths()
+
+
+def test_batches_planned_before_earlier_ones_finish_share_the_manifest(
+        http_server, tmp_path, monkeypatch, mp3, catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", catalog_payload(2, http_server))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    for i in range(1, 4):
+        http_server.file(f"/{i}.mp3", mp3)
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+    daemon = Daemon(visitor, ids=[1], no_tag=True, status_address=None)
+    daemon._watch(1)
+
+    daemon.poll_show(1)
+    http_server.api("content/catalog/1", catalog_payload(3, http_server))
+    daemon.poll_show(1)
+    daemon._queue.put(None)
+    daemon._work()
+
+    assert daemon.saved == 3
+    manifest = json.loads((tmp_path / "Show A" / MANIFEST_NAME).read_text())
+    assert sorted(manifest["articles"]) == ["101", "102", "103"]
+
+
+def test_daemon_polls_bypass_fresh_cached_responses(http_server, tmp_path, monkeypatch, mp3,
+                                                    catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", catalog_payload(1, http_server))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    http_server.file("/1.mp3", mp3)
+    http_server.file("/2.mp3", mp3)
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"),
+                      cache=ResponseCache(tmp_path / "cache"))
+    daemon = Daemon(visitor, ids=[1], no_tag=True, status_address=None)
+    daemon._watch(1)
+
+    daemon.poll_show(1)
+    # Well within the catalog's time-to-live.
+    http_server.api("content/catalog/1", catalog_payload(2, http_server))
+    daemon.poll_show(1)
+
+    assert daemon.shows[1].queued == 2
+    assert http_server.paths().count("/api/v1/content/catalog/1") == 2
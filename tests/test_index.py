@@ -0,0 +1,75 @@
+from vistopia.cache import ResponseCache
+from vistopia.index import SearchIndex, cached_documents
+
+CATALOG = {
+    "author": "梁文道",
+    "title": "八分",
+    "type": "free",
+    "catalog": [{
+        "catalog_title": "第一季",
+        "part": [
+            {"article_id": "101", "sort_number": "1", "title": "开场白"},
+            {"article_id": "102", "sort_number": "2", "title": "读书与生活"},
+        ],
+    }],
+}
+
+
+def _cache(tmp_path):
+    cache = ResponseCache(tmp_path / "cache")
+    cache.put("content/catalog/11", {"api_token": "t"}, CATALOG)
+    cache.put("content/content-show/11", {"api_token": "t"}, {
+        "author": "梁文道", "title": "八分", "share_desc": "知识只求八分饱",
+    })
+    cache.put("content/content-show/12", {"api_token": "t"}, {
+        "author": "许子东", "title": "重读二十世纪中国小说",
+    })
+    return cache
+
+
+def test_cached_documents_include_saved_transcripts(tmp_path):
+    show_dir = tmp_path / "shows" / "八分"
+    show_dir.mkdir(parents=True)
+    (show_dir / "读书与生活.html").write_text(
+        "<html><head><script>var x;</script></head>"
+        "<body><p>我们今天谈谈蒙田的随笔。</p></body></html>"
+    )
+
+    documents = list(cached_documents(_cache(tmp_path), tmp_path / "shows"))
+
+    assert [(d.kind, d.content_id, d.article_id) for d in documents] == [
+        ("show", 11, None),
+        ("article", 11, "101"),
+        ("article", 11, "102"),
+        ("transcript", 11, "102"),
+        ("show", 12, None),
+    ]
+    assert documents[0].body == "梁文道 知识只求八分饱"
+    assert documents[3].body == "我们今天谈谈蒙田的随笔。"
+
+
+def test_search_index(tmp_path):
+    show_dir = tmp_path / "八分"
+    show_dir.mkdir()
+    (show_dir / "读书与生活.html").write_text("<p>我们今天谈谈蒙田的随笔。</p>")
+    index = SearchIndex(tmp_path / "cache")
+
+    assert index.rebuild(cached_documents(_cache(tmp_path), tmp_path)) == 5
+    assert len(index) == 5
+
+    hit, = index.search("蒙田的随笔")
+    assert (hit.kind, hit.content_id, hit.article_id) == ("transcript", 11, "102")
+    assert "[蒙田的随笔]" in hit.snippet
+
+    # Terms shorter than a trigram are matched by a substring scan.
+    hit, = index.search("蒙田")
+    assert hit.article_id == "102"
+    assert "[蒙田]" in hit.snippet
+
+    assert [hit.content_id for hit in index.search("二十世纪 小说")] == [12]
+    assert index.search("不存在的内容") == []
+    assert index.search('"') == []
+
+    # Rebuilding replaces the previous contents.
+    assert index.rebuild([]) == 0
+    assert index.search("蒙田") == []
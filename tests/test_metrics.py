@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+from vistopia.cache import ResponseCache
+from vistopia.metrics import Aggregate, Instrumentation, JSONLines
+from vistopia.visitor import Visitor
+
+
+def test_timer_records_failures_with_error_label():
+    aggregate = Aggregate()
+    metrics = Instrumentation([aggregate])
+
+    with metrics.timer("download"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timer("download"):
+            raise ValueError
+    metrics.count("download.bytes", 100)
+    metrics.count("download.bytes", 28)
+
+    (name, count, total, mean, peak), = aggregate.breakdown()
+    assert (name, count) == ("download", 2)
+    assert aggregate.totals() == {"download.bytes": 128}
+    assert ("download", (("error", "ValueError"),)) in aggregate.timings
+
+
+def test_prometheus_and_json_lines():
+    aggregate = Aggregate()
+    fp = io.StringIO()
+    metrics = Instrumentation([aggregate, JSONLines(fp)])
+
+    with metrics.timer("api.request", endpoint="content/catalog/{id}"):
+        pass
+    metrics.count("cache.hit", endpoint="search/web")
+    metrics.count("api.bytes", 123456789, endpoint="search/web")
+
+    text = aggregate.prometheus()
+    assert "# TYPE vistopia_api_request_seconds summary" in text
+    assert 'vistopia_api_request_seconds_count{endpoint="content/catalog/{id}"} 1' in text
+    assert 'vistopia_cache_hit_total{endpoint="search/web"} 1' in text
+    assert 'vistopia_api_bytes_total{endpoint="search/web"} 123456789' in text
+
+    events = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert [(e["name"], e["kind"]) for e in events] == [
+        ("api.request", "timing"), ("cache.hit", "counter"), ("api.bytes", "counter"),
+    ]
+
+
+def test_visitor_reports_requests_and_cache_hits(http_server, tmp_path):
+    http_server.api("content/catalog/1", {"author": "", "title": "A", "type": "", "catalog": []})
+    http_server.api("content/catalog/2", {"author": "", "title": "B", "type": "", "catalog": []})
+    aggregate = Aggregate()
+
+    for _ in range(2):
+        visitor = Visitor(
+            token="", base_url=http_server.url("/api/v1/"),
+            cache=ResponseCache(tmp_path),
+            metrics=Instrumentation([aggregate]),
+        )
+        visitor.get_catalog(1)
+        visitor.get_catalog(2)
+
+    assert aggregate.totals()["cache.miss"] == 2
+    assert aggregate.totals()["cache.hit"] == 2
+    operations = {row[0]: row[1] for row in aggregate.breakdown()}
+    assert operations["api.request"] == 2
+    assert operations["api.parse"] == 2
+    assert operations["validate"] == 4
+    assert ("api.request", (("endpoint", "content/catalog/{id}"),)) \
+        in aggregate.timings
@@ -10,6 +10,11 @@ from vistopia.models import (
     SearchResult,
     SubscriptionItem,
     SubscriptionsList,
+    LeanArticle,
+    LeanCatalog,
+    LeanSearchResult,
+    dump_model,
+    parse_model,
     validate_model,
 )
 
@@ -92,3 +97,115 @@ def test_search_result_coerces_numeric_id_from_string():
 def test_catalog_model_raises_on_missing_required_fields():
     with pytest.raises(ValidationError):
         validate_model(Catalog, {"title": "missing-author-and-catalog"})
+
+
+def _wide_article(i):
+    # Shaped like a recorded `content/catalog/{id}` article.
+    return {
+        "article_id": str(1000 + i), "catalog_id": 1, "comment_count": 3,
+        "content_id": 11, "content_media_type_en": "audio",
+        "content_url": f"https://example.com/article/{i}", "duration": "600",
+        "sort_number": str(i), "title": f"Episode {i}", "duration_str": "10:00",
+        "is_finished": False, "is_listened": i % 2 == 0, "is_trial": False,
+        "listen_percent": 30, "listen_time": 12,
+        "media_files": [{"bitrate": 64, "url": f"https://example.com/{i}.m4a"}],
+        "media_key": f"{i}.mp3",
+        "media_key_full_url": f"https://example.com/{i}.mp3",
+        "media_type": "audio", "media_type_en": "audio",
+        "optional_media_key_full_url": None, "sample_media_full_url": None,
+        "sample_media_key": None, "sample_vid": None,
+        "share_desc": "节目简介" * 20, "share_url": f"https://example.com/s/{i}",
+        "status": "1", "type": "free", "vid": None, "video_poster": None,
+    }
+
+
+def _wide_catalog(parts, per_part):
+    return {
+        "author": "Author A",
+        "title": "Show A",
+        "type": "free",
+        "background_img": "https://example.com/cover.jpg",
+        "catalog": [
+            {
+                "catalog_number": str(p),
+                "catalog_title": f"Part {p}",
+                "part": [_wide_article(p * per_part + i) for i in range(per_part)],
+            }
+            for p in range(parts)
+        ],
+    }
+
+
+def test_fast_parse_extracts_hot_fields():
+    catalog = parse_model(Catalog, _wide_catalog(2, 3), fast=True)
+
+    assert isinstance(catalog, LeanCatalog)
+    assert catalog.title == "Show A"
+    article = catalog.catalog[1].part[0]
+    assert isinstance(article, LeanArticle)
+    assert (article.article_id, article.sort_number, article.title) == ("1003", "3", "Episode 3")
+    assert article.media_key_full_url == "https://example.com/3.mp3"
+    assert article.content_url == "https://example.com/article/3"
+    assert article.is_listened is False
+    assert article._full is None
+
+
+def test_fast_parse_validates_fully_on_other_fields():
+    article = parse_model(Article, _wide_article(1), fast=True)
+
+    assert article.listen_percent == 30
+    assert isinstance(article._full, Article)
+    assert dump_model(article) == dump_model(validate_model(Article, _wide_article(1)))
+
+    invalid = parse_model(Article, dict(_wide_article(2), listen_percent="lots"), fast=True)
+    assert invalid.title == "Episode 2"
+    with pytest.raises(ValidationError):
+        invalid.listen_percent
+
+
+def test_fast_parse_requires_hot_fields():
+    with pytest.raises(ValueError):
+        parse_model(Catalog, {"title": "missing-author-and-catalog"}, fast=True)
+
+
+def test_fast_parse_search_result():
+    page = parse_model(SearchResult, {
+        "current_page": "1", "last_page": 2, "next_page_url": None,
+        "data": [{"id": "11", "author": "梁文道", "title": "八分",
+                  "share_desc": "知识只求八分饱", "data_type": "content"}],
+    }, fast=True)
+
+    assert isinstance(page, LeanSearchResult)
+    assert (page.current_page, page.last_page) == (1, 2)
+    item = page.data[0]
+    assert (item.id, item.subtitle, item.author, item.share_desc, item.data_type) == \
+        (11, None, "梁文道", "知识只求八分饱", "content")
+    # Every column `vistopian search` shows is read without a full parse.
+    assert item._full is None
+
+
+def test_fast_parse_does_not_validate_hot_paths(monkeypatch):
+    import vistopia.models
+
+    validated = []
+    validate = vistopia.models.validate_model
+
+    def counting_validate(model_cls, payload):
+        validated.append(model_cls)
+        return validate(model_cls, payload)
+
+    monkeypatch.setattr(vistopia.models, "validate_model", counting_validate)
+    payload = _wide_catalog(parts=10, per_part=300)
+
+    catalog = parse_model(Catalog, payload, fast=True)
+    fields = [
+        (article.article_id, article.sort_number, article.title,
+         article.media_key_full_url, article.content_url)
+        for part in catalog.catalog for article in part.part
+    ]
+    assert len(fields) == 3000 and (catalog.title, catalog.author) == ("Show A", "Author A")
+    # Downloads and tags read no field that needs the full validation.
+    assert validated == []
+
+    parse_model(Catalog, payload)
+    assert validated == [Catalog]
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from functools import partial
+
+from vistopia.scheduler import AUDIO, TRANSCRIPT, PriorityGate, Scheduler, Task
+from vistopia.visitor import Visitor
+
+
+def test_priority_gate_admits_best_priority_first():
+    gate = PriorityGate(1)
+    gate.acquire()
+    order = []
+
+    def _wait(priority):
+        gate.acquire(priority)
+        order.append(priority)
+        gate.release()
+
+    threads = [threading.Thread(target=_wait, args=(p,)) for p in [(1, 3), (0, 9), (1, 1)]]
+    for thread in threads:
+        thread.start()
+    while gate.waiting < 3:
+        time.sleep(0.01)
+    gate.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == [(0, 9), (1, 1), (1, 3)]
+
+
+def test_run_starts_tasks_by_priority():
+    scheduler = Scheduler(newest_first=True)
+    order: list = []
+
+    tasks = [
+        Task(f"{kind} {number}", partial(order.append, number),
+             scheduler.priority(kind, number))
+        for kind, number in [(AUDIO, "1"), (AUDIO, "3"), (TRANSCRIPT, "2"), (AUDIO, "2")]
+    ]
+    stats = scheduler.run(tasks, jobs=1)
+
+    assert order == ["2", "3", "2", "1"]
+    assert (stats.total, stats.skipped) == (4, 4)
+
+
+def test_run_accepts_generators_and_counts_failures():
+    def _fail():
+        raise ValueError("boom")
+
+    stats = Scheduler().run((task for task in [Task("ok", lambda: 10), Task("bad", _fail)]), jobs=2)
+
+    assert (stats.total, stats.saved, stats.failed, stats.bytes) == (2, 1, 1, 10)
+
+
+def test_bandwidth_cap_is_shared_by_downloads(http_server, tmp_path):
+    for i in range(3):
+        http_server.file(f"/{i}.mp3", b"\0" * 100_000)
+    visitor = Visitor(token="", scheduler=Scheduler(bandwidth=200_000))
+
+    started = time.monotonic()
+    stats = visitor.scheduler.run([
+        Task(str(i), partial(visitor.download, http_server.url(f"/{i}.mp3"), tmp_path / f"{i}.mp3"))
+        for i in range(3)
+    ], jobs=3)
+
+    assert stats.bytes == 300_000
+    # The first 200 kB are the burst; the rest is paced at 200 kB/s.
+    assert time.monotonic() - started >= 0.45
+
+
+def test_per_host_connection_limit(http_server, tmp_path, caplog):
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def slow(handler):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.1)
+        with lock:
+            active.pop()
+        return 200, {}, b"\0" * 10
+
+    http_server.routes["/slow.mp3"] = slow
+    visitor = Visitor(token="", scheduler=Scheduler(per_host=2, report_interval=0.05))
+
+    with caplog.at_level(logging.INFO, logger="vistopia.scheduler"):
+        stats = visitor.scheduler.run([
+            Task(str(i), partial(visitor.download, http_server.url("/slow.mp3"), tmp_path / f"{i}.mp3"))
+            for i in range(6)
+        ], jobs=6)
+
+    assert stats.saved == 6
+    assert max(peak) == 2
+    assert "waiting for a connection" in caplog.text
+    assert visitor.scheduler.status().active == 0
+
+
+def test_status_without_reset_keeps_the_throughput_window():
+    scheduler = Scheduler()
+    scheduler.throttle(1000)
+
+    assert scheduler.status(reset=False).rate > 0
+    assert scheduler.status(reset=False).rate > 0
+    assert scheduler.status().rate > 0
+    assert scheduler.status().rate == 0
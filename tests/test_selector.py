@@ -0,0 +1,76 @@
+import pytest
+
+from vistopia.models import Catalog, parse_model
+from vistopia.selector import as_selector, compile_selector
+
+
+def _catalog_data():
+    def article(n, listened=False):
+        return {
+            "article_id": f"a{n}", "sort_number": str(n), "title": f"E{n}",
+            "duration_str": "1:00", "is_listened": listened,
+        }
+
+    return {
+        "author": "A", "title": "Show", "type": "free",
+        "catalog": [
+            {"catalog_number": "1", "catalog_title": "上",
+             "part": [article(n, n <= 2) for n in range(1, 5)]},
+            {"catalog_number": "2", "catalog_title": "下",
+             "part": [article(n) for n in range(5, 9)] + [
+                 dict(article(0), sort_number="番外", article_id="extra"),
+             ]},
+        ],
+    }
+
+
+@pytest.fixture(params=[False, True], ids=["full", "lean"])
+def catalog(request):
+    return parse_model(Catalog, _catalog_data(), fast=request.param)
+
+
+@pytest.mark.parametrize("text, numbers", [
+    ("1-3,6", ["1", "2", "3", "6"]),
+    ("6-", ["6", "7", "8"]),
+    ("-2", ["1", "2"]),
+    ("latest:2", ["7", "8"]),
+    ("first:1,latest:1", ["1", "8"]),
+    ("part:2", ["5", "6", "7", "8", "番外"]),
+    ("part:上+not:1", ["2", "3", "4"]),
+    ("id:extra", ["番外"]),
+    ("unlistened+-4", ["3", "4"]),
+    ("listened", ["1", "2"]),
+    ("1-,not:5", ["1", "2", "3", "4", "6", "7", "8"]),
+    ("not:part:上,not:id:extra", ["5", "6", "7", "8"]),
+])
+def test_select(catalog, text, numbers):
+    assert [a.sort_number for a in catalog.select(text)] == numbers
+
+
+def test_catalog_lookups(catalog):
+    assert catalog.by_sort_number(6).article_id == "a6"
+    assert catalog.article("a3").sort_number == "3"
+    assert catalog.part_of("extra").catalog_title == "下"
+    assert len(catalog.select()) == 9
+    assert [a.sort_number for a in catalog.select({8, 1})] == ["1", "8"]
+    assert catalog.index() is catalog.index()
+
+
+def test_streamable_selectors():
+    assert compile_selector("150-,id:3+unlistened").streamable
+    assert not compile_selector("1,latest:5").streamable
+    with pytest.raises(ValueError):
+        compile_selector("part:1").predicate()
+
+
+@pytest.mark.parametrize("text", ["", "a-b", "3-1", "latest:", "part:", "foo"])
+def test_invalid_selectors(text):
+    with pytest.raises(ValueError):
+        compile_selector(text)
+
+
+def test_as_selector_keeps_old_episode_sets():
+    assert as_selector(None) is None
+    assert repr(as_selector({2, 10})) == "Selector('2,10')"
+    selector = compile_selector("3")
+    assert as_selector(selector) is selector
@@ -0,0 +1,99 @@
+import http.client
+from pathlib import Path
+
+import pytest
+import requests
+
+from vistopia.server import LibraryServer
+from vistopia.visitor import Visitor
+
+
+@pytest.fixture
+def upstream(http_server, tmp_path, monkeypatch, mp3, catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", catalog_payload(
+        2, http_server, background_img=http_server.url("/cover.jpg"),
+    ))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    http_server.routes["/cover.jpg"] = b"\xff\xd8\xff\xe0cover"
+    for i in range(1, 3):
+        http_server.file(f"/{i}.mp3", mp3)
+    return http_server
+
+
+@pytest.fixture
+def library(upstream):
+    visitor = Visitor(token="", base_url=upstream.url("/api/v1/"))
+    with LibraryServer(visitor, port=0, no_tag=True) as server:
+        yield server
+
+
+def test_serve_rewrites_catalogs_to_point_at_the_library(upstream, library, mp3):
+    client = Visitor(token="", base_url=library.url("/api/v1/"))
+    catalog = client.get_catalog(1)
+    article = catalog.catalog[0].part[0]
+    assert article.media_key_full_url == library.url("/media/1/101.mp3")
+    assert catalog.background_img == library.url("/covers/1")
+    assert client.get_content_show(1).author == "Author A"
+
+    assert client.download(article.media_key_full_url, "copy.mp3") == len(mp3)
+    assert Path("copy.mp3").read_bytes() == mp3
+    assert requests.get(catalog.background_img).content == b"\xff\xd8\xff\xe0cover"
+
+    response = requests.get(library.url("/api/v1/user/subscriptions-list"))
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("path", [
+    "/api/v1/content/content-show/../../user/subscriptions-list",
+    "/api/v1/content/catalog/1/../../../user/subscriptions-list",
+    "/api/v1/search/web/%2e%2e/%2e%2e/user/subscriptions-list",
+    "/api/v1/user/subscriptions-list",
+])
+def test_serve_only_proxies_shared_endpoints(upstream, library, path):
+    upstream.api("user/subscriptions-list", {"data": [{"content_id": 1, "title": "Private"}]})
+    # http.client sends the path as is; requests would resolve the dots.
+    connection = http.client.HTTPConnection(library.host, int(library.url("").rsplit(":", 1)[1]))
+    connection.request("GET", path)
+    response = connection.getresponse()
+    assert response.status == 404
+    assert b"Private" not in response.read()
+    connection.close()
+    assert "/api/v1/user/subscriptions-list" not in upstream.paths()
+
+
+def test_serve_fetches_through_once_and_honours_ranges(upstream, library, tmp_path, mp3):
+    url = library.url("/media/1/102.mp3")
+
+    response = requests.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(mp3)}"
+    assert response.content == mp3[10:20]
+    assert (tmp_path / "Show A" / "Episode 2.mp3").exists()
+
+    response = requests.get(url)
+    assert response.status_code == 200 and response.content == mp3
+    etag = response.headers["ETag"]
+    assert upstream.paths().count("/2.mp3") == 1
+
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert requests.get(url, headers={
+        "If-Modified-Since": response.headers["Last-Modified"],
+    }).status_code == 304
+    # A stale If-Range gets the whole file instead of the range.
+    response = requests.get(url, headers={"Range": "bytes=0-0", "If-Range": '"old"'})
+    assert response.status_code == 200 and len(response.content) == len(mp3)
+    response = requests.get(url, headers={"Range": f"bytes={len(mp3)}-"})
+    assert response.status_code == 416
+
+    shows = requests.get(library.url("/library")).json()["shows"]
+    assert [(show["title"], [a["article_id"] for a in show["articles"]])
+            for show in shows] == [("Show A", ["102"])]
+
+
+def test_serve_without_fetching(upstream, tmp_path):
+    visitor = Visitor(token="", base_url=upstream.url("/api/v1/"))
+    with LibraryServer(visitor, port=0, fetch=False) as server:
+        assert requests.get(server.url("/media/1/101.mp3")).status_code == 404
+        assert requests.get(server.url("/media/1/999.mp3")).status_code == 404
+    assert not (tmp_path / "Show A").exists()
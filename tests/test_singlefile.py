@@ -0,0 +1,113 @@
+import stat
+import sys
+import time
+
+import pytest
+
+from vistopia.singlefile import failure_report, run_command, run_commands
+from vistopia.visitor import Visitor
+
+STUB = """\
+import sys, time
+from pathlib import Path
+
+url, output = sys.argv[1], Path(sys.argv[2])
+marker = output.with_suffix(".attempted")
+if "fail" in url:
+    sys.stderr.write("cannot load " + url + "\\n")
+    sys.exit(2)
+if "flaky" in url and not marker.exists():
+    marker.write_text("")
+    sys.exit(1)
+if "slow" in url:
+    time.sleep(5)
+time.sleep(0.3)
+output.write_text("<html>" + url + "</html>")
+"""
+
+
+@pytest.fixture
+def single_file(tmp_path):
+    script = tmp_path / "single-file"
+    script.write_text(f"#!{sys.executable}\n" + STUB)
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script)
+
+
+def test_run_commands_in_parallel(single_file, tmp_path):
+    commands = [
+        (f"page {i}", [single_file, f"https://x/{i}", str(tmp_path / f"{i}.html")])
+        for i in range(4)
+    ]
+
+    started = time.monotonic()
+    results = run_commands(commands, jobs=4)
+    elapsed = time.monotonic() - started
+
+    assert all(result.ok for result in results)
+    assert [result.label for result in results] == [f"page {i}" for i in range(4)]
+    assert elapsed < 4 * 0.3
+    assert (tmp_path / "3.html").read_text() == "<html>https://x/3</html>"
+
+
+def test_run_commands_retries_and_reports_failures(single_file, tmp_path):
+    commands = [
+        ("flaky", [single_file, "https://x/flaky", str(tmp_path / "a.html")]),
+        ("broken", [single_file, "https://x/fail", str(tmp_path / "b.html")]),
+        ("slow", [single_file, "https://x/slow", str(tmp_path / "c.html")]),
+    ]
+
+    flaky, broken, slow = run_commands(commands, jobs=3, timeout=1, retries=1)
+
+    assert flaky.ok and flaky.attempts == 2
+    assert not broken.ok and broken.returncode == 2 and broken.attempts == 2
+    assert not slow.ok and slow.returncode is None
+
+    report = failure_report([flaky, broken, slow])
+    assert report.startswith("1 succeeded, 2 failed")
+    assert "cannot load https://x/fail" in report
+    assert "timed out after 1s" in report
+
+
+def test_timed_out_command_is_killed_with_its_children(tmp_path):
+    output, orphan = tmp_path / "page.html", tmp_path / "orphan"
+    script = (
+        "import subprocess, sys, time\n"
+        "open(sys.argv[1], 'w').write('<html>')\n"
+        "subprocess.Popen([sys.executable, '-c', 'import sys, time;"
+        " time.sleep(1.5); open(sys.argv[1], \"w\")', sys.argv[2]])\n"
+        "time.sleep(5)\n"
+    )
+
+    result = run_command("slow", [sys.executable, "-c", script, str(output), str(orphan)],
+                         timeout=0.5, output=output)
+
+    assert result.returncode is None
+    assert not output.exists()
+    time.sleep(2)
+    assert not orphan.exists()
+
+
+def test_save_transcript_with_single_file(single_file, http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", {
+        "author": "A", "title": "Show A", "type": "free",
+        "catalog": [{"part": [
+            {
+                "article_id": f"{i}", "sort_number": str(i),
+                "title": f"Episode {i}", "duration_str": "1:00",
+            }
+            for i in (1, 2, 3)
+        ]}],
+    })
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    results = visitor.save_transcript_with_single_file(
+        1, episodes={1, 2}, single_file_exec_path=single_file,
+        cookie_file_path="cookies.json", jobs=2,
+    )
+
+    assert [result.ok for result in results] == [True, True]
+    assert (tmp_path / "Show A" / "Episode 2.html").read_text() == \
+        "<html>https://www.vistopia.com.cn/article/2</html>"
+    assert not (tmp_path / "Show A" / "Episode 3.html").exists()
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# Cold start budget for `import vistopia.main`, in milliseconds. Most of
+# it is click; override on slow machines.
+BUDGET_MS = float(os.environ.get("VISTOPIA_STARTUP_BUDGET_MS", 150))
+
+HEAVY = [
+    "requests", "pydantic", "tabulate", "pathvalidate", "mutagen",
+    "vistopia.models", "vistopia.visitor",
+]
+
+
+def _import_times(code: str):
+    """`{module: cumulative microseconds}` from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(ROOT), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_is_within_budget():
+    best = min(
+        _import_times("import vistopia.main")["vistopia.main"]
+        for _ in range(3)
+    )
+    assert best / 1000 < BUDGET_MS, \
+        f"importing vistopia.main took {best / 1000:.0f} ms"
+
+
+@pytest.mark.parametrize("args", [
+    ["--help"],
+    ["--version"],
+    ["--no-cache", "save-show", "--help"],
+])
+def test_cli_help_does_not_import_heavy_modules(args):
+    times = _import_times(
+        "import sys; from vistopia.main import main; "
+        f"sys.argv = ['vistopian'] + {args!r}; main()"
+    )
+    assert "vistopia.main" in times
+    assert [name for name in HEAVY if name in times] == []
@@ -0,0 +1,112 @@
+import json
+import tracemalloc
+
+import pytest
+
+from vistopia.stream import ANY, JSONItemStream
+
+CATALOG_PATH = ["data", "catalog", ANY, "part"]
+
+
+def _catalog(parts, per_part):
+    return {
+        "status": "success",
+        "data": {
+            "author": "作者 \"A\"",
+            "title": "Show \\ A",
+            "catalog": [
+                {
+                    "catalog_number": str(p),
+                    "part": [
+                        {
+                            "article_id": str(p * per_part + i),
+                            "title": f"第{i}集 [{{,}}]",
+                            "media_files": [{"urls": []}],
+                        }
+                        for i in range(per_part)
+                    ],
+                    "catalog_title": f"Part {p}",
+                }
+                for p in range(parts)
+            ],
+            "type": "free",
+        },
+    }
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1 << 20])
+def test_items_survive_any_chunking(size):
+    payload = _catalog(3, 4)
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    chunks = [body[i:i + size] for i in range(0, len(body), size)]
+
+    stream = JSONItemStream(chunks, CATALOG_PATH)
+    items = []
+    for item in stream:
+        assert stream.document()["data"]["title"] == "Show \\ A"
+        items.append(item)
+
+    assert items == [
+        article for part in payload["data"]["catalog"] for article in part["part"]
+    ]
+    document = stream.document()
+    assert document["data"]["type"] == "free"
+    assert document["data"]["catalog"][2] == \
+        {"catalog_number": "2", "part": [], "catalog_title": "Part 2"}
+
+
+def test_document_is_available_while_streaming():
+    payload = _catalog(2, 2)
+    body = json.dumps(payload).encode()
+    received = []
+
+    def chunks():
+        for i in range(0, len(body), 16):
+            received.append(i)
+            yield body[i:i + 16]
+
+    stream = JSONItemStream(chunks(), CATALOG_PATH)
+    items = iter(stream)
+
+    assert next(items)["article_id"] == "0"
+    assert len(received) < len(body) // 16
+    assert stream.document()["data"]["title"] == "Show \\ A"
+    assert stream.document()["data"]["catalog"] == [{"catalog_number": "0", "part": []}]
+
+
+def test_truncated_document_raises():
+    body = json.dumps(_catalog(1, 3)).encode()
+
+    with pytest.raises(json.JSONDecodeError):
+        list(JSONItemStream([body[:-10]], CATALOG_PATH))
+
+
+def test_streaming_peak_memory():
+    def chunks():
+        # Generated on the fly, as if read from a response.
+        yield b'{"status": "success", "data": {"author": "A", "title": "T", "catalog": ['
+        for p in range(20):
+            yield (b", " if p else b"") + b'{"catalog_number": "%d", "part": [' % p
+            for i in range(500):
+                article = {"article_id": str(i), "share_desc": "x" * 200}
+                yield (b", " if i else b"") + json.dumps(article).encode()
+            yield b"]}"
+        yield b"]}}"
+
+    def peak(func):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def buffered():
+        articles = json.loads(b"".join(chunks()))["data"]["catalog"]
+        assert sum(len(part["part"]) for part in articles) == 10000
+
+    def streamed():
+        assert sum(1 for _ in JSONItemStream(chunks(), CATALOG_PATH)) == 10000
+
+    buffered_peak, streamed_peak = peak(buffered), peak(streamed)
+    assert streamed_peak * 10 < buffered_peak
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from vistopia.manifest import MANIFEST_NAME, sha256sum
+from vistopia.visitor import Visitor
+
+
+@pytest.fixture
+def show(http_server, tmp_path, monkeypatch, mp3, catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", catalog_payload(
+        2, http_server, background_img=http_server.url("/cover.jpg"),
+    ))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    http_server.routes["/cover.jpg"] = b"\xff\xd8\xff\xe0cover"
+    for i in range(1, 4):
+        http_server.file(f"/{i}.mp3", mp3)
+    return http_server
+
+
+def _visitor(server):
+    return Visitor(token="", base_url=server.url("/api/v1/"))
+
+
+def test_sync_downloads_and_records_new_articles(show, tmp_path):
+    visitor = _visitor(show)
+    actions = visitor.plan_sync([1])
+    assert [(a.article.article_id, a.download) for a in actions] == \
+        [("101", True), ("102", True)]
+
+    stats = visitor.sync(actions, jobs=2)
+    assert stats.saved == 2
+
+    manifest = json.loads((tmp_path / "Show A" / MANIFEST_NAME).read_text())
+    entry = manifest["articles"]["101"]
+    fname = tmp_path / "Show A" / "Episode 1.mp3"
+    assert entry["size"] == fname.stat().st_size
+    assert entry["sha256"] == sha256sum(fname)
+    assert entry["tags"]
+
+    assert _visitor(show).plan_sync([1]) == []
+
+
+def test_sync_only_plans_changed_articles(show, tmp_path, catalog_payload):
+    visitor = _visitor(show)
+    visitor.sync(visitor.plan_sync([1]))
+
+    show.api("content/catalog/1", catalog_payload(
+        3, show, background_img=show.url("/cover.jpg"),
+    ))
+    actions = _visitor(show).plan_sync([1])
+    assert [(a.article.article_id, a.download) for a in actions] == [("103", True)]
+
+    show.api("content/content-show/1", {"author": "Author B", "title": "Show A"})
+    actions = _visitor(show).plan_sync([1])
+    assert [(a.article.article_id, a.download) for a in actions] == \
+        [("101", False), ("102", False), ("103", True)]
+    assert all(a.retag for a in actions)
+
+
+def test_sync_adopts_existing_files(show, tmp_path, mp3):
+    (tmp_path / "Show A").mkdir()
+    (tmp_path / "Show A" / "Episode 1.mp3").write_bytes(mp3)
+
+    visitor = _visitor(show)
+    actions = visitor.plan_sync([1], no_tag=True)
+    assert [(a.article.article_id, a.download, a.retag) for a in actions] == \
+        [("101", False, None), ("102", True, None)]
+    assert visitor.content_length(actions[1].article.media_key_full_url) == len(mp3)
+
+    visitor.sync(actions)
+    assert _visitor(show).plan_sync([1], no_tag=True) == []
+
+
+def test_sync_keeps_old_file_when_replacement_fails(show, tmp_path, mp3, catalog_payload):
+    visitor = _visitor(show)
+    visitor.sync(visitor.plan_sync([1], no_tag=True))
+
+    catalog = catalog_payload(2, show)
+    catalog["catalog"][0]["part"][0]["media_key_full_url"] = show.url("/gone.mp3")
+    show.api("content/catalog/1", catalog)
+    visitor = Visitor(token="", base_url=show.url("/api/v1/"), retries=0)
+    actions = visitor.plan_sync([1], no_tag=True)
+    assert [(a.article.article_id, a.download) for a in actions] == [("101", True)]
+
+    stats = visitor.sync(actions)
+    assert stats.failed == 1
+    assert (tmp_path / "Show A" / "Episode 1.mp3").read_bytes() == mp3
+
+
+def test_verify_reports_failed_server_checks_per_file(show, tmp_path):
+    visitor = _visitor(show)
+    visitor.sync(visitor.plan_sync([1], no_tag=True))
+    del show.routes["/2.mp3"]
+
+    results = _visitor(show).verify([1], jobs=1)
+
+    problems = {result.action.article.article_id: result.problems for result in results}
+    assert problems["101"] == []
+    assert len(problems["102"]) == 1
+    assert problems["102"][0].startswith("server check failed")
+
+
+def test_verify_requeues_bad_files(show, tmp_path):
+    visitor = _visitor(show)
+    visitor.sync(visitor.plan_sync([1]))
+    show_dir = tmp_path / "Show A"
+    manifest = json.loads((show_dir / MANIFEST_NAME).read_text())
+    assert manifest["articles"]["101"]["audio_sha256"]
+
+    # Retagging changes the file but not its audio.
+    visitor.retag_show(1, no_cover=True)
+    results = _visitor(show).verify([1], jobs=2)
+    assert [result.problems for result in results] == [[], []]
+
+    good = (show_dir / "Episode 2.mp3").read_bytes()
+    (show_dir / "Episode 1.mp3").write_bytes(good[:-50])
+    corrupted = bytearray(good)
+    corrupted[-20] ^= 0xFF
+    (show_dir / "Episode 2.mp3").write_bytes(bytes(corrupted))
+
+    visitor = _visitor(show)
+    results = visitor.verify([1], jobs=2)
+    problems = {result.action.article.article_id: result.problems for result in results}
+    assert problems["101"][0].startswith("truncated")
+    assert any("server has" in problem for problem in problems["101"])
+    assert problems["102"] == ["audio checksum differs from manifest"]
+
+    stats = visitor.repair(results)
+    assert stats.saved == 2
+    assert [result.problems for result in _visitor(show).verify([1])] == [[], []]
+    assert (show_dir / "Episode 2.mp3").read_bytes() == good
@@ -0,0 +1,90 @@
+import os
+
+from mutagen.easyid3 import EasyID3
+from mutagen.id3 import ID3
+
+from vistopia.tagging import cover_frame, text_frames, write_tags
+from vistopia.visitor import Visitor
+
+
+def _frames(title="标题"):
+    return text_frames(
+        title=title, album="系列", artist="作者", track="7",
+        website="http://example.com/7",
+    ) + [cover_frame(b"\xff\xd8\xff\xe0cover")]
+
+
+def test_write_tags_writes_all_frames_once(tmp_path, mp3):
+    fname = tmp_path / "a.mp3"
+    fname.write_bytes(mp3)
+
+    assert write_tags(fname, _frames())
+
+    easy = EasyID3(fname)
+    assert easy["title"] == ["标题"]
+    assert easy["album"] == ["系列"]
+    assert easy["artist"] == ["作者"]
+    assert easy["tracknumber"] == ["7"]
+    assert easy["website"] == ["http://example.com/7"]
+    assert ID3(fname).getall("APIC")[0].data == b"\xff\xd8\xff\xe0cover"
+
+
+def test_write_tags_skips_matching_files(tmp_path, mp3):
+    fname = tmp_path / "a.mp3"
+    fname.write_bytes(mp3)
+    write_tags(fname, _frames())
+    os.utime(fname, (0, 0))
+
+    assert not write_tags(fname, _frames())
+    assert fname.stat().st_mtime == 0
+
+    assert write_tags(fname, _frames(title="新标题"))
+    assert EasyID3(fname)["title"] == ["新标题"]
+    assert len(ID3(fname).getall("APIC")) == 1
+
+
+def test_retag_show_tags_existing_files(http_server, tmp_path, monkeypatch, mp3):
+    monkeypatch.chdir(tmp_path)
+    http_server.api("content/catalog/1", {
+        "author": "作者", "title": "系列", "type": "free",
+        "background_img": http_server.url("/cover.jpg"),
+        "catalog": [{"part": [
+            {
+                "article_id": str(i), "sort_number": str(i),
+                "title": f"第{i}集", "duration_str": "1:00",
+            }
+            for i in (1, 2)
+        ]}],
+    })
+    http_server.api("content/content-show/1", {"author": "作者", "title": "系列"})
+    http_server.routes["/cover.jpg"] = b"cover"
+    (tmp_path / "系列").mkdir()
+    (tmp_path / "系列" / "第1集.mp3").write_bytes(mp3)
+
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+    stats = visitor.retag_show(1)
+    assert (stats.total, stats.saved) == (1, 1)
+    assert EasyID3(tmp_path / "系列" / "第1集.mp3")["title"] == ["第1集"]
+
+    stats = visitor.retag_show(1)
+    assert (stats.total, stats.saved, stats.skipped) == (1, 0, 1)
+    assert http_server.paths().count("/cover.jpg") == 1
+
+
+def test_retag_cover_fetches_each_cover_once(http_server, tmp_path, mp3):
+    from vistopia.cache import CoverCache
+    from vistopia.models import Catalog, validate_model
+
+    http_server.routes["/cover.png"] = b"\x89PNG\r\n\x1a\ncover"
+    catalog = validate_model(Catalog, {
+        "author": "作者", "title": "系列", "type": "free", "catalog": [],
+        "background_img": http_server.url("/cover.png"),
+    })
+    covers = CoverCache()
+    for name in ("a.mp3", "b.mp3"):
+        (tmp_path / name).write_bytes(mp3)
+        Visitor.retag_cover(tmp_path / name, None, catalog, None, covers=covers)
+
+    assert http_server.paths().count("/cover.png") == 1
+    apic = ID3(tmp_path / "b.mp3").getall("APIC")[0]
+    assert (apic.mime, apic.data) == ("image/png", b"\x89PNG\r\n\x1a\ncover")
@@ -0,0 +1,28 @@
+from vistopia.verify import inspect_file, inspect_files
+
+TAG = b"ID3\x04\x00\x00\x00\x00\x00\x16" + bytes(22)
+
+
+def test_inspect_file_separates_tags_from_audio(tmp_path, mp3):
+    plain, tagged = tmp_path / "plain.mp3", tmp_path / "tagged.mp3"
+    plain.write_bytes(mp3)
+    tagged.write_bytes(TAG + mp3)
+
+    plain_report, tagged_report = inspect_files([plain, tagged], jobs=2)
+
+    assert plain_report.problem is None and tagged_report.problem is None
+    assert (tagged_report.size, tagged_report.tag_size) == (len(TAG + mp3), len(TAG))
+    assert tagged_report.audio_sha256 == plain_report.audio_sha256 == plain_report.sha256
+    assert tagged_report.sha256 != plain_report.sha256
+
+
+def test_inspect_file_detects_truncation(tmp_path, mp3):
+    fname = tmp_path / "cut.mp3"
+    fname.write_bytes(TAG + mp3[:-50])
+    assert str(inspect_file(fname).problem).startswith("truncated")
+
+    fname.write_bytes(TAG + b"<html>not found</html>")
+    assert inspect_file(fname).problem == "no MPEG audio frames found"
+
+    fname.write_bytes(b"")
+    assert inspect_file(fname).problem == "empty file"
@@ -1,3 +1,4 @@
+import json
 import pytest
 import sys
 from pathlib import Path
@@ -85,3 +86,430 @@ def test_search(visitor: Visitor, keyword: str, expected: tuple):
             item.data_type,
         ) == expected for item in data
     ])
+
+
+def _catalog(payload):
+    from vistopia.models import Catalog, validate_model
+    return validate_model(Catalog, payload)
+
+
+def test_save_show_parallel_jobs(visitor, tmpdir, monkeypatch, catalog_payload):
+    import threading
+
+    catalog = _catalog(catalog_payload(6))
+    monkeypatch.setattr(visitor, "get_catalog", lambda id: catalog)
+    monkeypatch.setattr(visitor, "get_content_show", lambda id: catalog)
+    # Every download waits for the others, so serial downloads time out.
+    barrier = threading.Barrier(4)
+
+    def fake_download(url, fname):
+        barrier.wait(timeout=10)
+        Path(fname).write_bytes(b"\0" * 1024)
+        return 1024
+
+    monkeypatch.setattr(visitor, "download", fake_download)
+    monkeypatch.chdir(tmpdir)
+
+    (Path(tmpdir) / "Show A").mkdir()
+    (Path(tmpdir) / "Show A" / "Episode 1.mp3").write_bytes(b"\0")
+
+    stats = visitor.save_show(
+        id=1, no_tag=True, no_cover=True, episodes={1, 2, 3, 4, 5}, jobs=4
+    )
+
+    assert stats.total == 5
+    assert stats.saved == 4
+    assert stats.skipped == 1
+    assert stats.failed == 0
+    assert stats.bytes == 4 * 1024
+    assert not (Path(tmpdir) / "Show A" / "Episode 6.mp3").exists()
+    assert (Path(tmpdir) / "Show A" / "Episode 1.mp3").stat().st_size == 1
+
+
+def test_visitor_reuses_pooled_connection(http_server):
+    http_server.api("content/catalog/1", {"one": 1})
+    http_server.api("content/catalog/2", {"two": 2})
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    assert visitor.get_api_response("content/catalog/1") == {"one": 1}
+    assert visitor.get_api_response("content/catalog/2") == {"two": 2}
+    assert len(http_server.clients) == 1
+
+
+def test_visitor_retries_server_errors(http_server):
+    attempts = []
+
+    def flaky(handler):
+        attempts.append(handler.path)
+        if len(attempts) < 3:
+            return 503, {}, b"busy"
+        return 200, {}, b'{"status": "success", "data": [1, 2]}'
+
+    http_server.routes["/api/v1/search/web"] = flaky
+    visitor = Visitor(
+        token="", backoff_factor=0, base_url=http_server.url("/api/v1/")
+    )
+
+    assert visitor.get_api_response("search/web") == [1, 2]
+    assert len(attempts) == 3
+
+
+def test_download_streams_to_file(http_server, tmp_path):
+    http_server.routes["/a.mp3"] = b"x" * 200000
+    visitor = Visitor(token="")
+
+    nbytes = visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3")
+
+    assert nbytes == 200000
+    assert (tmp_path / "a.mp3").read_bytes() == b"x" * 200000
+
+
+def test_download_resumes_partial_file(http_server, tmp_path):
+    body = bytes(range(256)) * 1000
+    http_server.file("/a.mp3", body)
+    (tmp_path / "a.mp3.part").write_bytes(body[:1000])
+    visitor = Visitor(token="")
+
+    nbytes = visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3")
+
+    assert nbytes == len(body) - 1000
+    assert http_server.requests[-1][2]["Range"] == "bytes=1000-"
+    assert (tmp_path / "a.mp3").read_bytes() == body
+    assert not (tmp_path / "a.mp3.part").exists()
+
+
+def test_download_restarts_when_range_is_ignored(http_server, tmp_path):
+    http_server.routes["/a.mp3"] = b"fresh"
+    (tmp_path / "a.mp3.part").write_bytes(b"stale")
+    visitor = Visitor(token="")
+
+    visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3")
+
+    assert (tmp_path / "a.mp3").read_bytes() == b"fresh"
+
+
+def test_download_finishes_complete_partial_file(http_server, tmp_path):
+    http_server.file("/a.mp3", b"done")
+    (tmp_path / "a.mp3.part").write_bytes(b"done")
+    visitor = Visitor(token="")
+
+    assert visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3") == 0
+    assert (tmp_path / "a.mp3").read_bytes() == b"done"
+
+
+def test_download_resumes_after_dropped_connection(http_server, tmp_path):
+    body = b"0123456789" * 100000
+    http_server.file("/a.mp3", body, truncate_once=True)
+    visitor = Visitor(token="")
+
+    nbytes = visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3")
+
+    assert (tmp_path / "a.mp3").read_bytes() == body
+    assert len(http_server.requests) == 2
+    assert nbytes == len(body)
+    assert http_server.requests[-1][2]["Range"] != "bytes=0-"
+
+
+def test_download_resumes_only_an_unchanged_file(http_server, tmp_path):
+    body = b"0123456789" * 100000
+    http_server.file("/a.mp3", body, truncate_once=True, etag='"v1"')
+    visitor = Visitor(token="")
+
+    visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3")
+
+    assert (tmp_path / "a.mp3").read_bytes() == body
+    assert http_server.requests[-1][2]["If-Range"] == '"v1"'
+    assert list(tmp_path.iterdir()) == [tmp_path / "a.mp3"]
+
+    # The partial file was fetched before the file changed on the server.
+    (tmp_path / "b.mp3.part").write_bytes(b"old")
+    (tmp_path / "b.mp3.part.validator").write_text('"v0"')
+    http_server.file("/b.mp3", body, etag='"v1"')
+
+    assert visitor.download(http_server.url("/b.mp3"), tmp_path / "b.mp3") == len(body)
+    assert (tmp_path / "b.mp3").read_bytes() == body
+
+
+def test_download_restarts_when_server_sends_another_range(http_server, tmp_path):
+    body = b"0123456789" * 10
+
+    def wrong_range(handler):
+        if "Range" not in handler.headers:
+            return 200, {}, body
+        return 206, {"Content-Range": f"bytes 0-{len(body) - 1}/{len(body)}"}, body
+
+    http_server.routes["/a.mp3"] = wrong_range
+    (tmp_path / "a.mp3.part").write_bytes(body[:10])
+    visitor = Visitor(token="")
+
+    visitor.download(http_server.url("/a.mp3"), tmp_path / "a.mp3")
+
+    assert (tmp_path / "a.mp3").read_bytes() == body
+    assert "Range" not in http_server.requests[-1][2]
+
+
+def test_iter_pages_fetches_every_page(http_server):
+    from urllib.parse import parse_qs, urlsplit
+
+    def subscriptions(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        page = int(query.get("page", ["1"])[0])
+        data = {
+            "current_page": page,
+            "last_page": 3,
+            "data": [
+                {"content_id": page * 10 + i, "title": f"Show {page}-{i}"}
+                for i in range(2)
+            ],
+        }
+        body = json.dumps({"status": "success", "data": data}).encode()
+        return 200, {}, body
+
+    http_server.routes["/api/v1/user/subscriptions-list"] = subscriptions
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    items = visitor.iter_user_subscriptions()
+    assert next(items).content_id == 10
+    assert len(http_server.requests) == 1
+
+    ids = [item.content_id for item in visitor.get_user_subscriptions_list()]
+    assert ids == [10, 11, 20, 21, 30, 31]
+    assert len(http_server.requests) == 4
+
+
+def test_iter_pages_follows_next_page_url(http_server):
+    from urllib.parse import parse_qs, urlsplit
+
+    def search(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        assert query["keyword"] == ["八分"]
+        page = int(query.get("page", ["1"])[0])
+        data = {
+            "current_page": page,
+            "next_page_url": "next" if page < 2 else None,
+            "data": [{
+                "id": page, "author": "A", "title": f"T{page}",
+                "share_desc": "", "data_type": "content",
+            }],
+        }
+        body = json.dumps({"status": "success", "data": data}).encode()
+        return 200, {}, body
+
+    http_server.routes["/api/v1/search/web"] = search
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    assert [item.id for item in visitor.search("八分")] == [1, 2]
+
+
+def test_transcript_stylesheet_is_rewritten(http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    link = b'<link rel="stylesheet" href="/assets/article/course.css">'
+    page = b"<!DOCTYPE html>\n" + b"x" * (64 * 1024 - 30) + link + b"</html>"
+    http_server.api("content/catalog/1", {
+        "author": "A", "title": "Show A", "type": "free",
+        "catalog": [{"part": [
+            {
+                "article_id": str(i), "sort_number": str(i),
+                "title": f"Episode {i}", "duration_str": "1:00",
+                "content_url": http_server.url(f"/{i}.html"),
+            }
+            for i in (1, 2, 3)
+        ]}],
+    })
+    for i in (1, 2, 3):
+        http_server.routes[f"/{i}.html"] = page
+    http_server.routes["/assets/article/course.css"] = b"body {}"
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    stats = visitor.save_transcript(1, episodes={1, 2}, jobs=2)
+    assert stats.saved == 2
+    html = (tmp_path / "Show A" / "Episode 1.html").read_bytes()
+    assert http_server.url("/assets/article/course.css").encode() in html
+    assert not (tmp_path / "Show A" / "Episode 3.html").exists()
+
+    visitor.save_transcript(1, local_css=True)
+    html = (tmp_path / "Show A" / "Episode 3.html").read_bytes()
+    assert b'href="course.css"' in html
+    assert (tmp_path / "Show A" / "course.css").read_bytes() == b"body {}"
+
+
+def test_transcript_stylesheet_comes_from_the_page_host(
+        http_server, tmp_path, monkeypatch, catalog_payload):
+    monkeypatch.chdir(tmp_path)
+    for i in (1, 2):
+        http_server.routes[f"/{i}.html"] = b'<link href="/assets/article/course.css">'
+    # The API is reached through a proxy that does not serve the assets.
+    visitor = Visitor(token="", base_url="http://127.0.0.1:9/api/v1/", retries=0)
+    catalog = _catalog(catalog_payload(2, http_server))
+    monkeypatch.setattr(visitor, "get_catalog", lambda id: catalog)
+    monkeypatch.setattr(visitor, "prefetch", lambda *args, **kwargs: None)
+
+    stats = visitor.save_transcript(1, local_css=True)
+    assert (stats.saved, stats.failed) == (2, 1)
+    assert not (tmp_path / "Show A" / "course.css").exists()
+    assert (tmp_path / "Show A" / "Episode 2.html").exists()
+
+    http_server.routes["/assets/article/course.css"] = b"body {}"
+    (tmp_path / "Show A" / "Episode 2.html").unlink()
+    stats = visitor.save_transcript(1, local_css=True)
+    assert (stats.saved, stats.failed) == (2, 0)
+    assert (tmp_path / "Show A" / "course.css").read_bytes() == b"body {}"
+
+
+def test_api_error_payload_raises_api_error(http_server):
+    from vistopia.exceptions import APIError, ThrottledError
+
+    http_server.routes["/api/v1/content/catalog/1"] = \
+        {"status": "error", "message": "content not found"}
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    with pytest.raises(APIError) as info:
+        visitor.get_api_response("content/catalog/1")
+
+    assert not isinstance(info.value, ThrottledError)
+    assert info.value.message == "content not found"
+    assert len(http_server.requests) == 1
+
+
+def test_throttled_requests_back_off_and_retry(http_server):
+    attempts = []
+
+    def throttled(handler):
+        attempts.append(handler.path)
+        if len(attempts) == 1:
+            return 429, {"Retry-After": "0"}, b""
+        if len(attempts) == 2:
+            return 200, {}, '{"status": "error", "message": "请求过于频繁"}'.encode()
+        return 200, {}, b'{"status": "success", "data": 1}'
+
+    http_server.routes["/api/v1/search/web"] = throttled
+    visitor = Visitor(token="", rate=100, base_url=http_server.url("/api/v1/"))
+
+    assert visitor.get_api_response("search/web") == 1
+    assert len(attempts) == 3
+    assert visitor.limiter.rate is not None and visitor.limiter.rate < 100
+
+
+def test_throttled_requests_give_up_after_retries(http_server):
+    from vistopia.exceptions import ThrottledError
+
+    http_server.routes["/api/v1/search/web"] = lambda handler: (429, {}, b"")
+    visitor = Visitor(
+        token="", rate=1000, retries=1, base_url=http_server.url("/api/v1/")
+    )
+
+    with pytest.raises(ThrottledError):
+        visitor.get_api_response("search/web")
+    assert len(http_server.requests) == 2
+
+
+def test_rate_limit_is_shared_across_threads(http_server):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    http_server.api("search/web", [])
+    visitor = Visitor(
+        token="", rate=20, burst=1, base_url=http_server.url("/api/v1/")
+    )
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        list(executor.map(
+            lambda i: visitor.get_api_response("search/web", {"page": i}),
+            range(5)
+        ))
+
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+
+
+def test_concurrent_identical_requests_are_coalesced(http_server, catalog_payload):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow_catalog(handler):
+        time.sleep(0.2)
+        body = {"status": "success", "data": catalog_payload(1)}
+        return 200, {}, json.dumps(body).encode()
+
+    http_server.routes["/api/v1/content/catalog/1"] = slow_catalog
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        catalogs = list(executor.map(lambda _: visitor.get_catalog(1), range(8)))
+
+    assert len(http_server.requests) == 1
+    assert all(catalog is catalogs[0] for catalog in catalogs)
+
+
+def test_iter_catalog_streams_articles(http_server, catalog_payload):
+    http_server.api("content/catalog/1", catalog_payload(3))
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    items = list(visitor.iter_catalog(1))
+
+    assert [article.title for _, article in items] == \
+        ["Episode 1", "Episode 2", "Episode 3"]
+    catalog = items[0][0]
+    assert (catalog.title, catalog.author) == ("Show A", "Author A")
+    assert catalog.catalog[0].catalog_title == "Part One"
+
+
+@pytest.mark.parametrize("fast", [False, True], ids=["full", "lean"])
+def test_iter_catalog_with_show_fields_after_articles(http_server, fast, catalog_payload):
+    data = catalog_payload(3)
+    # JSON objects are unordered: the show's fields may follow the articles.
+    parts = data.pop("catalog")
+    http_server.api("content/catalog/1", {"catalog": parts, **data})
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"), fast_parse=fast)
+
+    items = list(visitor.iter_catalog(1))
+
+    assert [article.title for _, article in items] == \
+        ["Episode 1", "Episode 2", "Episode 3"]
+    assert all(catalog.title == "Show A" for catalog, _ in items)
+
+
+def test_iter_catalog_raises_api_error(http_server):
+    from vistopia.exceptions import APIError
+
+    http_server.routes["/api/v1/content/catalog/1"] = \
+        {"status": "error", "message": "content not found"}
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+
+    with pytest.raises(APIError) as info:
+        list(visitor.iter_catalog(1))
+    assert info.value.message == "content not found"
+
+
+def test_iter_catalog_closes_failed_responses(http_server, monkeypatch):
+    from vistopia.exceptions import APIError
+
+    http_server.routes["/api/v1/content/catalog/1"] = lambda handler: (429, {}, b"slow down")
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"), retries=0)
+    responses = []
+    get = visitor.session.get
+
+    def spy(*args, **kwargs):
+        responses.append(get(*args, **kwargs))
+        return responses[-1]
+
+    monkeypatch.setattr(visitor.session, "get", spy)
+
+    with pytest.raises(APIError):
+        list(visitor.iter_catalog(1))
+    assert len(responses) == 1 and all(response.raw.closed for response in responses)
+
+
+def test_streamed_save_show(http_server, tmp_path, monkeypatch, catalog_payload):
+    for i in range(1, 5):
+        http_server.file(f"/{i}.mp3", b"\0" * 256)
+    http_server.api("content/catalog/1", catalog_payload(4, http_server))
+    http_server.api("content/content-show/1", {"author": "Author A", "title": "Show A"})
+    visitor = Visitor(token="", base_url=http_server.url("/api/v1/"))
+    monkeypatch.chdir(tmp_path)
+
+    stats = visitor.save_show(1, no_tag=True, episodes={2, 3, 4}, jobs=2, stream=True)
+
+    assert (stats.total, stats.saved, stats.bytes) == (3, 3, 3 * 256)
+    assert sorted(p.name for p in (tmp_path / "Show A").iterdir()) == \
+        ["Episode 2.mp3", "Episode 3.mp3", "Episode 4.mp3"]
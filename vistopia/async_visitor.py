@@ -0,0 +1,125 @@
+"""asyncio front end to the Vistopia API for high fan-out crawls.
+
+`AsyncVisitor` mirrors the metadata methods of `Visitor` as coroutines.
+Requests still go through a `Visitor` (and so share its pooled session,
+retries and response cache), but are issued from a thread pool so that
+many can be in flight at once, bounded by a concurrency limit and an
+optional token-bucket rate limit shared with the wrapped `Visitor`.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional
+
+from .models import (
+    Catalog,
+    ContentShow,
+    SearchItem,
+    SearchResult,
+    SubscriptionItem,
+    SubscriptionsList,
+    validate_model,
+)
+from .visitor import Visitor
+
+# `get_event_loop` is deprecated within coroutines; `get_running_loop`
+# is new in Python 3.7.
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+class AsyncVisitor:
+
+    def __init__(self, token: Optional[str] = None, concurrency: int = 8,
+                 rate: Optional[float] = None, burst: Optional[float] = None,
+                 visitor: Optional[Visitor] = None, **kwargs):
+        if visitor is not None and (
+                rate is not None or burst is not None or kwargs):
+            raise ValueError(
+                "rate, burst and Visitor options only apply to a new "
+                "Visitor; set them on the visitor passed in"
+            )
+        kwargs.setdefault("pool_size", concurrency)
+        self.visitor = visitor or Visitor(
+            token, rate=rate, burst=burst, **kwargs
+        )
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def get_api_response(self, uri: str, params: Optional[dict] = None):
+        # Created lazily so that it binds to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            # Wait for the shared limiter here rather than in a worker thread.
+            await self.visitor.limiter.acquire_async()
+            loop = _running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                partial(self.visitor.get_api_response, uri, params,
+                        throttle=False),
+            )
+
+    async def get_catalog(self, id: int) -> Catalog:
+        response = await self.get_api_response(f"content/catalog/{id}")
+        return validate_model(Catalog, response)
+
+    async def get_content_show(self, id: int) -> ContentShow:
+        response = await self.get_api_response(f"content/content-show/{id}")
+        return validate_model(ContentShow, response)
+
+    async def get_pages(self, uri: str, model_cls,
+                        params: Optional[dict] = None) -> list:
+        """Items of every page of a paginated endpoint.
+
+        Pages after the first are requested concurrently once the first
+        page has reported `last_page`; endpoints that only report
+        `next_page_url` are walked one page at a time.
+        """
+
+        params = dict(params or {})
+
+        async def _get_page(page: int):
+            response = await self.get_api_response(uri, dict(params, page=page))
+            return validate_model(model_cls, response)
+
+        result = validate_model(
+            model_cls, await self.get_api_response(uri, params)
+        )
+        data = list(result.data)
+        current = result.current_page or 1
+
+        if result.last_page:
+            pages = range(current + 1, result.last_page + 1)
+            for page in await asyncio.gather(*map(_get_page, pages)):
+                data.extend(page.data)
+            return data
+
+        while result.next_page_url and result.data:
+            current += 1
+            result = await _get_page(current)
+            data.extend(result.data)
+        return data
+
+    async def search(self, keyword: str) -> List[SearchItem]:
+        return await self.get_pages(
+            "search/web", SearchResult, {"keyword": keyword}
+        )
+
+    async def get_user_subscriptions_list(self) -> List[SubscriptionItem]:
+        return await self.get_pages("user/subscriptions-list", SubscriptionsList)
+
+    async def get_catalogs(self, ids) -> List[Catalog]:
+        """Catalogs of many shows at once, in the order of `ids`."""
+        return await asyncio.gather(*[self.get_catalog(id) for id in ids])
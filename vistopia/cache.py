@@ -0,0 +1,313 @@
+"""Persistent on-disk caches for API responses and cover art.
+
+API responses are stored zlib-compressed in a single SQLite database, keyed
+by endpoint and query parameters. Each endpoint has its own time-to-live;
+stale entries are kept so they can be revalidated with `If-None-Match` /
+`If-Modified-Since` when the server sent an `ETag` or `Last-Modified`
+header. The database is bounded in size by evicting the least recently
+used entries.
+
+Cover images are kept in memory and, optionally, in a directory shared
+by every process using the same cache directory, so that each cover URL
+is downloaded once.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+
+logger = getLogger(__name__)
+
+# Time-to-live in seconds, matched against the start of the endpoint URI.
+# Endpoints not listed here are never cached.
+DEFAULT_TTLS = {
+    "content/catalog/": 10 * 60,
+    "content/content-show/": 24 * 60 * 60,
+    "search/web": 60 * 60,
+    "user/subscriptions-list": 5 * 60,
+}
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "vistopia"
+
+
+class CacheEntry(NamedTuple):
+    data: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+    def validators(self) -> Dict[str, str]:
+        """Headers for a conditional request revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+
+    def __init__(self, path, ttls: Optional[Dict[str, float]] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        path = Path(path)
+        if path.suffix != ".sqlite":
+            path.mkdir(parents=True, exist_ok=True)
+            path = path / "responses.sqlite"
+        self.path = path
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(path), timeout=30, check_same_thread=False
+        )
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " uri TEXT NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " stored REAL NOT NULL,"
+                " accessed REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " body BLOB NOT NULL)"
+            )
+
+    def ttl_for(self, uri: str) -> Optional[float]:
+        for prefix, ttl in self.ttls.items():
+            if uri.startswith(prefix):
+                return ttl
+        return None
+
+    @staticmethod
+    def make_key(uri: str, params: dict) -> str:
+        """Cache key for a request.
+
+        The API token is hashed rather than stored, so that different
+        accounts never share entries.
+
+        >>> ResponseCache.make_key("search/web", {"keyword": "a", "api_token": ""})
+        'search/web?api_token=e3b0c44298fc&keyword=a'
+        """
+        items = []
+        for name, value in sorted(params.items()):
+            if name == "api_token":
+                value = hashlib.sha256(
+                    str(value or "").encode()).hexdigest()[:12]
+            items.append(f"{name}={value}")
+        return uri + "?" + "&".join(items)
+
+    def get(self, uri: str, params: dict) -> Optional[CacheEntry]:
+        ttl = self.ttl_for(uri)
+        if ttl is None:
+            return None
+
+        key = self.make_key(uri, params)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, stored, body"
+                " FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            logger.debug(f"Cache miss for {key}")
+            return None
+
+        etag, last_modified, stored, body = row
+        fresh = time.time() - stored < ttl
+        logger.debug(f"Cache {'hit' if fresh else 'stale'} for {key}")
+        if fresh:
+            self._touch(key, refresh=False)
+        data = json.loads(zlib.decompress(body).decode())
+        return CacheEntry(data, etag, last_modified, fresh)
+
+    def put(self, uri: str, params: dict, data: Any,
+            etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> None:
+        if self.ttl_for(uri) is None:
+            return
+
+        key = self.make_key(uri, params)
+        body = zlib.compress(json.dumps(data, ensure_ascii=False).encode())
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, uri, etag, last_modified, now, now, len(body), body),
+            )
+            self._evict()
+
+    def revalidated(self, uri: str, params: dict) -> None:
+        """Mark a stale entry fresh again after a `304 Not Modified`."""
+        self._touch(self.make_key(uri, params), refresh=True)
+
+    def expire(self, uri: str) -> None:
+        """Mark every entry for `uri` stale, so that the next request for
+        it is revalidated with the server however recently it was stored."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE responses SET stored = 0 WHERE uri = ?", (uri,))
+
+    def entries(self, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+        """`(uri, data)` for every stored response under `prefix`, stale or
+        not. Where several entries share a URI, only the newest is kept."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uri, body FROM responses WHERE substr(uri, 1, ?) = ?"
+                " ORDER BY stored", (len(prefix), prefix)
+            ).fetchall()
+        latest = {uri: body for uri, body in rows}
+        for uri, body in latest.items():
+            yield uri, json.loads(zlib.decompress(body).decode())
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def _touch(self, key: str, refresh: bool) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            if refresh:
+                self._db.execute(
+                    "UPDATE responses SET stored = ?, accessed = ?"
+                    " WHERE key = ?", (now, now, key))
+            else:
+                self._db.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    (now, key))
+
+    def _evict(self) -> None:
+        total, = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+
+_IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def sniff_mime(data: bytes, default: str = "image/jpeg") -> str:
+    """Guess an image's MIME type from its magic bytes.
+
+    >>> sniff_mime(b"\\x89PNG\\r\\n\\x1a\\n...")
+    'image/png'
+    >>> sniff_mime(b"RIFF0000WEBPVP8 ")
+    'image/webp'
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    return default
+
+
+class Cover(NamedTuple):
+    data: bytes
+    mime: str
+
+
+class CoverCache:
+    """Cover images keyed by URL, in memory and optionally on disk.
+
+    On disk, images are stored once per content hash under `blobs/`,
+    with a small pointer file per URL under `urls/`. A lock file
+    serialises fetches of the same URL across processes.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        if self.path is not None:
+            (self.path / "blobs").mkdir(parents=True, exist_ok=True)
+            (self.path / "urls").mkdir(parents=True, exist_ok=True)
+        self._covers: Dict[str, Cover] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, fetch: Callable[[str], bytes]) -> Cover:
+        """Return the cover at `url`, calling `fetch(url)` on a miss."""
+        with self._lock:
+            lock = self._locks.setdefault(url, threading.Lock())
+
+        with lock:
+            cover = self._covers.get(url)
+            if cover is None:
+                cover = self._load_or_fetch(url, fetch)
+                self._covers[url] = cover
+        return cover
+
+    def _load_or_fetch(self, url: str, fetch: Callable[[str], bytes]) -> Cover:
+        root = self.path
+        if root is None:
+            data = fetch(url)
+            return Cover(data, sniff_mime(data))
+
+        key = hashlib.sha256(url.encode()).hexdigest()
+        pointer = root / "urls" / key
+
+        with open(root / "urls" / (key + ".lock"), "w") as lock_fp:
+            if fcntl is not None:
+                fcntl.flock(lock_fp, fcntl.LOCK_EX)
+
+            cached = self._read(root, pointer)
+            if cached is None:
+                logger.debug(f"Cover cache miss for {url}")
+                data = fetch(url)
+                self._write(root, pointer, data)
+            else:
+                logger.debug(f"Cover cache hit for {url}")
+                data = cached
+
+        return Cover(data, sniff_mime(data))
+
+    @staticmethod
+    def _read(root: Path, pointer: Path) -> Optional[bytes]:
+        try:
+            digest = pointer.read_text().strip()
+            return (root / "blobs" / digest).read_bytes()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _write(root: Path, pointer: Path, data: bytes) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        blob = root / "blobs" / digest
+        if not blob.exists():
+            _atomic_write(blob, data)
+        _atomic_write(pointer, digest.encode())
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
@@ -0,0 +1,332 @@
+"""Long-running watcher that downloads new episodes as they appear.
+
+`Daemon` keeps one `Visitor` alive, so its HTTP connection pool, the
+response cache and the parsed catalogs stay warm between polls. Each
+show (and, unless the shows were given explicitly, the subscription
+list) is polled on its own schedule, every `interval` seconds spread by
+a random `jitter`, so that the requests do not all land at once. A poll
+re-plans the show with `Visitor.plan_sync` and queues whatever is new
+or changed; a single worker carries the queued actions out with
+`Visitor.sync`, so polling goes on while episodes download.
+
+A small JSON status page is served on localhost::
+
+    $ curl http://127.0.0.1:8648/status
+"""
+
+import heapq
+import json
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .manifest import ShowManifest
+from .utils import clear_memo
+from .visitor import SyncAction, Visitor
+
+logger = getLogger(__name__)
+
+SUBSCRIPTIONS = 0   # schedule key of the subscription list; shows use their id
+
+
+class ShowState:
+    """What the daemon knows about one watched show."""
+
+    def __init__(self, content_id: int, title: Optional[str] = None):
+        self.content_id = content_id
+        self.title = title
+        self.last_poll: Optional[float] = None
+        self.next_poll: Optional[float] = None
+        self.queued = 0
+        self.error: Optional[str] = None
+
+    def status(self, now: float) -> dict:
+        return {
+            "content_id": self.content_id,
+            "title": self.title,
+            "last_poll": _isoformat(self.last_poll),
+            "next_poll_in": round(self.next_poll - now, 1)
+            if self.next_poll is not None else None,
+            "queued": self.queued,
+            "error": self.error,
+        }
+
+
+class Daemon:
+    """Poll shows for new episodes and download them until stopped.
+
+    With `ids`, only those shows are watched; otherwise the subscription
+    list is polled too, and shows are picked up or dropped as the
+    subscriptions change.
+    """
+
+    def __init__(self, visitor: Visitor, ids: Optional[Sequence[int]] = None,
+                 interval: float = 900, jitter: float = 0.2, jobs: int = 1,
+                 no_tag: bool = False,
+                 status_address: Optional[Tuple[str, int]] = ("127.0.0.1", 8648),
+                 seed: Optional[int] = None):
+        if interval <= 0:
+            raise ValueError("poll interval must be positive")
+        if not 0 <= jitter < 1:
+            raise ValueError("jitter must be in [0, 1)")
+        self.visitor = visitor
+        self.ids = list(ids) if ids else None
+        self.interval = interval
+        self.jitter = jitter
+        self.jobs = jobs
+        self.no_tag = no_tag
+        self.status_address = status_address
+        self.shows: Dict[int, ShowState] = {}
+        self.polls = 0
+        self.saved = 0
+        self.failed = 0
+        self.bytes = 0
+        self.subscriptions_error: Optional[str] = None
+        self._random = random.Random(seed)
+        self._due: List[Tuple[float, int]] = []
+        self._pending: Set[str] = set()
+        # One manifest per show, shared by its polls and queued batches,
+        # so that a batch saving its manifest keeps what earlier ones
+        # recorded.
+        self._manifests: Dict[int, ShowManifest] = {}
+        self._queue: "queue.Queue[Optional[List[SyncAction]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._started = time.time()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    # Scheduling
+
+    def _delay(self) -> float:
+        spread = self.interval * self.jitter
+        return self.interval + self._random.uniform(-spread, spread)
+
+    def _schedule(self, key: int, delay: float) -> None:
+        due = time.monotonic() + delay
+        if key in self.shows:
+            self.shows[key].next_poll = due
+        heapq.heappush(self._due, (due, key))
+
+    def _watch(self, content_id: int, title: Optional[str] = None) -> None:
+        if content_id not in self.shows:
+            logger.info(f"Watching show {content_id} {title or ''}".rstrip())
+            self.shows[content_id] = ShowState(content_id, title)
+            # Spread the first polls over a few seconds.
+            self._schedule(content_id, self._random.uniform(0, 5 * self.jitter))
+
+    def run(self) -> None:
+        """Poll and download until `stop` is called."""
+
+        self._start_status_server()
+        worker = threading.Thread(target=self._work, name="vistopia-daemon")
+        worker.start()
+
+        if self.ids is None:
+            self._schedule(SUBSCRIPTIONS, 0)
+        else:
+            for content_id in self.ids:
+                self._watch(content_id)
+
+        try:
+            while not self._stopped.is_set():
+                if not self._due:
+                    self._stopped.wait(self.interval)
+                    continue
+                due, key = self._due[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._stopped.wait(wait)
+                    continue
+                heapq.heappop(self._due)
+                if key == SUBSCRIPTIONS:
+                    self.poll_subscriptions()
+                    self._schedule(SUBSCRIPTIONS, self._delay())
+                elif key in self.shows:
+                    self.poll_show(key)
+                    self._schedule(key, self._delay())
+        finally:
+            self._queue.put(None)
+            worker.join()
+            if self._httpd is not None:
+                self._httpd.shutdown()
+                self._httpd.server_close()
+
+    def stop(self) -> None:
+        """Make `run` return once the current poll and download finish."""
+        self._stopped.set()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued action has been carried out."""
+        return self._idle.wait(timeout)
+
+    # Polling
+
+    def _refresh(self, uri: str, method: str, *args) -> None:
+        """Make the next `method(*args)` call on the visitor check `uri`
+        with the server: the parsed record is dropped, and the cached
+        response, however fresh, costs a conditional request."""
+        clear_memo(self.visitor, method, *args)
+        if self.visitor.cache is not None:
+            self.visitor.cache.expire(uri)
+
+    def poll_subscriptions(self) -> None:
+        self._refresh("user/subscriptions-list", "get_user_subscriptions_list")
+        try:
+            subscriptions = self.visitor.get_user_subscriptions_list()
+        except Exception as e:
+            logger.warning(f"Polling subscriptions failed: {e}")
+            self.subscriptions_error = str(e)
+            return
+        self.subscriptions_error = None
+
+        subscribed = {item.content_id: item.title for item in subscriptions}
+        for content_id, title in subscribed.items():
+            self._watch(content_id, title)
+        dropped = set(self.shows) - set(subscribed)
+        for content_id in dropped:
+            logger.info(f"No longer watching show {content_id}")
+            del self.shows[content_id]
+            self._manifests.pop(content_id, None)
+        if dropped:
+            # Otherwise a show subscribed to again would be polled on its
+            # old schedule as well as on the new one.
+            self._due = [entry for entry in self._due if entry[1] not in dropped]
+            heapq.heapify(self._due)
+
+    def poll_show(self, content_id: int) -> None:
+        """Re-plan one show and queue its new or changed episodes."""
+
+        state = self.shows[content_id]
+        self._refresh(f"content/catalog/{content_id}", "get_catalog", content_id)
+        self._refresh(f"content/content-show/{content_id}", "get_content_show", content_id)
+        try:
+            actions = self.visitor.plan_sync(
+                [content_id], no_tag=self.no_tag, manifests=self._manifests,
+            )
+        except Exception as e:
+            logger.warning(f"Polling show {content_id} failed: {e}")
+            state.error = str(e)
+            return
+        finally:
+            state.last_poll = time.time()
+            self.polls += 1
+
+        state.error = None
+        with self._lock:
+            actions = [
+                action for action in actions
+                if action.article.article_id not in self._pending
+            ]
+            self._pending.update(action.article.article_id for action in actions)
+        if state.title is None and actions:
+            state.title = actions[0].catalog.title
+        if actions:
+            logger.info(f"Show {content_id}: {len(actions)} new or changed episodes")
+            state.queued += len(actions)
+            self._idle.clear()
+            self._queue.put(actions)
+
+    # Downloading
+
+    def _work(self) -> None:
+        while True:
+            actions = self._queue.get()
+            if actions is None:
+                self._idle.set()
+                return
+            try:
+                if self._stopped.is_set():
+                    # Batches queued behind the one running when `stop`
+                    # was called are left for the next run.
+                    logger.info(f"Stopping: skipped {len(actions)} queued episodes")
+                else:
+                    self._sync(actions)
+            finally:
+                with self._lock:
+                    self._pending.difference_update(
+                        action.article.article_id for action in actions
+                    )
+                if self._queue.empty():
+                    self._idle.set()
+
+    def _sync(self, actions: List[SyncAction]) -> None:
+        try:
+            stats = self.visitor.sync(actions, jobs=self.jobs)
+        except Exception as e:
+            logger.warning(f"Sync failed: {e}")
+            self.failed += len(actions)
+        else:
+            self.saved += stats.saved
+            self.failed += stats.failed
+            self.bytes += stats.bytes
+
+    # Status
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        transfers = self.visitor.scheduler.status(reset=False)
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "started": _isoformat(self._started),
+            "uptime": round(time.time() - self._started, 1),
+            "interval": self.interval,
+            "polls": self.polls,
+            "pending": pending,
+            "saved": self.saved,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "subscriptions_error": self.subscriptions_error,
+            "transfers": transfers._asdict(),
+            "shows": [state.status(now) for state in list(self.shows.values())],
+        }
+
+    @property
+    def status_url(self) -> Optional[str]:
+        if self._httpd is None or self.status_address is None:
+            return None
+        return f"http://{self.status_address[0]}:{self._httpd.server_port}/status"
+
+    def _start_status_server(self) -> None:
+        if self.status_address is None:
+            return
+        self._httpd = _StatusServer(self.status_address, _StatusHandler)
+        self._httpd.app = self
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        logger.info(f"Status at {self.status_url}")
+
+
+class _StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+    app: Daemon
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    server: _StatusServer
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/status"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.app.status(), ensure_ascii=False).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Status request: {format % args}")
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
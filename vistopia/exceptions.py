@@ -0,0 +1,30 @@
+from typing import Optional
+
+
+class VistopiaError(Exception):
+    """Base class for errors raised by this package."""
+
+
+class DownloadError(VistopiaError):
+    """A download ended before the expected number of bytes arrived."""
+
+
+class APIError(VistopiaError):
+    """The API answered with an error instead of a `success` payload."""
+
+    def __init__(self, uri: str, message: str,
+                 status_code: Optional[int] = None,
+                 payload: Optional[dict] = None):
+        super().__init__(f"{uri}: {message}")
+        self.uri = uri
+        self.message = message
+        self.status_code = status_code
+        self.payload = payload
+
+
+class ThrottledError(APIError):
+    """The API asked us to slow down (HTTP 429 or a rate-limit message)."""
+
+    def __init__(self, *args, retry_after: Optional[float] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
@@ -0,0 +1,254 @@
+"""Offline full-text search over cached metadata and saved transcripts.
+
+The index is an SQLite FTS5 table rebuilt from the catalogs and
+content-show records in the response cache, plus the text of transcript
+pages saved by `save-transcript`. It uses the trigram tokenizer where
+SQLite provides it, so that Chinese text matches on substrings without
+word segmentation; query terms shorter than three characters fall back
+to a substring scan.
+"""
+
+import re
+import sqlite3
+import threading
+from html.parser import HTMLParser
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .cache import ResponseCache
+
+logger = getLogger(__name__)
+
+SNIPPET_CHARS = 32
+
+
+class SearchHit(NamedTuple):
+    kind: str
+    content_id: int
+    article_id: Optional[str]
+    title: str
+    snippet: str
+
+
+class IndexDocument(NamedTuple):
+    kind: str
+    content_id: int
+    article_id: Optional[str]
+    title: str
+    body: str
+
+
+class _TextExtractor(HTMLParser):
+    _SKIP = {"script", "style", "head", "template", "noscript"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def html_text(html: str) -> str:
+    """Visible text of an HTML page, with whitespace collapsed.
+
+    >>> html_text("<html><head><style>p {}</style></head>"
+    ...           "<body><p>知识只求</p> <p>八分饱</p></body></html>")
+    '知识只求 八分饱'
+    """
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return re.sub(r"\s+", " ", " ".join(parser.parts)).strip()
+
+
+def _snippet(text: str, term: str, width: int = SNIPPET_CHARS) -> str:
+    """Text around the first occurrence of `term`, marked up like FTS5.
+
+    >>> _snippet("知识只求八分饱", "八分", width=4)
+    '...只求[八分]饱'
+    """
+    at = text.lower().find(term.lower())
+    if at < 0:
+        return text[:width * 2] + ("..." if len(text) > width * 2 else "")
+    start, end = max(0, at - width // 2), at + len(term)
+    stop = min(len(text), end + width // 2)
+    return (
+        ("..." if start else "") + text[start:at] + "[" + text[at:end] + "]"
+        + text[end:stop] + ("..." if stop < len(text) else "")
+    )
+
+
+def _content_id(uri: str) -> Optional[int]:
+    tail = uri.rstrip("/").rsplit("/", 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+def cached_documents(cache: ResponseCache,
+                     root: Optional[Path] = None) -> Iterable[IndexDocument]:
+    """Documents for every cached show and article.
+
+    If `root` is given, transcripts saved under `root` by `save-transcript`
+    are included as well.
+    """
+
+    from pathvalidate import sanitize_filename
+
+    shows: Dict[int, dict] = {}
+    for uri, data in cache.entries("content/content-show/"):
+        content_id = _content_id(uri)
+        if content_id is not None and isinstance(data, dict):
+            shows[content_id] = data
+
+    for uri, data in cache.entries("content/catalog/"):
+        content_id = _content_id(uri)
+        if content_id is None or not isinstance(data, dict):
+            continue
+        show = shows.pop(content_id, {})
+        title = data.get("title") or show.get("title") or ""
+        yield IndexDocument("show", content_id, None, title, _show_text(data, show))
+
+        show_dir = Path(root) / title if root is not None else None
+        for part in data.get("catalog") or []:
+            for article in part.get("part") or []:
+                article_id = str(article.get("article_id") or "")
+                article_title = article.get("title") or ""
+                yield IndexDocument(
+                    "article", content_id, article_id, article_title,
+                    " ".join(filter(None, [
+                        title, part.get("catalog_title"),
+                        article.get("share_desc"),
+                    ])),
+                )
+
+                if show_dir is None or not article_title:
+                    continue
+                fname = show_dir / "{}.html".format(
+                    sanitize_filename(article_title))
+                if fname.exists():
+                    yield IndexDocument(
+                        "transcript", content_id, article_id, article_title,
+                        html_text(fname.read_text(errors="replace")),
+                    )
+
+    for content_id, show in shows.items():
+        yield IndexDocument(
+            "show", content_id, None, show.get("title") or "",
+            _show_text({}, show),
+        )
+
+
+def _show_text(catalog: dict, show: dict) -> str:
+    values = [
+        catalog.get("author") or show.get("author"),
+        show.get("subtitle"),
+        show.get("share_desc"),
+        show.get("intro_txt"),
+    ]
+    introduction = show.get("introduction")
+    if introduction:
+        values.append(html_text(introduction))
+    return " ".join(value for value in values if isinstance(value, str))
+
+
+class SearchIndex:
+
+    def __init__(self, path):
+        path = Path(path)
+        if path.suffix != ".sqlite":
+            path.mkdir(parents=True, exist_ok=True)
+            path = path / "index.sqlite"
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self.trigram = self._create()
+
+    def _create(self) -> bool:
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                with self._db:
+                    self._db.execute(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS documents"
+                        " USING fts5(kind UNINDEXED, content_id UNINDEXED,"
+                        " article_id UNINDEXED, title, body,"
+                        f" tokenize='{tokenizer}')"
+                    )
+            except sqlite3.OperationalError:
+                logger.debug(f"SQLite has no {tokenizer} tokenizer")
+                continue
+            options = self._db.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'documents'"
+            ).fetchone()[0]
+            return "trigram" in options
+        raise RuntimeError("SQLite was built without FTS5")
+
+    def rebuild(self, documents: Iterable[IndexDocument]) -> int:
+        """Replace the whole index with `documents`; return their number."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM documents")
+            count = self._db.executemany(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, ?)", documents
+            ).rowcount
+            self._db.execute(
+                "INSERT INTO documents(documents) VALUES ('optimize')")
+        return count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def search(self, query: str, limit: int = 20) -> List[SearchHit]:
+        """Documents containing every whitespace-separated term of `query`."""
+
+        terms = query.split()
+        if not terms:
+            return []
+
+        if self.trigram and any(len(term) < 3 for term in terms):
+            return self._scan(terms, limit)
+
+        match = " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, content_id, article_id, title,"
+                " snippet(documents, 4, '[', ']', '...', 16)"
+                " FROM documents WHERE documents MATCH ?"
+                " ORDER BY rank LIMIT ?", (match, limit)
+            ).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def _scan(self, terms: List[str], limit: int) -> List[SearchHit]:
+        condition = " AND ".join(
+            "(title LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\')"
+            for _ in terms
+        )
+        params: list = []
+        for term in terms:
+            pattern = "%{}%".format(re.sub(r"([%_\\])", r"\\\1", term))
+            params += [pattern, pattern]
+
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT kind, content_id, article_id, title, body"
+                f" FROM documents WHERE {condition} LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [
+            SearchHit(kind, content_id, article_id, title, _snippet(body, terms[0]))
+            for kind, content_id, article_id, title, body in rows
+        ]
+
+    def close(self) -> None:
+        self._db.close()
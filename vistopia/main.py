@@ -1,34 +1,217 @@
-import json
 import logging
+from functools import partial
 from logging import getLogger
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
 import click
-from tabulate import tabulate
 from os import environ
+from pathlib import Path
 
-from .visitor import Visitor
-from .utils import range_expand
+from .selector import compile_selector
+from .utils import LazyJSON, parse_size
 from .__version__ import __version__
-from .models import dump_model
+
+if TYPE_CHECKING:
+    from .cache import ResponseCache
+    from .metrics import Instrumentation
+    from .visitor import Visitor
+
+# requests, pydantic and the API models, tabulate and pathvalidate are
+# imported by the commands that use them, so that `--help`, `--version`
+# and offline commands start quickly.
 
 logger = getLogger(__name__)
 
 
 class Context:
-    def __init__(self):
-        self.token: Optional[str] = None
-        self.visitor: Optional[Visitor] = None
+    """Options of the command group.
+
+    The response cache and the `Visitor` are created when a command
+    first uses them.
+    """
+
+    def __init__(self, token: Optional[str] = None,
+                 cache_dir: Optional[Path] = None, **settings):
+        self.token = token
+        self.cache_dir = cache_dir
+        self.settings = settings
+        self._cache: Optional["ResponseCache"] = None
+        self._visitor: Optional["Visitor"] = None
+
+    @property
+    def cache(self) -> Optional["ResponseCache"]:
+        if self._cache is None and self.cache_dir is not None:
+            from .cache import ResponseCache
+
+            self._cache = ResponseCache(self.cache_dir)
+        return self._cache
+
+    @property
+    def visitor(self) -> "Visitor":
+        if self._visitor is None:
+            from .cache import CoverCache
+            from .scheduler import Scheduler
+            from .visitor import API_BASE_URL, Visitor
+
+            settings = dict(self.settings)
+            self._visitor = Visitor(
+                token=self.token,
+                cache=self.cache,
+                covers=CoverCache(self.cache_dir / "covers")
+                if self.cache_dir is not None else None,
+                scheduler=Scheduler(**settings.pop("scheduler")),
+                base_url=environ.get("VISTOPIA_API_BASE_URL", API_BASE_URL),
+                **settings,
+            )
+        return self._visitor
+
+
+def content_id_options(func):
+    """Options selecting the shows a command works on."""
+    func = click.option(
+        "--all-subscriptions", is_flag=True, default=False,
+        help="Use every subscribed show.",
+    )(func)
+    func = click.option(
+        "--id", "ids", type=click.INT, multiple=True,
+        help="Content ID (repeatable).",
+    )(func)
+    return func
+
+
+def _parse_selector(ctx: click.Context, param, value: Optional[str]):
+    try:
+        return compile_selector(value) if value else None
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def episode_option(func):
+    """Option selecting the episodes of each show."""
+    return click.option(
+        "--episode-id", "episodes", callback=_parse_selector,
+        help=(
+            "Episodes to select, e.g. '1-3,4,8', '150-', 'latest:5', "
+            "'part:2', 'id:12345', 'unlistened' or 'latest:10+unlistened'."
+        ),
+    )(func)
+
+
+def _content_ids(visitor: "Visitor", argv: dict) -> List[int]:
+    ids = list(argv.pop("ids"))
+    if argv.pop("all_subscriptions"):
+        ids += [
+            item.content_id for item in visitor.get_user_subscriptions_list()
+            if item.content_id not in ids
+        ]
+    if not ids:
+        raise click.UsageError("Pass --id or --all-subscriptions.")
+    return ids
+
+
+def _parse_size(ctx: click.Context, param, value: Optional[str]) -> Optional[int]:
+    try:
+        return parse_size(value) if value else None
+    except ValueError:
+        raise click.BadParameter(f"invalid size {value!r}")
+
+
+def _instrumentation(ctx: click.Context, argv: dict) -> "Instrumentation":
+    """Metrics sinks for the options given; reports are written when
+    the command finishes."""
+
+    from .metrics import Aggregate, Instrumentation, JSONLines, format_number
+
+    metrics = Instrumentation()
+    stats, prom = argv.pop("stats"), argv.pop("metrics_prom")
+    jsonl = argv.pop("metrics_jsonl")
+
+    if jsonl:
+        fp = open(jsonl, "a", encoding="utf-8")
+        metrics.add_sink(JSONLines(fp))
+        ctx.call_on_close(fp.close)
+
+    if stats or prom:
+        aggregate = Aggregate()
+        metrics.add_sink(aggregate)
+
+        def _report():
+            if prom:
+                Path(prom).write_text(aggregate.prometheus() + "\n")
+            if stats:
+                _print_table(
+                    aggregate.breakdown(),
+                    headers=["Operation", "Count", "Total (s)",
+                             "Mean (ms)", "Max (ms)"],
+                    err=True,
+                )
+                for name, value in aggregate.totals().items():
+                    click.echo(f"{name}: {format_number(value)}", err=True)
+
+        ctx.call_on_close(_report)
 
+    return metrics
 
-# def _print_table(list):
-#     table = tabulate()
-#     click.echo(table)
+
+def _print_table(table, headers=(), err: bool = False) -> None:
+    from tabulate import tabulate
+
+    click.echo(tabulate(table, headers=headers), err=err)
 
 
 @click.group()
 @click.option("-t", "--token", help="API token.")
 @click.option("-v", "--verbosity", default="INFO", help="Logging level.")
+@click.option(
+    "--pool-size", type=click.IntRange(min=1), default=10,
+    help="Maximum number of keep-alive connections per host.",
+)
+@click.option(
+    "--timeout", type=click.FLOAT, default=30, help="HTTP timeout in seconds."
+)
+@click.option(
+    "--rate", type=click.FLOAT,
+    help="Maximum API requests per second (default: unlimited).",
+)
+@click.option(
+    "--burst", type=click.FLOAT, help="API requests allowed at once before --rate applies.",
+)
+@click.option(
+    "--limit-rate", callback=_parse_size,
+    help="Maximum total download speed in bytes/second, e.g. 500K or 2M.",
+)
+@click.option(
+    "--per-host", type=click.IntRange(min=1),
+    help="Maximum concurrent downloads from one host.",
+)
+@click.option(
+    "--newest-first", is_flag=True, default=False,
+    help="Download the newest episodes first.",
+)
+@click.option(
+    "--fast-parse", is_flag=True, default=False,
+    help="Only validate the catalog and search fields downloads need.",
+)
+@click.option(
+    "--cache-dir", type=click.Path(file_okay=False),
+    help="Directory for the persistent API response cache.",
+)
+@click.option(
+    "--no-cache", is_flag=True, default=False,
+    help="Do not read or write the API response cache.",
+)
+@click.option(
+    "--stats", is_flag=True, default=False,
+    help="Print where the time went when the command finishes.",
+)
+@click.option(
+    "--metrics-jsonl", type=click.Path(dir_okay=False),
+    help="Append every timing and counter to this file as JSON lines.",
+)
+@click.option(
+    "--metrics-prom", type=click.Path(dir_okay=False),
+    help="Write metric totals to this file in the Prometheus text format.",
+)
 @click.version_option(__version__)
 @click.pass_context
 def main(ctx: click.Context, **argv):
@@ -40,19 +223,57 @@ def main(ctx: click.Context, **argv):
     token = argv.get("token", None) or token
     logger.debug(f"API token `{token}` received.")
 
-    ctx.obj = Context()
-    ctx.obj.visitor = Visitor(token=token)
+    cache_dir = None
+    if not argv.pop("no_cache"):
+        from .cache import default_cache_dir
+
+        cache_dir = Path(argv.pop("cache_dir") or default_cache_dir())
+
+    ctx.obj = Context(
+        token=token,
+        cache_dir=cache_dir,
+        pool_size=argv.pop("pool_size"),
+        timeout=argv.pop("timeout"),
+        rate=argv.pop("rate"),
+        burst=argv.pop("burst"),
+        fast_parse=argv.pop("fast_parse"),
+        scheduler=dict(
+            bandwidth=argv.pop("limit_rate"),
+            per_host=argv.pop("per_host"),
+            newest_first=argv.pop("newest_first"),
+        ),
+        metrics=_instrumentation(ctx, argv),
+    )
 
 
 @main.command("search", help="搜索节目")
 @click.option(
     "--keyword", "-k", type=click.STRING, required=True, help="Search keyword."
 )
+@click.option(
+    "--local", is_flag=True, default=False,
+    help="Search the offline index built by `index` instead of the server.",
+)
+@click.option(
+    "--limit", type=click.IntRange(min=1), default=20,
+    help="Maximum number of local results.",
+)
 @click.pass_context
 def search(ctx: click.Context, **argv):
+    if argv.pop("local"):
+        from .index import SearchIndex
+
+        search_index = SearchIndex(_local_cache(ctx).path.parent)
+        table = [
+            (hit.content_id, hit.article_id or "", hit.title, hit.snippet)
+            for hit in search_index.search(argv.pop("keyword"), limit=argv.pop("limit"))
+        ]
+        _print_table(table)
+        return
+
     visitor: Visitor = ctx.obj.visitor
     search_result_list = visitor.search(argv.pop("keyword"))
-    logger.debug(json.dumps([dump_model(item) for item in search_result_list], indent=2, ensure_ascii=False))
+    logger.debug("%s", LazyJSON(lambda: search_result_list))
 
     table = []
     for item in search_result_list:
@@ -60,14 +281,36 @@ def search(ctx: click.Context, **argv):
             continue
         author = item.author
         if item.subtitle:
-            title = "%s: %s" % ([item.title, item.subtitle])
+            title = "%s: %s" % (item.title, item.subtitle)
         else:
             title = item.title
         desc = item.share_desc
         content_id = item.id
         table.append((content_id, author, title, desc))
 
-    click.echo(tabulate(table))
+    _print_table(table)
+
+
+def _local_cache(ctx: click.Context) -> "ResponseCache":
+    cache = ctx.obj.cache
+    if cache is None:
+        raise click.UsageError("The local index is built from the cache; do not pass --no-cache.")
+    return cache
+
+
+@main.command("index", help="为已缓存的节目信息和已保存的文稿建立本地搜索索引")
+@click.option(
+    "--root", type=click.Path(file_okay=False), default=".",
+    help="Directory that shows and transcripts were saved to.",
+)
+@click.pass_context
+def index(ctx: click.Context, **argv):
+    from .index import SearchIndex, cached_documents
+
+    cache = _local_cache(ctx)
+    search_index = SearchIndex(cache.path.parent)
+    count = search_index.rebuild(cached_documents(cache, Path(argv.pop("root"))))
+    click.echo(f"Indexed {count} documents into {search_index.path}")
 
 
 @main.command("subscriptions", help="列出所有已订阅节目")
@@ -75,78 +318,323 @@ def search(ctx: click.Context, **argv):
 def subscriptions(ctx: click.Context):
     visitor: Visitor = ctx.obj.visitor
 
-    logger.debug(visitor.get_user_subscriptions_list())
+    subscriptions = visitor.get_user_subscriptions_list()
+    logger.debug("%s", LazyJSON(lambda: subscriptions))
 
     table = []
-    for show in visitor.get_user_subscriptions_list():
-        title = ": ".join([show.title, show.subtitle])
+    for show in subscriptions:
+        title = ": ".join(filter(None, [show.title, show.subtitle]))
         content_id = show.content_id
         table.append((content_id, title))
 
-    click.echo(tabulate(table))
+    _print_table(table)
 
 
 @main.command("show-content", help="节目章节信息")
-@click.option("--id", type=click.INT, required=True)
+@content_id_options
 @click.pass_context
 def show_content(ctx: click.Context, **argv):
     visitor: Visitor = ctx.obj.visitor
 
-    content_id = argv.pop("id")
-    logger.debug(visitor.get_content_show(content_id))
-    logger.debug(
-        json.dumps(dump_model(visitor.get_catalog(content_id)), indent=2, ensure_ascii=False)
-    )
+    content_ids = _content_ids(visitor, argv)
+    visitor.prefetch(content_ids, series=logger.isEnabledFor(logging.DEBUG))
 
-    catalog = visitor.get_catalog(content_id)
-
-    click.echo(f"{catalog.title}")
-    click.echo()
-    click.echo(f"艺人: {catalog.author}")
-    click.echo(f"类型: {catalog.type}")
-    click.echo()
-
-    for part in catalog.catalog:
-        click.echo(f"{part.catalog_number}  {part.catalog_title}")
-        table = []
-        for article in part.part:
-            table.append(
-                (
-                    article.sort_number,
-                    # article["article_id"],
-                    article.title,
-                    article.duration_str,
+    for content_id in content_ids:
+        catalog = visitor.get_catalog(content_id)
+        logger.debug(
+            "%s", LazyJSON(partial(visitor.get_content_show, content_id))
+        )
+        logger.debug("%s", LazyJSON(lambda: catalog))
+
+        click.echo(f"{catalog.title}")
+        click.echo()
+        click.echo(f"艺人: {catalog.author}")
+        click.echo(f"类型: {catalog.type}")
+        click.echo()
+
+        for part in catalog.catalog:
+            click.echo(f"{part.catalog_number}  {part.catalog_title}")
+            table = []
+            for article in part.part:
+                table.append(
+                    (
+                        article.sort_number,
+                        # article["article_id"],
+                        article.title,
+                        article.duration_str,
+                    )
                 )
-            )
-        click.echo(tabulate(table))
+            _print_table(table)
 
 
 @main.command("save-show", help="保存节目至本地，并添加封面和 ID3 信息")
-@click.option("--id", type=click.INT, required=True)
+@content_id_options
 @click.option("--no-tag", is_flag=True, default=False, help="Do not add IDv3 tags.")
-@click.option("--episode-id", help="Episode ID in the form '1-3,4,8'")
+@episode_option
+@click.option(
+    "--jobs", "-j", type=click.IntRange(min=1), default=1,
+    help="Number of episodes to download in parallel (across all shows).",
+)
+@click.option(
+    "--stream", is_flag=True, default=False,
+    help="Start downloading while very large catalogs are still being received.",
+)
 @click.pass_context
 def save_show(ctx: click.Context, **argv):
-    content_id = argv.pop("id")
-    episode_id = argv.pop("episode_id", None)
-    episodes = set(range_expand(episode_id) if episode_id else [])
+    visitor: Visitor = ctx.obj.visitor
+    content_ids = _content_ids(visitor, argv)
+    episodes = argv.pop("episodes")
+    stream = argv.pop("stream")
+
+    if not stream:
+        visitor.prefetch(content_ids)
+        for content_id in content_ids:
+            logger.debug("%s", LazyJSON(partial(visitor.get_catalog, content_id)))
 
-    logger.debug(
-        json.dumps(
-            dump_model(ctx.obj.visitor.get_catalog(content_id)), indent=2, ensure_ascii=False
+    stats = visitor.save_shows(
+        content_ids,
+        no_tag=argv.pop("no_tag"),
+        episodes=episodes,
+        jobs=argv.pop("jobs"),
+        stream=stream,
+    )
+    if stats.failed:
+        ctx.exit(1)
+
+
+@main.command("retag-show", help="为已下载的节目重新添加封面和 ID3 信息")
+@click.option("--id", type=click.INT, required=True)
+@click.option("--no-cover", is_flag=True, default=False, help="Do not embed cover art.")
+@episode_option
+@click.option(
+    "--jobs", "-j", type=click.IntRange(min=1), default=1,
+    help="Number of files to tag in parallel.",
+)
+@click.pass_context
+def retag_show(ctx: click.Context, **argv):
+    episodes = argv.pop("episodes")
+
+    ctx.obj.visitor.retag_show(
+        argv.pop("id"),
+        episodes=episodes,
+        no_cover=argv.pop("no_cover"),
+        jobs=argv.pop("jobs"),
+    )
+
+
+@main.command("sync", help="同步已订阅节目，仅下载新增或变更的单集")
+@click.option(
+    "--id", "ids", type=click.INT, multiple=True,
+    help="Content ID to sync (repeatable; default: all subscriptions).",
+)
+@click.option("--no-tag", is_flag=True, default=False, help="Do not add IDv3 tags.")
+@click.option(
+    "--jobs", "-j", type=click.IntRange(min=1), default=1,
+    help="Number of episodes to download in parallel.",
+)
+@click.option(
+    "--dry-run", is_flag=True, default=False,
+    help="Only print the planned work and its total size.",
+)
+@click.pass_context
+def sync(ctx: click.Context, **argv):
+    visitor: Visitor = ctx.obj.visitor
+
+    actions = visitor.plan_sync(
+        argv.pop("ids") or None, no_tag=argv.pop("no_tag")
+    )
+
+    if not argv.pop("dry_run"):
+        stats = visitor.sync(actions, jobs=argv.pop("jobs"))
+        click.echo(stats.summary())
+        if stats.failed:
+            ctx.exit(1)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=argv.pop("jobs")) as executor:
+        sizes = list(executor.map(partial(_download_size, visitor), actions))
+
+    table = []
+    for action, size in zip(actions, sizes):
+        if action.download:
+            todo = "download"
+        elif action.retag:
+            todo = "retag"
+        else:
+            todo = "record"
+        table.append((
+            action.catalog.title, action.article.sort_number,
+            action.article.title, todo, size,
+        ))
+    _print_table(table)
+
+    total = sum(size or 0 for size in sizes)
+    click.echo(f"{len(actions)} articles, {total / 1024 / 1024:.1f} MB to download")
+
+
+def _download_size(visitor: "Visitor", action) -> Optional[int]:
+    """Bytes an action will download; `None` if the server cannot tell."""
+    if not action.download:
+        return 0
+
+    from requests import RequestException
+
+    try:
+        return visitor.content_length(action.article.media_key_full_url)
+    except RequestException as e:
+        logger.warning(f"Could not get the size of {action.article.title}: {e}")
+        return None
+
+
+@main.command("verify", help="校验已下载的单集，并重新下载损坏的文件")
+@click.option(
+    "--id", "ids", type=click.INT, multiple=True,
+    help="Content ID to verify (repeatable; default: all subscriptions).",
+)
+@click.option(
+    "--jobs", "-j", type=click.IntRange(min=1),
+    help="Number of hashing processes (default: one per CPU) and of parallel re-downloads.",
+)
+@click.option(
+    "--no-remote", is_flag=True, default=False,
+    help="Do not compare file sizes with the server.",
+)
+@click.option("--no-tag", is_flag=True, default=False, help="Do not add IDv3 tags to re-downloaded files.")
+@click.option(
+    "--dry-run", is_flag=True, default=False,
+    help="Only report bad files, do not download them again.",
+)
+@click.pass_context
+def verify(ctx: click.Context, **argv):
+    visitor: Visitor = ctx.obj.visitor
+    jobs = argv.pop("jobs")
+
+    results = visitor.verify(
+        argv.pop("ids") or None, jobs=jobs, remote=not argv.pop("no_remote")
+    )
+    bad = [result for result in results if result.problems]
+
+    table = [
+        (
+            result.action.catalog.title, result.action.article.sort_number,
+            result.action.article.title, "; ".join(result.problems),
         )
+        for result in bad
+    ]
+    if table:
+        _print_table(table)
+    click.echo(f"{len(results)} files checked, {len(bad)} bad")
+
+    if not bad:
+        return
+    if argv.pop("dry_run"):
+        ctx.exit(1)
+
+    stats = visitor.repair(bad, jobs=jobs or 1, no_tag=argv.pop("no_tag"))
+    click.echo(stats.summary())
+    if stats.failed:
+        ctx.exit(1)
+
+
+@main.command("daemon", help="常驻运行，定时检查订阅节目并自动下载新单集")
+@click.option(
+    "--id", "ids", type=click.INT, multiple=True,
+    help="Content ID to watch (repeatable; default: all subscriptions).",
+)
+@click.option(
+    "--interval", type=click.FloatRange(min=1), default=900,
+    help="Seconds between two polls of a show.",
+)
+@click.option(
+    "--jitter", type=click.FloatRange(min=0, max=0.9), default=0.2,
+    help="Random spread of the poll interval, as a fraction of it.",
+)
+@click.option("--no-tag", is_flag=True, default=False, help="Do not add IDv3 tags.")
+@click.option(
+    "--jobs", "-j", type=click.IntRange(min=1), default=1,
+    help="Number of episodes to download in parallel.",
+)
+@click.option(
+    "--status-host", default="127.0.0.1", show_default=True,
+    help="Address of the JSON status endpoint.",
+)
+@click.option(
+    "--status-port", type=click.IntRange(min=0), default=8648, show_default=True,
+    help="Port of the JSON status endpoint (0: any free port).",
+)
+@click.option(
+    "--no-status", is_flag=True, default=False,
+    help="Do not serve the status endpoint.",
+)
+@click.pass_context
+def daemon(ctx: click.Context, **argv):
+    import signal
+
+    from .daemon import Daemon
+
+    status_address = None if argv.pop("no_status") else \
+        (argv.pop("status_host"), argv.pop("status_port"))
+    watcher = Daemon(
+        ctx.obj.visitor,
+        ids=argv.pop("ids") or None,
+        interval=argv.pop("interval"),
+        jitter=argv.pop("jitter"),
+        jobs=argv.pop("jobs"),
+        no_tag=argv.pop("no_tag"),
+        status_address=status_address,
     )
 
-    ctx.obj.visitor.save_show(
-        content_id,
+    def _stop(signum, frame):
+        logger.info("Stopping after the current downloads")
+        watcher.stop()
+
+    handlers = {
+        signum: signal.signal(signum, _stop)
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+        watcher.run()
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+
+@main.command("serve", help="在局域网内共享当前目录的节目库与缓存的节目信息")
+@click.option(
+    "--host", default="127.0.0.1", show_default=True,
+    help="Address to listen on (0.0.0.0: every interface).",
+)
+@click.option("--port", type=click.IntRange(min=0), default=8649, show_default=True)
+@click.option(
+    "--no-fetch", is_flag=True, default=False,
+    help="Only serve episodes already in the library.",
+)
+@click.option("--no-tag", is_flag=True, default=False, help="Do not add IDv3 tags to fetched episodes.")
+@click.pass_context
+def serve(ctx: click.Context, **argv):
+    from .server import LibraryServer
+
+    server = LibraryServer(
+        ctx.obj.visitor,
+        host=argv.pop("host"),
+        port=argv.pop("port"),
+        fetch=not argv.pop("no_fetch"),
         no_tag=argv.pop("no_tag"),
-        episodes=episodes,
     )
+    click.echo(f"Serving {Path.cwd()} at {server.url()}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
 
 
 @main.command("save-transcript", help="保存节目文稿至本地")
-@click.option("--id", type=click.INT, required=True)
-@click.option("--episode-id", help="Episode ID in the form '1-3,4,8'")
+@content_id_options
+@episode_option
 @click.option(
     "--single-file-exec-path",
     type=click.Path(),
@@ -157,29 +645,58 @@ def save_show(ctx: click.Context, **argv):
     type=click.Path(),
     help=("Path to the browser cookie file " "(only needed in single-file mode)"),
 )
+@click.option(
+    "--jobs", "-j", type=click.IntRange(min=1), default=1,
+    help="Number of transcripts to download (or SingleFile runs) in parallel.",
+)
+@click.option(
+    "--single-file-timeout", type=click.FLOAT,
+    help="Seconds after which a SingleFile run is killed.",
+)
+@click.option(
+    "--single-file-retries", type=click.IntRange(min=0), default=1,
+    help="Times to retry a failed SingleFile run.",
+)
+@click.option(
+    "--local-css", is_flag=True, default=False,
+    help="Save the shared stylesheet once into the show directory.",
+)
 @click.pass_context
 def save_transcript(ctx: click.Context, **argv):
-    content_id = argv.pop("id")
-    episode_id = argv.pop("episode_id", None)
+    visitor: Visitor = ctx.obj.visitor
+    content_ids = _content_ids(visitor, argv)
+    episodes = argv.pop("episodes")
     single_file_exec_path = argv.pop("single_file_exec_path")
     cookie_file_path = argv.pop("cookie_file_path")
-    episodes = set(range_expand(episode_id) if episode_id else [])
 
-    logger.debug(
-        json.dumps(
-            dump_model(ctx.obj.visitor.get_catalog(content_id)), indent=2, ensure_ascii=False
-        )
-    )
+    visitor.prefetch(content_ids, series=False)
+    for content_id in content_ids:
+        logger.debug("%s", LazyJSON(partial(visitor.get_catalog, content_id)))
 
     if single_file_exec_path and cookie_file_path:
-        ctx.obj.visitor.save_transcript_with_single_file(
-            content_id,
+        results = visitor.save_transcripts_with_single_file(
+            content_ids,
             episodes=episodes,
             single_file_exec_path=single_file_exec_path,
             cookie_file_path=cookie_file_path,
+            jobs=argv.pop("jobs"),
+            timeout=argv.pop("single_file_timeout"),
+            retries=argv.pop("single_file_retries"),
         )
+        from .singlefile import failure_report
+
+        click.echo(failure_report(results), err=True)
+        if not all(result.ok for result in results):
+            ctx.exit(1)
     else:
-        ctx.obj.visitor.save_transcript(content_id, episodes=episodes)
+        stats = visitor.save_transcripts(
+            content_ids,
+            episodes=episodes,
+            jobs=argv.pop("jobs"),
+            local_css=argv.pop("local_css"),
+        )
+        if stats.failed:
+            ctx.exit(1)
 
 
 if __name__ == "__main__":
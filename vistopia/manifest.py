@@ -0,0 +1,90 @@
+"""Per-show manifest of downloaded episodes.
+
+Each show directory keeps a small JSON file recording, for every article
+that has been downloaded, the media URL it came from, the file size and
+SHA-256 checksums (of the whole file and of its audio alone), and a
+signature of the ID3 tags written to it. `sync`
+diffs a fresh catalog against it to find new or changed articles without
+re-reading existing files.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from .models import VistopiaModel, dump_model, validate_model
+
+MANIFEST_NAME = ".vistopia-manifest.json"
+
+
+class ManifestEntry(VistopiaModel):
+    """Local state of one downloaded article."""
+    article_id: str
+    sort_number: str
+    title: str
+    file: str
+    media_url: Optional[str] = None
+    size: int
+    sha256: str
+    audio_sha256: Optional[str] = None
+    tags: Optional[str] = None
+
+
+class Manifest(VistopiaModel):
+    """Contents of a show's manifest file."""
+    content_id: int
+    articles: Dict[str, ManifestEntry] = {}
+
+
+def sha256sum(fname, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(fname, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tag_signature(*values) -> str:
+    """Short digest of the values written into a file's tags.
+
+    >>> tag_signature("a", "b") == tag_signature("a", "b")
+    True
+    >>> tag_signature("a", "b") == tag_signature("a", "c")
+    False
+    """
+    text = "\0".join("" if value is None else str(value) for value in values)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+class ShowManifest:
+    """Thread-safe handle on the manifest file of one show directory."""
+
+    def __init__(self, show_dir, content_id: int):
+        self.show_dir = Path(show_dir)
+        self.path = self.show_dir / MANIFEST_NAME
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            with open(self.path, encoding="utf8") as fp:
+                self.manifest = validate_model(Manifest, json.load(fp))
+        else:
+            self.manifest = Manifest(content_id=content_id)
+
+    def get(self, article_id: str) -> Optional[ManifestEntry]:
+        return self.manifest.articles.get(article_id)
+
+    def record(self, entry: ManifestEntry) -> None:
+        with self._lock:
+            self.manifest.articles[entry.article_id] = entry
+
+    def save(self) -> None:
+        """Atomically write the manifest back to the show directory."""
+        with self._lock:
+            payload = dump_model(self.manifest)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf8") as fp:
+            json.dump(payload, fp, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,206 @@
+"""Instrumentation of `Visitor` operations.
+
+`Instrumentation` is the hook a `Visitor` reports to: every operation
+(API request, JSON parsing, model validation, download, tagging, cover
+fetch) is timed, and bytes transferred and cache hits and misses are
+counted. Each measurement is passed as an `Event` to any number of
+sinks, which are plain callables; `Aggregate` sums events up for a
+per-phase breakdown or the Prometheus text format, and `JSONLines`
+writes them out one per line as they happen.
+"""
+
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    IO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Event(NamedTuple):
+    name: str
+    kind: str           # "timing" (value in seconds) or "counter"
+    value: float
+    labels: Dict[str, str]
+    time: float
+
+
+Sink = Callable[[Event], None]
+
+
+def endpoint(uri: str) -> str:
+    """API endpoint of a URI, with ids replaced by a placeholder.
+
+    >>> endpoint("content/catalog/11")
+    'content/catalog/{id}'
+    """
+    return re.sub(r"/\d+(?=/|$)", "/{id}", uri)
+
+
+class Instrumentation:
+    """Hook that times operations and counts events for its sinks."""
+
+    def __init__(self, sinks: Optional[List[Sink]] = None):
+        self.sinks: List[Sink] = list(sinks or [])
+
+    def add_sink(self, sink: Sink) -> None:
+        self.sinks.append(sink)
+
+    def emit(self, name: str, kind: str, value: float, **labels) -> None:
+        if not self.sinks:
+            return
+        event = Event(name, kind, value, labels, time.time())
+        for sink in self.sinks:
+            sink(event)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Time the enclosed block as operation `name`.
+
+        Failed operations are recorded too, with an `error` label.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.emit(name, "timing", time.perf_counter() - start,
+                      error=type(e).__name__, **labels)
+            raise
+        self.emit(name, "timing", time.perf_counter() - start, **labels)
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        self.emit(name, "counter", value, **labels)
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class Aggregate:
+    """Sink keeping running totals per event name and labels."""
+
+    def __init__(self):
+        self.timings: Dict[Tuple[str, Labels], _Timing] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        key = (event.name, tuple(sorted(event.labels.items())))
+        with self._lock:
+            if event.kind == "timing":
+                timing = self.timings.get(key)
+                if timing is None:
+                    timing = self.timings[key] = _Timing()
+                timing.count += 1
+                timing.total += event.value
+                timing.max = max(timing.max, event.value)
+            else:
+                self.counters[key] = self.counters.get(key, 0) + event.value
+
+    def breakdown(self) -> List[tuple]:
+        """`(operation, count, total seconds, mean ms, max ms)` per
+        operation name, slowest in total first."""
+        phases: Dict[str, _Timing] = {}
+        with self._lock:
+            for (name, _), timing in self.timings.items():
+                phase = phases.setdefault(name, _Timing())
+                phase.count += timing.count
+                phase.total += timing.total
+                phase.max = max(phase.max, timing.max)
+        rows = [
+            (name, phase.count, round(phase.total, 3),
+             round(phase.total / phase.count * 1000, 1),
+             round(phase.max * 1000, 1))
+            for name, phase in phases.items()
+        ]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def totals(self) -> Dict[str, float]:
+        """Counter totals per name, across labels."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for (name, _), value in self.counters.items():
+                totals[name] = totals.get(name, 0) + value
+        return dict(sorted(totals.items()))
+
+    def prometheus(self, prefix: str = "vistopia") -> str:
+        """All totals in the Prometheus text exposition format.
+
+        >>> aggregate = Aggregate()
+        >>> aggregate(Event("cache.hit", "counter", 2, {"endpoint": "search/web"}, 0))
+        >>> print(aggregate.prometheus())
+        # TYPE vistopia_cache_hit_total counter
+        vistopia_cache_hit_total{endpoint="search/web"} 2
+        """
+        lines = []
+        with self._lock:
+            timings = sorted(self.timings.items())
+            counters = sorted(self.counters.items())
+
+        seen = set()
+        for (name, labels), timing in timings:
+            metric = f"{prefix}_{_metric_name(name)}_seconds"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count{_labels(labels)} {timing.count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {timing.total:.6f}")
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {format_number(value)}")
+        return "\n".join(lines)
+
+
+def format_number(value: float) -> str:
+    """A counter value as text: whole numbers exactly, however large,
+    and fractions as `%g` would.
+
+    >>> format_number(123456789.0), format_number(2), format_number(0.25)
+    ('123456789', '2', '0.25')
+    """
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:g}"
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            _metric_name(key),
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class JSONLines:
+    """Sink writing each event as one JSON object per line."""
+
+    def __init__(self, fp: IO[str]):
+        self.fp = fp
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        line = json.dumps(event._asdict(), ensure_ascii=False)
+        with self._lock:
+            self.fp.write(line + "\n")
+            self.fp.flush()
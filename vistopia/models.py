@@ -12,9 +12,11 @@ Relevant endpoints:
 - user/subscriptions-list
 """
 
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .selector import EpisodeSpec, as_selector, sort_number
 
 
 if hasattr(BaseModel, "model_config"):
@@ -89,8 +91,90 @@ class CatalogPart(VistopiaModel):
     part: List[Article]
 
 
-class Catalog(VistopiaModel):
+class CatalogIndex:
+    """Lookups over the articles of a catalog, computed once."""
+
+    def __init__(self, catalog):
+        self.articles: List[Any] = []
+        self.sort_numbers: Dict[str, Optional[int]] = {}
+        self.by_sort_number: Dict[int, Any] = {}
+        self.by_article_id: Dict[str, Any] = {}
+        self.part_of: Dict[str, Any] = {}
+        self.parts: List[Any] = list(catalog.catalog)
+        self._ranked: Optional[List[Any]] = None
+
+        for part in self.parts:
+            for article in part.part:
+                number = sort_number(article.sort_number)
+                self.articles.append(article)
+                self.sort_numbers[article.article_id] = number
+                self.by_article_id[article.article_id] = article
+                self.part_of[article.article_id] = part
+                if number is not None:
+                    self.by_sort_number.setdefault(number, article)
+
+    def sort_number(self, article) -> Optional[int]:
+        return self.sort_numbers.get(article.article_id)
+
+    def ranked(self) -> List[Any]:
+        """Articles with a numeric sort number, lowest first."""
+        if self._ranked is None:
+            numbers = self.sort_numbers
+            self._ranked = sorted(
+                (a for a in self.articles if numbers[a.article_id] is not None),
+                key=lambda a: numbers[a.article_id] or 0,
+            )
+        return self._ranked
+
+    def part(self, key: str) -> List[Any]:
+        """Articles of the part with catalog number `key`, else of the
+        `key`-th part, else of the part titled `key`."""
+        for part in self.parts:
+            if part.catalog_number is not None \
+                    and str(part.catalog_number) == key:
+                return part.part
+        if key.isdigit() and 1 <= int(key) <= len(self.parts):
+            return self.parts[int(key) - 1].part
+        for part in self.parts:
+            if part.catalog_title == key:
+                return part.part
+        return []
+
+
+class CatalogLookups:
+    """Article lookups shared by `Catalog` and `LeanCatalog`."""
+
+    _index: Optional[CatalogIndex]
+
+    def index(self) -> CatalogIndex:
+        if self._index is None:
+            self._index = CatalogIndex(self)
+        return self._index
+
+    def articles(self) -> List[Any]:
+        return self.index().articles
+
+    def article(self, article_id: str):
+        return self.index().by_article_id.get(str(article_id))
+
+    def by_sort_number(self, number: int):
+        return self.index().by_sort_number.get(int(number))
+
+    def part_of(self, article_id: str):
+        return self.index().part_of.get(str(article_id))
+
+    def select(self, episodes: EpisodeSpec = None) -> List[Any]:
+        """Articles chosen by a selector (see `vistopia.selector`), a
+        collection of sort numbers, or everything if `episodes` is empty."""
+        selector = as_selector(episodes)
+        if selector is None:
+            return list(self.articles())
+        return selector.select(self)
+
+
+class Catalog(CatalogLookups, VistopiaModel):
     """Response data model for `content/catalog/{id}`."""
+    _index: Optional[CatalogIndex] = PrivateAttr(default=None)
     id: Optional[int] = None
     author: str
     title: str
@@ -279,3 +363,130 @@ def dump_model(model):
     if hasattr(model, "model_dump"):
         return model.model_dump()
     return model.dict()
+
+
+class LeanRecord:
+    """Compact stand-in for a model that only extracts a few hot fields.
+
+    Only the attributes named in `__slots__` are read from the raw payload,
+    with a presence check for `required` ones and a conversion for those
+    listed in `converters`. Touching any other attribute validates the
+    whole payload into `model_cls` once and delegates to the result, so a
+    lean record can be used wherever the full model is expected.
+    Slots starting with an underscore hold private state; they start out
+    as `None` and are left out of the `repr`.
+    """
+
+    __slots__ = ("_raw", "_full")
+
+    model_cls: Any = None
+    required: Tuple[str, ...] = ()
+    converters: Dict[str, Callable[[Any], Any]] = {}
+
+    def __init__(self, raw: dict):
+        self._raw = raw
+        self._full = None
+        converters = self.converters
+        for name in self.__slots__:
+            value = raw.get(name)
+            if value is None:
+                if name in self.required:
+                    raise ValueError(
+                        f"{type(self).__name__}: field {name!r} is required"
+                    )
+            elif name in converters:
+                value = converters[name](value)
+            setattr(self, name, value)
+
+    def full(self):
+        """The fully validated model, built on first use."""
+        if self._full is None:
+            self._full = validate_model(self.model_cls, self._raw)
+        return self._full
+
+    def __getattr__(self, name):
+        # Only reached for names that are not slots.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.full(), name)
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__
+            if not name.startswith("_")
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+def _lean_list(record_cls):
+    return lambda items: [record_cls(item) for item in items]
+
+
+class LeanArticle(LeanRecord):
+    """Lean `Article` with the fields needed to select, download and tag it."""
+
+    __slots__ = (
+        "article_id", "sort_number", "title", "duration_str",
+        "media_key_full_url", "content_url", "is_listened",
+    )
+    model_cls = Article
+    required = ("article_id", "sort_number", "title")
+
+
+class LeanCatalogPart(LeanRecord):
+    """Lean `CatalogPart`."""
+
+    __slots__ = ("catalog_number", "catalog_title", "part")
+    model_cls = CatalogPart
+    required = ("part",)
+    converters = {"part": _lean_list(LeanArticle)}
+
+
+class LeanCatalog(CatalogLookups, LeanRecord):
+    """Lean `Catalog`."""
+
+    __slots__ = ("author", "title", "type", "background_img", "catalog", "_index")
+    model_cls = Catalog
+    required = ("author", "title", "type", "catalog")
+    converters = {"catalog": _lean_list(LeanCatalogPart)}
+
+
+class LeanSearchItem(LeanRecord):
+    """Lean `SearchItem` with the columns shown by `vistopian search`."""
+
+    __slots__ = ("id", "title", "subtitle", "author", "share_desc", "data_type")
+    model_cls = SearchItem
+    required = ("id", "title")
+    converters = {"id": int}
+
+
+class LeanSearchResult(LeanRecord):
+    """Lean `SearchResult` page."""
+
+    __slots__ = ("current_page", "last_page", "next_page_url", "data")
+    model_cls = SearchResult
+    required = ("data",)
+    converters = {
+        "current_page": int,
+        "last_page": int,
+        "data": _lean_list(LeanSearchItem),
+    }
+
+
+LEAN_MODELS: Dict[Any, Any] = {
+    Article: LeanArticle,
+    CatalogPart: LeanCatalogPart,
+    Catalog: LeanCatalog,
+    SearchItem: LeanSearchItem,
+    SearchResult: LeanSearchResult,
+}
+
+
+def parse_model(model_cls, payload, fast: bool = False):
+    """Validate `payload` into `model_cls`, or into its lean record if `fast`.
+
+    Models without a lean record are always fully validated.
+    """
+    if fast and model_cls in LEAN_MODELS:
+        return LEAN_MODELS[model_cls](payload)
+    return validate_model(model_cls, payload)
@@ -0,0 +1,98 @@
+"""Client-side rate limiting."""
+
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket shared by any number of threads or coroutines.
+
+    Up to `burst` requests may be made at once; after that requests are
+    spaced out to `rate` per second. A `rate` of `None` disables the
+    limit. Callers reserve a token and then sleep until it is due, so the
+    bucket itself is never held while waiting.
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[float] = None,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take `tokens` and return how many seconds to wait before use.
+
+        >>> bucket = TokenBucket(rate=2, burst=2, clock=lambda: 0.0)
+        >>> [bucket.reserve() for _ in range(4)]
+        [0.0, 0.0, 0.5, 1.0]
+        """
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = self._clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1) -> None:
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        import asyncio
+
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Token bucket that backs off when the server pushes back.
+
+    Each `throttle()` halves the rate (starting from `fallback_rate` when
+    unlimited) down to `min_rate`; each `success()` adds `increase`
+    requests/second back until `max_rate` is reached again.
+
+    >>> limiter = AdaptiveRateLimiter(rate=8, clock=lambda: 0.0)
+    >>> limiter.throttle(); limiter.rate
+    4.0
+    >>> for _ in range(50): limiter.success()
+    >>> limiter.rate
+    8
+    """
+
+    def __init__(self, rate: Optional[float] = None,
+                 burst: Optional[float] = None,
+                 min_rate: float = 0.2, fallback_rate: float = 4.0,
+                 increase: float = 0.1, clock=time.monotonic):
+        super().__init__(rate, burst, clock=clock)
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.fallback_rate = fallback_rate
+        self.increase = increase
+
+    def throttle(self) -> None:
+        with self._lock:
+            current = self.rate or self.fallback_rate
+            self.rate = max(self.min_rate, current / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+    def success(self) -> None:
+        with self._lock:
+            if self.rate is None or self.rate == self.max_rate:
+                return
+            rate = self.rate + self.increase
+            if self.max_rate is not None and rate >= self.max_rate:
+                self.rate = self.max_rate
+            elif self.max_rate is None and rate >= 4 * self.fallback_rate:
+                self.rate = None
+            else:
+                self.rate = rate
@@ -0,0 +1,263 @@
+"""Scheduling of downloads: priorities, bandwidth and connection limits.
+
+A `Scheduler` is shared by every batch a `Visitor` runs, so limits hold
+across shows and across batches started from different threads:
+
+* all transfers together stay under one bytes/second cap;
+* each host gets at most `per_host` concurrent transfers, and when a
+  slot frees up it goes to the waiting transfer with the best priority;
+* within a batch, queued tasks start in priority order.
+
+Priorities are tuples compared in ascending order; `Scheduler.priority`
+builds the ones used by the downloader.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from logging import getLogger
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional,
+    Tuple,
+)
+from urllib.parse import urlsplit
+
+from .ratelimit import TokenBucket
+from .selector import sort_number as numeric_sort_number
+from .utils import TransferStats
+
+logger = getLogger(__name__)
+
+TRANSCRIPT = 0
+AUDIO = 1
+
+
+class Task(NamedTuple):
+    label: str
+    run: Callable[[], Optional[int]]
+    priority: Any = (AUDIO, 0)
+
+
+class SchedulerStatus(NamedTuple):
+    queued: int
+    waiting: int
+    active: int
+    bytes: int
+    rate: float
+
+    def summary(self) -> str:
+        return (
+            f"{self.queued} queued, {self.waiting} waiting for a connection, "
+            f"{self.active} active, {self.rate / 1024 / 1024:.2f} MB/s"
+        )
+
+
+class PriorityGate:
+    """A semaphore that admits its best-priority waiter first."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._waiters: List[tuple] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, priority: Any = (AUDIO, 0)) -> None:
+        with self._cond:
+            waiter = (priority, next(self._counter))
+            heapq.heappush(self._waiters, waiter)
+            while self._active >= self.limit or self._waiters[0] != waiter:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._active += 1
+            # The next waiter in line may be admitted too.
+            self._cond.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+class Scheduler:
+
+    def __init__(self, bandwidth: Optional[float] = None,
+                 per_host: Optional[int] = None,
+                 newest_first: bool = False,
+                 report_interval: Optional[float] = 10.0):
+        self.bandwidth = TokenBucket(bandwidth, burst=bandwidth)
+        self.per_host = per_host
+        self.newest_first = newest_first
+        self.report_interval = report_interval
+        self._gates: Dict[str, PriorityGate] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._queued = 0
+        self._active = 0
+        self._bytes = 0
+        self._window = (time.monotonic(), 0)
+
+    def priority(self, kind: int = AUDIO, sort_number=None) -> Tuple[int, int]:
+        """Priority of a transfer: transcripts before audio, then (with
+        `newest_first`) higher sort numbers first. Episodes without a
+        numeric sort number, such as extras, come after the numbered ones.
+
+        >>> scheduler = Scheduler(newest_first=True)
+        >>> sorted([scheduler.priority(AUDIO, "2"), scheduler.priority(TRANSCRIPT, "1"),
+        ...         scheduler.priority(AUDIO, "番外"), scheduler.priority(AUDIO, "10")])
+        [(0, -1), (1, -10), (1, -2), (1, 0)]
+        """
+        number = numeric_sort_number(sort_number)
+        if self.newest_first and number is not None:
+            return kind, -number
+        return kind, 0
+
+    def status(self, reset: bool = True) -> SchedulerStatus:
+        """Current queue depth and the throughput since the last call.
+
+        With `reset` false, the throughput window is left running, so
+        that occasional readers such as a status page do not skew the
+        rate seen by the periodic queue report.
+        """
+        now = time.monotonic()
+        with self._lock:
+            since, start_bytes = self._window
+            if reset:
+                self._window = (now, self._bytes)
+            rate = (self._bytes - start_bytes) / max(now - since, 1e-9)
+            return SchedulerStatus(
+                self._queued,
+                sum(gate.waiting for gate in self._gates.values()),
+                self._active, self._bytes, rate,
+            )
+
+    @contextmanager
+    def transfer(self, url: str) -> Iterator[None]:
+        """Hold a connection slot for `url`'s host while transferring.
+
+        Waiters are admitted in the priority of the task running on the
+        current thread.
+        """
+        gate = None
+        if self.per_host:
+            host = urlsplit(url).netloc
+            with self._lock:
+                gate = self._gates.setdefault(host, PriorityGate(self.per_host))
+            gate.acquire(getattr(self._local, "priority", (AUDIO, 0)))
+
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            if gate is not None:
+                gate.release()
+
+    def throttle(self, nbytes: int) -> None:
+        """Account for `nbytes` received, sleeping to honour the cap."""
+        with self._lock:
+            self._bytes += nbytes
+        self.bandwidth.acquire(nbytes)
+
+    def run(self, tasks: Iterable[Task], jobs: int = 1) -> TransferStats:
+        """Run tasks on a pool of `jobs` threads, best priority first.
+
+        Each task returns the number of bytes it fetched, or `None` if
+        there was nothing to do. Failures are logged and counted rather
+        than aborting the batch. Tasks are queued as soon as they are
+        taken from `tasks`, which may be a generator.
+        """
+
+        batch = _Batch(self)
+        # A list is queued up front so that it is started strictly in
+        # priority order; a generator is consumed while workers run.
+        eager = isinstance(tasks, (list, tuple))
+        if eager:
+            batch.feed(tasks)
+
+        workers = [
+            threading.Thread(target=batch.work, daemon=True)
+            for _ in range(max(1, jobs))
+        ]
+        for worker in workers:
+            worker.start()
+        finished = threading.Event()
+        if self.report_interval:
+            threading.Thread(
+                target=self._report, args=(finished,), daemon=True
+            ).start()
+
+        try:
+            if not eager:
+                batch.feed(tasks)
+        finally:
+            batch.close()
+            for worker in workers:
+                worker.join()
+            finished.set()
+
+        return batch.stats
+
+    def _report(self, finished: threading.Event) -> None:
+        while not finished.wait(self.report_interval):
+            logger.info(f"Queue: {self.status().summary()}")
+
+
+class _Batch:
+    """The queue of one `Scheduler.run` call, shared by its workers."""
+
+    def __init__(self, scheduler: Scheduler):
+        self.scheduler = scheduler
+        self.stats = TransferStats()
+        self._queue: List[tuple] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._fed = False
+
+    def feed(self, tasks: Iterable[Task]) -> None:
+        for task in tasks:
+            task = Task(*task)
+            with self.scheduler._lock:
+                self.scheduler._queued += 1
+            with self._cond:
+                heapq.heappush(self._queue, (task.priority, next(self._counter), task))
+                self.stats.total += 1
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Let workers return once the queue is empty."""
+        with self._cond:
+            self._fed = True
+            self._cond.notify_all()
+
+    def work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._fed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                _, _, task = heapq.heappop(self._queue)
+            with self.scheduler._lock:
+                self.scheduler._queued -= 1
+            self._run(task)
+
+    def _run(self, task: Task) -> None:
+        self.scheduler._local.priority = task.priority
+        stats = self.stats
+        try:
+            nbytes = task.run()
+        except Exception as e:
+            done = stats.record(failed=True)
+            logger.error(f"[{done}/{stats.total}] Failed {task.label}: {e}")
+            return
+        done = stats.record(nbytes or 0, skipped=nbytes is None)
+        logger.info(f"[{done}/{stats.total}] {task.label}")
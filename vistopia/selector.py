@@ -0,0 +1,259 @@
+"""Episode selectors shared by the download commands.
+
+A selector is a comma-separated list of terms, and an article is
+selected if it matches any of them:
+
+=============  ===============================================
+``12``         sort number 12
+``3-8``        sort numbers 3 to 8
+``150-``       sort number 150 and later
+``-20``        sort numbers up to 20
+``latest:5``   the five highest sort numbers
+``first:5``    the five lowest sort numbers
+``part:2``     catalog part 2 (by number, position or title)
+``id:12345``   the article with that `article_id`
+``unlistened`` articles not yet listened to (``listened``: the others)
+=============  ===============================================
+
+Terms joined with ``+`` must all match, as in ``latest:10+unlistened``.
+``not:`` negates a term; on its own between commas it excludes articles
+from the rest of the selection (or from the whole catalog), so
+``1-,not:5`` and ``not:part:1`` work too. The plain ``1-3,4,8`` form of
+`--episode-id` is a selector as well.
+
+A selector is parsed once by `compile_selector`; `Selector.predicate`
+then binds it to one catalog's `CatalogIndex`, turning sort number terms
+into a set lookup and the catalog-wide terms into sets of article ids.
+"""
+
+import sys
+from typing import (
+    Any, Callable, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Union,
+)
+
+Predicate = Callable[[Any], bool]
+
+# Terms that need the whole catalog, and so cannot be applied while a
+# catalog is still being streamed.
+_CATALOG_TERMS = ("latest", "first", "part")
+
+# Closed ranges up to this long are expanded into the set of numbers.
+_MAX_EXPANDED = 100000
+
+
+class _Term(NamedTuple):
+    kind: str       # "range", "latest", "first", "part", "id" or "listened"
+    value: Any
+    negated: bool = False
+
+
+def sort_number(value) -> Optional[int]:
+    """Numeric sort number, or `None` if it is not a number.
+
+    >>> sort_number("12"), sort_number(" 3 "), sort_number("番外")
+    (12, 3, None)
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_term(text: str) -> _Term:
+    negated = text.startswith("not:")
+    if negated:
+        text = text[len("not:"):]
+
+    name, sep, value = text.partition(":")
+    name = name.strip().lower()
+    value = value.strip()
+    if sep:
+        if name in ("latest", "first") and value.isdigit():
+            return _Term(name, int(value), negated)
+        if name in ("part", "id") and value:
+            return _Term(name, value, negated)
+    elif name in ("listened", "unlistened"):
+        return _Term("listened", name == "listened", negated)
+    else:
+        start, dash, end = name.partition("-")
+        if (start or end) and (start.isdigit() or not start) \
+                and (end.isdigit() or not end):
+            low = int(start) if start else 0
+            high = int(end) if end else (sys.maxsize if dash else low)
+            if low <= high:
+                return _Term("range", (low, high), negated)
+    raise ValueError(f"invalid episode selector term {text!r}")
+
+
+class Selector:
+
+    def __init__(self, text: str):
+        self.text = text
+        self.terms: List[List[_Term]] = [
+            [_parse_term(atom.strip()) for atom in term.split("+")]
+            for term in text.split(",") if term.strip()
+        ]
+        if not self.terms:
+            raise ValueError("empty episode selector")
+
+    def __repr__(self):
+        return f"Selector({self.text!r})"
+
+    @property
+    def streamable(self) -> bool:
+        """Whether articles can be matched one by one, without the
+        rest of their catalog."""
+        return not any(
+            atom.kind in _CATALOG_TERMS for term in self.terms for atom in term
+        )
+
+    def predicate(self, index=None) -> Predicate:
+        """A function telling whether an article is selected.
+
+        `index` is the `CatalogIndex` of the articles' catalog; it is
+        required unless the selector is `streamable`.
+        """
+
+        if index is None:
+            if not self.streamable:
+                raise ValueError(f"{self.text!r} needs the whole catalog")
+
+            def number(article):
+                return sort_number(article.sort_number)
+        else:
+            number = index.sort_number
+
+        expanded: Set[int] = set()
+        checks: List[Predicate] = []
+        exclusions: List[Predicate] = []
+        for term in self.terms:
+            if all(atom.negated for atom in term):
+                exclusions += [
+                    _check(atom._replace(negated=False), index, number)
+                    for atom in term
+                ]
+                continue
+            if len(term) == 1 and term[0].kind == "range":
+                low, high = term[0].value
+                if high - low < _MAX_EXPANDED:
+                    expanded.update(range(low, high + 1))
+                    continue
+            checks.append(_all([_check(atom, index, number) for atom in term]))
+
+        included = _union(frozenset(expanded), checks, number)
+        if not exclusions:
+            assert included is not None
+            return included
+
+        excluded = _any(exclusions)
+        if included is None:
+            return lambda article: not excluded(article)
+        selected = included
+        return lambda article: selected(article) and not excluded(article)
+
+    def select(self, catalog) -> List:
+        """The selected articles of `catalog`, in catalog order."""
+        index = catalog.index()
+        matches = self.predicate(index)
+        return [article for article in index.articles if matches(article)]
+
+
+def _check(term: _Term, index, number: Callable[[Any], Optional[int]]) -> Predicate:
+    kind, value = term.kind, term.value
+    check: Predicate
+    if kind == "range":
+        low, high = value
+
+        def check(article):
+            n = number(article)
+            return n is not None and low <= n <= high
+    elif kind == "id":
+        def check(article):
+            return article.article_id == value
+    elif kind == "listened":
+        def check(article):
+            return bool(article.is_listened) == value
+    else:
+        ids = _catalog_ids(term, index)
+
+        def check(article):
+            return article.article_id in ids
+
+    if term.negated:
+        return lambda article: not check(article)
+    return check
+
+
+def _catalog_ids(term: _Term, index) -> FrozenSet[str]:
+    if term.kind == "part":
+        articles = index.part(term.value)
+    elif term.kind == "latest":
+        articles = index.ranked()[::-1][:term.value]
+    else:
+        articles = index.ranked()[:term.value]
+    return frozenset(article.article_id for article in articles)
+
+
+def _union(numbers: FrozenSet[int], checks: List[Predicate],
+           number: Callable[[Any], Optional[int]]) -> Optional[Predicate]:
+    """Whether an article's sort number is in `numbers` or it passes any
+    of `checks`; `None` if there is nothing to match."""
+    if not checks:
+        if not numbers:
+            return None
+        return lambda article: number(article) in numbers
+    rest = _any(checks)
+    if not numbers:
+        return rest
+    return lambda article: number(article) in numbers or rest(article)
+
+
+def _all(checks: List[Predicate]) -> Predicate:
+    if len(checks) == 1:
+        return checks[0]
+    return lambda article: all(check(article) for check in checks)
+
+
+def _any(checks: List[Predicate]) -> Predicate:
+    if len(checks) == 1:
+        return checks[0]
+    return lambda article: any(check(article) for check in checks)
+
+
+def compile_selector(text: str) -> Selector:
+    """Parse a selector, raising `ValueError` if it is malformed.
+
+    >>> from types import SimpleNamespace as Article
+    >>> articles = [Article(article_id=str(n), sort_number=str(n)) for n in range(1, 13)]
+    >>> matches = compile_selector("1-3,10-,not:11").predicate()
+    >>> [a.sort_number for a in articles if matches(a)]
+    ['1', '2', '3', '10', '12']
+    >>> compile_selector("latest:x")
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid episode selector term 'latest:x'
+    """
+    return Selector(text)
+
+
+EpisodeSpec = Union[str, Selector, Iterable[int], None]
+
+
+def as_selector(episodes: EpisodeSpec) -> Optional[Selector]:
+    """`episodes` as a selector, or `None` to select everything.
+
+    `episodes` may be a selector string, a `Selector`, or a collection
+    of sort numbers (empty: everything).
+
+    >>> as_selector({3, 1})
+    Selector('1,3')
+    >>> as_selector(set()) is None
+    True
+    """
+    if isinstance(episodes, Selector):
+        return episodes
+    if not episodes:
+        return None
+    if isinstance(episodes, str):
+        return compile_selector(episodes)
+    return compile_selector(",".join(str(n) for n in sorted(episodes)))
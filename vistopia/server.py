@@ -0,0 +1,386 @@
+"""Serve a downloaded library, and the metadata it came from, over HTTP.
+
+`LibraryServer` lets several machines share one download directory and
+one API response cache. It answers:
+
+``/api/v1/content/catalog/{id}``, ``/api/v1/content/content-show/{id}``, ``/api/v1/search/web``
+    The API payloads, from the response cache or fetched through the
+    server's `Visitor`. In catalogs, media and cover URLs are rewritten
+    to point back at this server, so a client started with
+    ``VISTOPIA_API_BASE_URL=http://host:8649/api/v1/`` downloads
+    everything from here.
+``/media/{content_id}/{article_id}.mp3``
+    The episode from the library, with `Range` and conditional request
+    support. A missing episode is downloaded (and tagged) into the
+    library first, unless fetching is turned off.
+``/covers/{content_id}``
+    The show's cover image, through the shared cover cache.
+``/library``
+    The shows and episodes recorded in the library's manifests.
+
+The library is the current directory, laid out as by `save-show` and
+`sync`.
+"""
+
+import copy
+import email.utils
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from pathvalidate import sanitize_filename
+
+from .exceptions import APIError
+from .manifest import MANIFEST_NAME, ShowManifest
+from .utils import clear_memo
+from .visitor import Visitor
+
+logger = getLogger(__name__)
+
+# API endpoints passed through to the upstream API; the others are
+# per-user and are not shared.
+PROXIED = re.compile(r"content/catalog/\d+|content/content-show/\d+|search/web")
+
+COPY_CHUNK = 64 * 1024
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+
+class LibraryServer:
+    """HTTP server for the library in the current directory."""
+
+    def __init__(self, visitor: Visitor, host: str = "127.0.0.1",
+                 port: int = 8649, fetch: bool = True, no_tag: bool = False):
+        self.visitor = visitor
+        self.fetch = fetch
+        self.no_tag = no_tag
+        self._show_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._routes: List[Tuple[Pattern, Callable[..., Optional[Response]]]] = [
+            (re.compile(r"/api/v1/(.+)"), self._api),
+            (re.compile(r"/media/(\d+)/(\w+)\.mp3"), self._media),
+            (re.compile(r"/covers/(\d+)"), self._cover),
+            (re.compile(r"/library/?"), self._library),
+        ]
+        self.host = host
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.app = self
+
+    def url(self, path: str = "/") -> str:
+        return f"http://{self.host}:{self._httpd.server_port}{path}"
+
+    def serve_forever(self) -> None:
+        logger.info(f"Serving the library at {self.url()}")
+        self._httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    # Routes
+
+    def _api(self, handler, uri: str) -> Response:
+        # Matched whole, so that `..` or encoded segments cannot reach
+        # other endpoints with the server's token.
+        if not PROXIED.fullmatch(uri):
+            return _json({"status": "fail", "message": "not served here"}, 404)
+
+        params = {
+            name: value
+            for name, value in parse_qsl(urlsplit(handler.path).query)
+            if name != "api_token"
+        }
+        try:
+            data = self.visitor.get_api_response(uri, params)
+        except APIError as e:
+            return _json({"status": "fail", "message": e.message},
+                         e.status_code or 502)
+
+        if uri.startswith("content/catalog/"):
+            data = self._rewrite_catalog(handler, int(uri.rsplit("/", 1)[1]), data)
+        return _conditional(handler, _json({"status": "success", "data": data}))
+
+    def _rewrite_catalog(self, handler, content_id: int, data: dict) -> dict:
+        # The payload may be shared with other requests; edit a copy.
+        data = copy.deepcopy(data)
+        host = handler.headers.get("Host") or f"{self.host}:{self._httpd.server_port}"
+        base = f"http://{host}"
+        if data.get("background_img"):
+            data["background_img"] = f"{base}/covers/{content_id}"
+        for part in data.get("catalog") or []:
+            for article in part.get("part") or []:
+                if article.get("media_key_full_url"):
+                    article["media_key_full_url"] = \
+                        f"{base}/media/{content_id}/{article['article_id']}.mp3"
+        return data
+
+    def _media(self, handler, content_id: str, article_id: str) -> Optional[Response]:
+        fname = self._episode_file(int(content_id), article_id)
+        if fname is None:
+            return 404, {}, b"not found"
+        _send_file(handler, fname, "audio/mpeg")
+        return None
+
+    def _cover(self, handler, content_id: str) -> Response:
+        url = self.visitor.get_catalog(int(content_id)).background_img
+        if not url:
+            return 404, {}, b"not found"
+        cover = self.visitor.get_cover(url)
+        return _conditional(handler, (200, {"Content-Type": cover.mime}, cover.data))
+
+    def _library(self, handler) -> Response:
+        shows = []
+        for manifest_path in sorted(Path(".").glob(f"*/{MANIFEST_NAME}")):
+            manifest = ShowManifest(manifest_path.parent, 0).manifest
+            shows.append({
+                "content_id": manifest.content_id,
+                "title": manifest_path.parent.name,
+                "articles": [
+                    {
+                        "article_id": entry.article_id,
+                        "sort_number": entry.sort_number,
+                        "title": entry.title,
+                        "size": entry.size,
+                        "sha256": entry.sha256,
+                        "url": f"/media/{manifest.content_id}/{entry.article_id}.mp3",
+                    }
+                    for entry in manifest.articles.values()
+                ],
+            })
+        return _conditional(handler, _json({"shows": shows}))
+
+    # Library
+
+    def _episode_file(self, content_id: int, article_id: str) -> Optional[Path]:
+        """Path of an episode in the library, downloading it on a miss;
+        `None` if there is no such episode."""
+
+        catalog = self.visitor.get_catalog(content_id)
+        article = catalog.article(article_id)
+        if article is None:
+            # The episode may be newer than the catalog parsed earlier.
+            clear_memo(self.visitor, "get_catalog", content_id)
+            catalog = self.visitor.get_catalog(content_id)
+            article = catalog.article(article_id)
+        if article is None or not article.media_key_full_url:
+            return None
+
+        fname = Path(catalog.title) / "{}.mp3".format(sanitize_filename(article.title))
+        if fname.exists() or not self.fetch:
+            return fname if fname.exists() else None
+
+        # Fetches of one show are serialised, so that its manifest is not
+        # written by two syncs at once and an episode is fetched once.
+        with self._lock:
+            lock = self._show_locks.setdefault(content_id, threading.Lock())
+        with lock:
+            if not fname.exists():
+                logger.info(f"Fetching {catalog.title} {article.title}")
+                actions = [
+                    action
+                    for action in self.visitor.plan_sync([content_id], no_tag=self.no_tag)
+                    if action.article.article_id == article.article_id
+                ]
+                self.visitor.sync(actions)
+        return fname if fname.exists() else None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    app: LibraryServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def do_GET(self):
+        self._handle()
+
+    def do_HEAD(self):
+        self._handle()
+
+    def _handle(self):
+        app = self.server.app
+        path = urlsplit(self.path).path
+        for pattern, route in app._routes:
+            match = pattern.fullmatch(path)
+            if match:
+                break
+        else:
+            _send(self, (404, {}, b"not found"))
+            return
+
+        try:
+            response = route(self, *match.groups())
+        except Exception as e:
+            logger.warning(f"{self.command} {self.path} failed: {e}")
+            response = 502, {}, str(e).encode()
+        if response is not None:
+            _send(self, response)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.client_address[0]} {format % args}")
+
+
+def _json(payload, status: int = 200) -> Response:
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    return status, {"Content-Type": "application/json; charset=utf-8"}, body
+
+
+def _conditional(handler, response: Response) -> Response:
+    """Add an ETag to a 200 response, or turn it into a 304 if the
+    client already has it."""
+    status, headers, body = response
+    if status != 200:
+        return response
+    etag = '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+    headers = dict(headers, ETag=etag)
+    if _etag_matches(handler.headers.get("If-None-Match"), etag):
+        return 304, headers, b""
+    return status, headers, body
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an `If-None-Match` or `If-Range` header names `etag`.
+
+    >>> _etag_matches('W/"a", "b"', '"a"'), _etag_matches("*", '"c"'), _etag_matches(None, '"c"')
+    (True, True, False)
+    """
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(
+        (tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags
+    )
+
+
+def _send(handler, response: Response) -> None:
+    status, headers, body = response
+    handler.send_response(status)
+    for key, value in headers.items():
+        handler.send_header(key, value)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    if handler.command != "HEAD" and status != 304:
+        handler.wfile.write(body)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """The first and last byte of a single `Range: bytes=...` request.
+
+    Returns `None` when the whole file should be sent, and raises
+    `ValueError` when the range cannot be satisfied.
+
+    >>> parse_range("bytes=10-", 100), parse_range("bytes=-10", 100), parse_range("bytes=0-499", 100)
+    ((10, 99), (90, 99), (0, 99))
+    >>> parse_range("bytes=0-1,5-6", 100) is None, parse_range(None, 100) is None
+    (True, True)
+    >>> parse_range("bytes=100-", 100)
+    Traceback (most recent call last):
+    ...
+    ValueError: range not satisfiable
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)-(\d*)\s*", header or "")
+    if not match or not any(match.groups()):
+        # Multiple ranges are allowed to be answered with the whole file.
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _send_file(handler, fname: Path, content_type: str) -> None:
+    """Send `fname`, honouring `Range`, `If-Range`, `If-None-Match`
+    and `If-Modified-Since`."""
+
+    stat = fname.stat()
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    headers = {
+        "Content-Type": content_type,
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+    }
+
+    if _not_modified(handler.headers, etag, stat.st_mtime):
+        _send(handler, (304, headers, b""))
+        return
+
+    try:
+        byte_range = _requested_range(handler.headers, headers, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        _send(handler, (416, headers, b""))
+        return
+
+    start, end = byte_range or (0, size - 1)
+    handler.send_response(206 if byte_range else 200)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    for key, value in headers.items():
+        handler.send_header(key, value)
+    handler.send_header("Content-Length", str(end - start + 1))
+    handler.end_headers()
+    if handler.command != "HEAD":
+        _copy_range(handler, fname, start, end - start + 1)
+
+
+def _requested_range(request_headers, headers: dict,
+                     size: int) -> Optional[Tuple[int, int]]:
+    """`parse_range` of the request's `Range`, unless an `If-Range` names
+    another version than the one described by `headers`."""
+    if_range = request_headers.get("If-Range")
+    if if_range is not None and not _etag_matches(if_range, headers["ETag"]) \
+            and if_range != headers["Last-Modified"]:
+        return None
+    return parse_range(request_headers.get("Range"), size)
+
+
+def _copy_range(handler, fname: Path, start: int, length: int) -> None:
+    try:
+        with open(fname, "rb") as fp:
+            fp.seek(start)
+            while length > 0:
+                chunk = fp.read(min(COPY_CHUNK, length))
+                if not chunk:
+                    break
+                handler.wfile.write(chunk)
+                length -= len(chunk)
+    except (BrokenPipeError, ConnectionResetError):
+        # Players often hang up once they have what they need.
+        handler.close_connection = True
+
+
+def _not_modified(request_headers, etag: str, mtime: float) -> bool:
+    if_none_match = request_headers.get("If-None-Match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request_headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since.timestamp()
+    return False
@@ -0,0 +1,126 @@
+"""Bounded parallel runner for the SingleFile CLI.
+
+Each SingleFile invocation boots its own headless browser, so pages are
+saved by running several invocations side by side, with a per-page
+timeout and retries on failure. A command that times out is killed
+along with the browser it started, and whatever it left of its output
+is removed, so that the page is not taken as saved by the next run.
+"""
+
+import os
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = getLogger(__name__)
+
+
+class Command(NamedTuple):
+    label: str
+    command: List[str]
+    output: Optional[Path] = None   # removed if the command fails
+
+
+class CommandResult(NamedTuple):
+    label: str
+    command: List[str]
+    returncode: Optional[int]
+    stderr: str
+    attempts: int
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+def run_command(label: str, command: List[str],
+                timeout: Optional[float] = None,
+                retries: int = 0,
+                output: Optional[Path] = None) -> CommandResult:
+    """Run `command`, retrying up to `retries` times on failure.
+
+    A timeout counts as a failure with a `None` return code. After every
+    failed attempt, `output` is removed if the command left it behind.
+    """
+
+    returncode: Optional[int] = None
+    stderr = ""
+    for attempt in range(1, retries + 2):
+        logger.debug(f"Running {command} (attempt {attempt})")
+        returncode, stderr = _run_once(command, timeout)
+        if returncode == 0:
+            break
+        if output is not None and os.path.exists(output):
+            os.remove(output)
+        logger.warning(f"{label}: attempt {attempt} failed: {stderr.strip()}")
+
+    return CommandResult(label, command, returncode, stderr, attempt)
+
+
+def _run_once(command: List[str],
+              timeout: Optional[float]) -> Tuple[Optional[int], str]:
+    # In a session of its own, the command and the browser it starts can
+    # be killed together.
+    with subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=True,
+    ) as process:
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(process)
+            process.communicate()
+            return None, f"timed out after {timeout}s"
+    return process.returncode, stderr.decode(errors="replace")
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:  # pragma: no cover - Windows
+        process.kill()
+
+
+def run_commands(commands: Sequence[Tuple[Any, ...]], jobs: int = 1,
+                 timeout: Optional[float] = None,
+                 retries: int = 0) -> List[CommandResult]:
+    """Run `Command`s, or `(label, command)` pairs, on up to `jobs`
+    processes at a time.
+
+    Results are returned in the order of `commands`.
+    """
+
+    def _run(item):
+        label, command, output = Command(*item)
+        result = run_command(label, command, timeout=timeout, retries=retries,
+                             output=output)
+        if result.ok:
+            logger.info(f"Saved {label}")
+        else:
+            logger.error(f"Failed {label}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(_run, commands))
+
+
+def failure_report(results: Sequence[CommandResult]) -> str:
+    """Human-readable summary of a batch, listing every failure."""
+
+    failures = [result for result in results if not result.ok]
+    lines = [f"{len(results) - len(failures)} succeeded, {len(failures)} failed"]
+    for result in failures:
+        lines.append("")
+        lines.append(
+            f"{result.label} (exit code {result.returncode}, "
+            f"{result.attempts} attempts)"
+        )
+        lines.append("  $ " + " ".join(result.command))
+        lines.extend("  " + line for line in result.stderr.strip().splitlines())
+    return "\n".join(lines)
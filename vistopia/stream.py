@@ -0,0 +1,218 @@
+"""Incremental decoding of large JSON documents.
+
+`JSONItemStream` yields the elements of one array (such as the articles
+of a catalog) as soon as each element has been received, without first
+decoding the whole document. Everything outside the streamed array is
+kept as a small "skeleton" document, in which that array is empty.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Union
+
+# Characters that change the scanner's state outside of strings.
+_STRUCTURAL = re.compile(r'["{}\[\],:]')
+# Characters that end (or escape within) a string.
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# Matches any array index in a path.
+ANY = None
+
+# Returned by the scanner's steps when they complete no element.
+_NOTHING = object()
+
+PathItem = Union[str, None]
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "expect_key", "target")
+
+    def __init__(self, kind: str, target: bool = False):
+        self.kind = kind
+        self.key: Optional[str] = None
+        self.expect_key = kind == "{"
+        self.target = target
+
+
+class JSONItemStream:
+    """Yield the elements of the arrays at `path` in a JSON byte stream.
+
+    `path` lists the object keys leading to the array, with `ANY` standing
+    for every element of an enclosing array:
+
+    >>> chunks = [b'{"data": {"title": "A", "catalog": [{"part": [1,', b' 2]},',
+    ...           b' {"part": [3]}]}}']
+    >>> stream = JSONItemStream(chunks, ["data", "catalog", ANY, "part"])
+    >>> list(stream)
+    [1, 2, 3]
+    >>> stream.document()
+    {'data': {'title': 'A', 'catalog': [{'part': []}, {'part': []}]}}
+
+    Only the element being received is buffered, so memory use is bounded
+    by the largest element and the skeleton rather than by the document.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], path: Sequence[PathItem]):
+        self._chunks = chunks
+        self.path = tuple(path)
+        self._stack: List[_Frame] = []
+        self._skeleton: List[str] = []
+        self._document: Any = None
+        self._document_key: Optional[tuple] = None
+        # Scanner state; offsets are into `_buf`.
+        self._buf = ""
+        self._pos = 0                       # scan position
+        self._kept = 0                      # start not yet copied to the skeleton
+        self._start: Optional[int] = None   # start of the element being received
+        self._string_start = 0
+        self._in_string = False
+
+    def document(self) -> Any:
+        """The skeleton document received so far.
+
+        Called while iterating, containers that are still open are closed
+        off, giving the document up to the element just yielded. The same
+        object is returned until more of the skeleton has been received.
+        """
+        # Only rebuilt when the skeleton has grown since the last call.
+        key = (len(self._skeleton), len(self._stack))
+        if self._document_key != key:
+            closing = "".join(
+                "]" if frame.kind == "[" else "}"
+                for frame in reversed(self._stack)
+            )
+            self._document = json.loads("".join(self._skeleton) + closing)
+            self._document_key = key
+        return self._document
+
+    def _is_target(self) -> bool:
+        """Whether an array opened now is one of the streamed arrays."""
+        if len(self._stack) != len(self.path):
+            return False
+        for frame, item in zip(self._stack, self.path):
+            if item is ANY:
+                if frame.kind != "[":
+                    return False
+            elif frame.kind != "{" or frame.key != item:
+                return False
+        return True
+
+    def __iter__(self) -> Iterator[Any]:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in self._chunks:
+            self._buf += decoder.decode(chunk)
+            yield from self._scan()
+            self._compact()
+
+        self._buf += decoder.decode(b"", final=True)
+        if self._stack or self._in_string:
+            raise json.JSONDecodeError(
+                "Unexpected end of document", self._buf, len(self._buf))
+        self._skeleton.append(self._buf)
+
+    def _scan(self) -> Iterator[Any]:
+        """Scan to the end of the buffer, yielding the elements completed."""
+        while True:
+            if self._in_string:
+                if not self._scan_string():
+                    return
+                continue
+            match = _STRUCTURAL.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                return
+            item = self._structural(match.group(), match.start())
+            if item is not _NOTHING:
+                yield item
+
+    def _scan_string(self) -> bool:
+        """Move past the end of the current string, or return false if it
+        does not end within the buffer."""
+        buf = self._buf
+        match = _STRING_SPECIAL.search(buf, self._pos)
+        if match is None:
+            self._pos = len(buf)
+            return False
+        if match.group() == "\\":
+            if match.end() == len(buf):
+                # The escaped character is in the next chunk.
+                self._pos = match.start()
+                return False
+            self._pos = match.end() + 1
+            return True
+        self._in_string = False
+        self._pos = match.end()
+        top = self._stack[-1] if self._stack else None
+        if self._start is None and top and top.kind == "{" and top.expect_key:
+            top.key = json.loads(buf[self._string_start:self._pos])
+        return True
+
+    def _structural(self, char: str, index: int) -> Any:
+        """Handle the structural character at `index`, returning the
+        element it completes, if any."""
+        self._pos = index + 1
+        top = self._stack[-1] if self._stack else None
+
+        if char == '"':
+            self._in_string = True
+            self._string_start = index
+        elif char == "{":
+            self._stack.append(_Frame("{"))
+        elif char == "[":
+            self._open_array()
+        elif char == ":":
+            if top is not None:
+                top.expect_key = False
+        elif char == ",":
+            return self._comma(top, index)
+        else:
+            return self._close(top, index)
+        return _NOTHING
+
+    def _open_array(self) -> None:
+        if self._start is None and self._is_target():
+            self._stack.append(_Frame("[", target=True))
+            self._skeleton.append(self._buf[self._kept:self._pos])
+            self._kept = self._start = self._pos
+        else:
+            self._stack.append(_Frame("["))
+
+    def _comma(self, top: Optional[_Frame], index: int) -> Any:
+        if top is None:
+            return _NOTHING
+        if top.target:
+            item = json.loads(self._buf[self._start:index])
+            self._kept = self._start = self._pos
+            return item
+        if top.kind == "{":
+            top.expect_key = True
+        return _NOTHING
+
+    def _close(self, top: Optional[_Frame], index: int) -> Any:
+        item = _NOTHING
+        if top is not None and top.target:
+            text = self._buf[self._start:index]
+            if text.strip():
+                item = json.loads(text)
+            # Close the array in the skeleton along with the stack, so that
+            # `document` stays consistent while `item` is being yielded.
+            self._skeleton.append("]")
+            self._start = None
+            self._kept = self._pos
+        self._stack.pop()
+        return item
+
+    def _compact(self) -> None:
+        """Drop what has been dealt with from the buffer."""
+        if self._start is None:
+            cut = self._string_start if self._in_string else self._pos
+            self._skeleton.append(self._buf[self._kept:cut])
+            self._kept = cut
+        kept = self._kept
+        self._buf = self._buf[kept:]
+        self._pos -= kept
+        self._string_start -= kept
+        if self._start is not None:
+            self._start -= kept
+        self._kept = 0
@@ -0,0 +1,69 @@
+"""ID3 tagging of downloaded episodes.
+
+All frames for a file are built up front and written with a single save,
+and files whose tags already match are not rewritten at all.
+"""
+
+from typing import List, Optional
+
+
+def text_frames(title: str, album: str, artist: str, track: str,
+                website: Optional[str] = None) -> list:
+    """Text frames equivalent to EasyID3's title/album/artist/
+    tracknumber/website keys."""
+
+    from mutagen.id3 import TALB, TIT2, TPE1, TRCK, WOAR
+
+    frames: list = [
+        TIT2(encoding=3, text=[title]),
+        TALB(encoding=3, text=[album]),
+        TPE1(encoding=3, text=[artist]),
+        TRCK(encoding=3, text=[str(track)]),
+    ]
+    if website:
+        frames.append(WOAR(url=website))
+    return frames
+
+
+def cover_frame(data: bytes, mime: str = "image/jpeg"):
+    from mutagen.id3 import APIC
+
+    return APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data)
+
+
+def _frame_value(frame) -> tuple:
+    return tuple(
+        getattr(frame, name, None) for name in ("text", "url", "mime", "data")
+    )
+
+
+def write_tags(fname, frames: List) -> bool:
+    """Replace the frames in `fname` with `frames` in a single save.
+
+    Each frame replaces every existing frame with the same ID. Returns
+    `False` without touching the file if its tags already match.
+    """
+
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
+    if not frames:
+        return False
+
+    try:
+        tags = ID3(fname)
+    except ID3NoHeaderError:
+        # No ID3 tag found, creating a new ID3 tag
+        # See: https://github.com/quodlibet/mutagen/issues/327
+        tags = ID3()
+
+    if all(
+        [_frame_value(f) for f in tags.getall(frame.FrameID)]
+        == [_frame_value(frame)]
+        for frame in frames
+    ):
+        return False
+
+    for frame in frames:
+        tags.setall(frame.FrameID, [frame])
+    tags.save(fname)
+    return True
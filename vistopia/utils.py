@@ -1,4 +1,8 @@
-from typing import List
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
 
 
 def range_expand(txt: str) -> List[int]:
@@ -17,3 +21,216 @@ def range_expand(txt: str) -> List[int]:
         else:
             lst.append(int(r))
     return lst
+
+
+def parse_size(txt: str) -> int:
+    """Byte count from a size like `500K` or `2M` (powers of 1024).
+
+    >>> parse_size("2M"), parse_size("500k"), parse_size("1024")
+    (2097152, 512000, 1024)
+    """
+    units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    txt = txt.strip().upper().rstrip("B")
+    unit = txt[-1:] if txt[-1:] in units else ""
+    return int(float(txt[:len(txt) - len(unit)]) * units[unit])
+
+
+class TransferStats:
+    """Thread-safe counters for a batch of downloads."""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.saved = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int = 0, skipped: bool = False,
+               failed: bool = False) -> int:
+        """Record one finished item and return how many have finished."""
+        with self._lock:
+            if failed:
+                self.failed += 1
+            elif skipped:
+                self.skipped += 1
+            else:
+                self.saved += 1
+            self.bytes += nbytes
+            return self.saved + self.skipped + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def summary(self) -> str:
+        """One-line summary of the batch.
+
+        >>> stats = TransferStats(total=2)
+        >>> stats.record(skipped=True)
+        1
+        >>> stats.summary().split(" in ")[0]
+        '0 saved, 1 skipped, 0 failed, 0.0 MB'
+        """
+        mb = self.bytes / 1024 / 1024
+        elapsed = self.elapsed
+        rate = mb / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{self.saved} saved, {self.skipped} skipped, "
+            f"{self.failed} failed, {mb:.1f} MB in {elapsed:.1f}s "
+            f"({rate:.2f} MB/s)"
+        )
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key.
+
+    While a call for a key is running, other threads asking for the same
+    key wait for it and receive its result (or exception) instead of
+    starting their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+
+    def do(self, key, func):
+        with self._lock:
+            leader = key not in self._calls
+            if leader:
+                self._calls[key] = _Call()
+            call = self._calls[key]
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+def memoize_method(func):
+    """Cache a method's results on the instance it is called on.
+
+    Unlike `functools.lru_cache`, the cache lives in the instance's
+    `__dict__`, so it is released together with the instance. Concurrent
+    first calls with the same arguments are coalesced into one.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        memo = self.__dict__.setdefault("_memo", {})
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            flight = self.__dict__.setdefault("_memo_flight", SingleFlight())
+            memo[key] = flight.do(key, lambda: func(self, *args, **kwargs))
+        return memo[key]
+
+    return wrapper
+
+
+def clear_memo(obj, name: Optional[str] = None, *args, **kwargs) -> None:
+    """Forget results cached by `memoize_method` on `obj`.
+
+    Forgets everything, every result of method `name`, or, when
+    arguments are given too, only the result of that call.
+
+    >>> class Counter:
+    ...     calls = 0
+    ...     @memoize_method
+    ...     def get(self, n):
+    ...         self.calls += 1
+    ...         return n
+    >>> counter = Counter()
+    >>> counter.get(1), counter.get(2), counter.get(1), counter.calls
+    (1, 2, 1, 2)
+    >>> clear_memo(counter, "get", 1)
+    >>> counter.get(1), counter.get(2), counter.calls
+    (1, 2, 3)
+    """
+    memo = obj.__dict__.get("_memo")
+    if not memo:
+        return
+    if name is None:
+        memo.clear()
+        return
+    call = (args, tuple(sorted(kwargs.items())))
+    for key in list(memo):
+        if key[0] == name and (key[1:] == call or not (args or kwargs)):
+            memo.pop(key, None)
+
+
+class LazyJSON:
+    """Pretty JSON of a model, computed only when formatted.
+
+    Pass as a logging argument so that debug dumps cost nothing unless
+    DEBUG is enabled: `logger.debug("%s", LazyJSON(lambda: catalog))`.
+
+    >>> str(LazyJSON(lambda: {"a": [1]}))
+    '{\\n  "a": [\\n    1\\n  ]\\n}'
+    """
+
+    def __init__(self, func: Callable[[], Any]):
+        self.func = func
+
+    def __str__(self) -> str:
+        from .models import dump_model
+
+        def _plain(value):
+            if isinstance(value, (list, tuple)):
+                return [_plain(item) for item in value]
+            if hasattr(value, "model_dump") or hasattr(value, "dict"):
+                return dump_model(value)
+            return value
+
+        return json.dumps(_plain(self.func()), indent=2, ensure_ascii=False)
+
+
+class StreamReplacer:
+    """Replace `old` with `new` in a byte stream fed chunk by chunk.
+
+    The last `len(old) - 1` bytes of each chunk are held back so that
+    matches spanning two chunks are still found.
+
+    >>> replacer = StreamReplacer(b"/a.css", b"https://x/a.css")
+    >>> replacer.feed(b"<link href=\\"/a") + replacer.feed(b".css\\">") + replacer.flush()
+    b'<link href="https://x/a.css">'
+    """
+
+    def __init__(self, old: bytes, new: bytes):
+        self.old = old
+        self.new = new
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = (self._buffer + chunk).replace(self.old, self.new)
+        keep = len(self.old) - 1
+        # Only hold back a tail that could still grow into a match.
+        while keep and not self.old.startswith(data[-keep:]):
+            keep -= 1
+        if keep:
+            self._buffer = data[-keep:]
+            return data[:-keep]
+        self._buffer = b""
+        return data
+
+    def flush(self) -> bytes:
+        data, self._buffer = self._buffer, b""
+        return data
@@ -0,0 +1,176 @@
+"""Integrity checks for downloaded episodes.
+
+Files are checked without trusting their ID3 tags, which `save-show`,
+`retag-show` and `sync` rewrite: besides the checksum of the whole file,
+a checksum of just the audio (everything after the leading ID3v2 tag) is
+kept, and the MPEG frame headers are walked to catch files that end in
+the middle of a frame.
+"""
+
+import hashlib
+import mmap
+import os
+from typing import List, NamedTuple, Optional, Sequence
+
+# Bitrates in kbit/s, indexed by [MPEG-1?][layer][bitrate index].
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates in Hz, indexed by version bits (0: MPEG-2.5, 2: MPEG-2, 3: MPEG-1).
+_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+
+# How far into the audio to look for the first frame.
+SYNC_WINDOW = 64 * 1024
+
+
+def id3_size(head: bytes) -> int:
+    """Size of the ID3v2 tag at the start of a file, from its first 10 bytes.
+
+    >>> id3_size(b"ID3\\x04\\x00\\x00\\x00\\x00\\x02\\x01")
+    267
+    >>> id3_size(b"\\xff\\xfb\\x90\\x00")
+    0
+    """
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in head[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return size + 10 + footer
+
+
+def frame_length(header: bytes) -> int:
+    """Length in bytes of the MPEG audio frame with this 4-byte header,
+    or 0 if it is not a valid header.
+
+    >>> frame_length(b"\\xff\\xfb\\x90\\x00")  # MPEG-1 layer III, 128 kbit/s
+    417
+    >>> frame_length(b"\\xff\\xfb\\xf0\\x00")
+    0
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return 0
+    version = (header[1] >> 3) & 3
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) \
+            or rate_index == 3:
+        return 0
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[mpeg1, layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+
+def mp3_problem(data, start: int = 0) -> Optional[str]:
+    """Describe what is wrong with the MPEG audio in `data[start:]`, if
+    anything.
+
+    The first frame must be found near `start` and the frames are then
+    followed one by one; the audio is truncated if the last frame runs
+    past the end of the data. Anything after the last frame (such as an
+    ID3v1 tag) is ignored.
+
+    >>> frame = b"\\xff\\xfb\\x90\\x00" + bytes(413)
+    >>> mp3_problem(frame * 3) is None
+    True
+    >>> mp3_problem(frame * 3 + b"TAG" + bytes(125)) is None
+    True
+    >>> mp3_problem((frame * 3)[:-100])
+    'truncated: last frame at byte 834 needs 417 bytes, 317 left'
+    >>> mp3_problem(bytes(1000))
+    'no MPEG audio frames found'
+    """
+
+    end = len(data)
+    pos = _first_frame(data, start, min(end, start + SYNC_WINDOW))
+    if pos is None:
+        return "no MPEG audio frames found"
+
+    while pos + 4 <= end:
+        length = frame_length(data[pos:pos + 4])
+        if not length:
+            break
+        if pos + length > end:
+            return (
+                f"truncated: last frame at byte {pos} needs {length} bytes, "
+                f"{end - pos} left"
+            )
+        pos += length
+    return None
+
+
+def _first_frame(data, start: int, stop: int) -> Optional[int]:
+    pos = data.find(b"\xff", start, stop)
+    while pos != -1:
+        length = frame_length(data[pos:pos + 4])
+        # Require a second header right after the first to rule out
+        # chance matches, unless the data ends there.
+        if length and (
+            pos + length >= len(data)
+            or frame_length(data[pos + length:pos + length + 4])
+        ):
+            return pos
+        pos = data.find(b"\xff", pos + 1, stop)
+    return None
+
+
+class FileReport(NamedTuple):
+    size: int
+    tag_size: int
+    sha256: str
+    audio_sha256: str
+    problem: Optional[str]
+
+
+def inspect_file(fname) -> FileReport:
+    """Checksums and MPEG frame check of one file.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+
+    size = os.path.getsize(fname)
+    if not size:
+        empty = hashlib.sha256().hexdigest()
+        return FileReport(0, 0, empty, empty, "empty file")
+
+    with open(fname, "rb") as fp, \
+            mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        tag_size = min(id3_size(data[:10]), size)
+        with memoryview(data) as view:
+            sha256 = hashlib.sha256(view).hexdigest()
+            with view[tag_size:] as audio:
+                audio_sha256 = hashlib.sha256(audio).hexdigest()
+        problem = mp3_problem(data, tag_size)
+
+    return FileReport(size, tag_size, sha256, audio_sha256, problem)
+
+
+def inspect_files(fnames: Sequence, jobs: Optional[int] = None) -> List[FileReport]:
+    """`inspect_file` for every file, on `jobs` processes (default: one
+    per CPU)."""
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    fnames = [os.fspath(fname) for fname in fnames]
+    if len(fnames) < 2 or jobs == 1:
+        return [inspect_file(fname) for fname in fnames]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(inspect_file, fnames))
@@ -1,9 +1,17 @@
+import json
+import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urljoin
-from urllib.request import urlretrieve, urlcleanup
 from logging import getLogger
-from functools import lru_cache
-from typing import List, Optional
+from functools import partial
+from pathlib import Path
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple,
+    Union,
+)
 from pathvalidate import sanitize_filename
 
 from .models import (
@@ -12,143 +20,1046 @@ from .models import (
     ContentShow,
     RetagArticle,
     RetagSeries,
+    SearchItem,
     SearchResult,
     SubscriptionsList,
     SubscriptionItem,
+    parse_model,
     validate_model,
 )
+from .exceptions import APIError, DownloadError, ThrottledError
+from .manifest import ManifestEntry, ShowManifest, tag_signature
+from .cache import (
+    CacheEntry, Cover, CoverCache, ResponseCache
+)
+from .metrics import Instrumentation, endpoint
+from .ratelimit import AdaptiveRateLimiter
+from .scheduler import AUDIO, TRANSCRIPT, Scheduler, Task
+from .selector import EpisodeSpec, Selector, as_selector
+from .singlefile import Command, run_commands
+from .tagging import cover_frame, text_frames, write_tags
+from .verify import FileReport, id3_size, inspect_file, inspect_files
+from .utils import (
+    SingleFlight, StreamReplacer, TransferStats, memoize_method
+)
 
 logger = getLogger(__name__)
 
+API_BASE_URL = "https://api.vistopia.com.cn/api/v1/"
+CHUNK_SIZE = 64 * 1024
+COURSE_CSS = "/assets/article/course.css"
+
+# Covers fetched by `Visitor.retag_cover` when it is not given a cache.
+DEFAULT_COVERS = CoverCache()
+
+# Error messages that mean "slow down" rather than a hard failure.
+THROTTLE_MESSAGES = ("too many", "rate limit", "频繁", "稍后")
+
+
+def make_session(pool_size: int = 10, retries: int = 3,
+                 backoff_factor: float = 0.5) -> requests.Session:
+    """Create a keep-alive session with a connection pool per host.
+
+    Idempotent requests are retried with exponential backoff on
+    connection errors and 5xx responses.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _content_range_total(response) -> Optional[int]:
+    """Total size from a `Content-Range: bytes */N` header, if present."""
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _content_range_start(response) -> Optional[int]:
+    """First byte from a `Content-Range: bytes N-M/T` header, if present."""
+    start = response.headers.get("Content-Range", "").partition("-")[0]
+    start = start.rpartition(" ")[2]
+    return int(start) if start.isdigit() else None
+
+
+def _if_range(response) -> Optional[str]:
+    """Validator of a response usable in `If-Range`: a strong `ETag`,
+    failing that its `Last-Modified` date."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _stylesheet_url(article: Article) -> str:
+    """Where the stylesheet linked from an article's page is served: the
+    link is relative to the page's host, which is not the API's when
+    `base_url` points at a proxy such as `vistopian serve`."""
+    return urljoin(article.content_url or "", COURSE_CSS)
+
+
+def _validator_path(part: Path) -> Path:
+    return part.with_name(part.name + ".validator")
+
+
+def _save_validator(path: Path, value: Optional[str]) -> None:
+    if value:
+        path.write_text(value)
+    else:
+        _remove(path)
+
+
+def _remove(path: Path) -> None:
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _response_data(uri: str, response: requests.Response):
+    """Extract `data` from an API response or raise a structured error."""
+
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        raise ThrottledError(
+            uri, "too many requests", status_code=429,
+            retry_after=float(retry_after) if retry_after.isdigit() else None,
+        )
+
+    try:
+        payload = response.json()
+    except ValueError:
+        raise APIError(
+            uri, f"HTTP {response.status_code}, invalid JSON",
+            status_code=response.status_code,
+        )
+
+    return _payload_data(uri, payload, response.status_code)
+
+
+def _payload_data(uri: str, payload, status_code: Optional[int] = None):
+    if not isinstance(payload, dict):
+        raise APIError(uri, "unexpected payload", status_code=status_code)
+
+    if payload.get("status") != "success" or "data" not in payload:
+        message = str(
+            payload.get("message") or payload.get("msg") or payload.get("status")
+        )
+        throttled = any(word in message.lower() for word in THROTTLE_MESSAGES)
+        raise (ThrottledError if throttled else APIError)(
+            uri, message, status_code=status_code, payload=payload
+        )
+
+    return payload["data"]
+
+
+def _manifest_problem(entry: ManifestEntry, report: FileReport) -> Optional[str]:
+    """How a local file differs from its manifest entry, if it does."""
+    if entry.audio_sha256:
+        if entry.audio_sha256 != report.audio_sha256:
+            return "audio checksum differs from manifest"
+    elif entry.sha256 != report.sha256:
+        return "checksum differs from manifest"
+    return None
+
+
+def _remote_problem(layout: Union[Tuple[Optional[int], int], str],
+                    report: FileReport) -> Optional[str]:
+    """How a local file differs from the server's, if it does."""
+    if isinstance(layout, str):
+        return layout
+    total, tag_size = layout
+    if total is not None and total - tag_size != report.size - report.tag_size:
+        return (f"audio is {report.size - report.tag_size} bytes, "
+                f"server has {total - tag_size}")
+    return None
+
+
+def _show_manifest(catalog: Catalog, id: int,
+                   manifests: Optional[Dict[int, ShowManifest]]) -> ShowManifest:
+    manifest = manifests.get(id) if manifests is not None else None
+    if manifest is None or manifest.show_dir != Path(catalog.title):
+        manifest = ShowManifest(Path(catalog.title), id)
+        if manifests is not None:
+            manifests[id] = manifest
+    return manifest
+
+
+class SyncAction(NamedTuple):
+    """Work planned by `Visitor.plan_sync` for one article."""
+    manifest: ShowManifest
+    fname: Path
+    article: Article
+    catalog: Catalog
+    series: ContentShow
+    download: bool
+    retag: Optional[str]
+
+
+class Verification(NamedTuple):
+    """Outcome of `Visitor.verify` for one downloaded file."""
+    action: SyncAction
+    problems: List[str]
+
 
 class Visitor:
-    def __init__(self, token: Optional[str]):
+    def __init__(self, token: Optional[str],
+                 pool_size: int = 10, timeout: float = 30,
+                 retries: int = 3, backoff_factor: float = 0.5,
+                 base_url: str = API_BASE_URL,
+                 cache: Optional[ResponseCache] = None,
+                 covers: Optional[CoverCache] = None,
+                 rate: Optional[float] = None, burst: Optional[float] = None,
+                 fast_parse: bool = False,
+                 scheduler: Optional[Scheduler] = None,
+                 metrics: Optional[Instrumentation] = None):
         self.token = token
+        self.fast_parse = fast_parse
+        self.scheduler = scheduler or Scheduler()
+        self.metrics = metrics or Instrumentation()
+        self.limiter = AdaptiveRateLimiter(rate, burst)
+        self._in_flight = SingleFlight()
+        self.cache = cache
+        self.covers = covers or CoverCache()
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.base_url = base_url
+        self.session = make_session(
+            pool_size=pool_size, retries=retries,
+            backoff_factor=backoff_factor,
+        )
 
-    def get_api_response(self, uri: str, params: Optional[dict] = None):
+    def get_api_response(self, uri: str, params: Optional[dict] = None,
+                         throttle: bool = True):
+        """Return the `data` of a successful API response.
 
-        url = urljoin("https://api.vistopia.com.cn/api/v1/", uri)
+        Requests are paced by `self.limiter` (unless `throttle` is false,
+        for callers that already waited on it). When the server throttles
+        us, the limiter slows down and the request is retried; any other
+        error response raises `APIError`.
+        """
 
-        if params is None:
-            params = {}
+        url = urljoin(self.base_url, uri)
 
+        params = dict(params or {})
         params.update({"api_token": self.token})
 
-        logger.debug(f"Visiting {url}")
+        cache = self.cache
+        cached = cache.get(uri, params) if cache else None
+        if cache and cache.ttl_for(uri) is not None:
+            state = "miss" if cached is None else \
+                "hit" if cached.fresh else "stale"
+            self.metrics.count(f"cache.{state}", endpoint=endpoint(uri))
+        if cached and cached.fresh:
+            return cached.data
+
+        # Identical requests already in flight on other threads share
+        # the same response.
+        return self._in_flight.do(
+            (uri, tuple(sorted(params.items()))),
+            lambda: self._request_api(url, uri, params, cached, throttle),
+        )
+
+    def _request_api(self, url: str, uri: str, params: dict,
+                     cached: Optional[CacheEntry], throttle: bool):
+        cache = self.cache
 
-        response = requests.get(url, params=params).json()
-        assert response["status"] == "success"
-        assert "data" in response.keys()
+        for attempt in range(self.retries + 1):
+            if throttle or attempt:
+                self.limiter.acquire()
 
-        return response["data"]
+            logger.debug(f"Visiting {url}")
+
+            api = endpoint(uri)
+            with self.metrics.timer("api.request", endpoint=api):
+                response = self.session.get(
+                    url, params=params, timeout=self.timeout,
+                    headers=cached.validators() if cached else None,
+                )
+            self.metrics.count("api.bytes", len(response.content), endpoint=api)
+            if cache and cached and response.status_code == 304:
+                self.limiter.success()
+                cache.revalidated(uri, params)
+                self.metrics.count("cache.revalidated", endpoint=api)
+                return cached.data
 
-    @lru_cache()
+            try:
+                with self.metrics.timer("api.parse", endpoint=api):
+                    data = _response_data(uri, response)
+            except ThrottledError as e:
+                self.metrics.count("api.throttled", endpoint=api)
+                self.limiter.throttle()
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"{e}; slowing down to {self.limiter.rate}/s")
+                time.sleep(e.retry_after or 0)
+                continue
+
+            self.limiter.success()
+            break
+
+        if cache:
+            cache.put(
+                uri, params, data,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+
+        return data
+
+    def download(self, url: str, fname) -> int:
+        """Stream `url` into `fname` and return the number of bytes fetched.
+
+        Data is written to a sibling `.part` file which is renamed into
+        place only once its size matches the server's `Content-Length`.
+        If a `.part` file is left over from an interrupted run, or the
+        connection drops mid-transfer, the download resumes from the end
+        of the partial file with a `Range` request. The `ETag` or
+        `Last-Modified` date the partial file was fetched with is kept
+        next to it and sent as `If-Range`, so that a file changed on the
+        server in the meantime is fetched again from the start.
+        """
+
+        fname = Path(fname)
+        part = fname.with_name(fname.name + ".part")
+
+        received: List[int] = []
+        with self.metrics.timer("download"):
+            for attempt in range(self.retries + 1):
+                try:
+                    self._download_part(url, part, on_chunk=received.append)
+                    break
+                except (requests.ConnectionError,
+                        requests.exceptions.ChunkedEncodingError,
+                        DownloadError) as e:
+                    if attempt == self.retries:
+                        raise
+                    self.metrics.count("download.resumed")
+                    logger.warning(f"Resuming {url} after error: {e}")
+
+        os.replace(part, fname)
+        _remove(_validator_path(part))
+        self.metrics.count("download.bytes", sum(received))
+        return sum(received)
+
+    def _download_part(self, url: str, part: Path,
+                       on_chunk: Callable[[int], None]) -> None:
+        offset = part.stat().st_size if part.exists() else 0
+        validator = _validator_path(part)
+
+        # Ask for the identity encoding so that `Content-Length` and
+        # `Range` both count the bytes we actually write.
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if validator.exists():
+                headers["If-Range"] = validator.read_text()
+        logger.debug(f"Downloading {url} from byte {offset}")
+
+        with self.scheduler.transfer(url), \
+                self.session.get(url, headers=headers, stream=True,
+                                 timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # The partial file may already hold the whole resource.
+                if _content_range_total(response) == offset:
+                    return
+                part.unlink()
+                raise DownloadError(f"{url}: cannot resume from byte {offset}")
+
+            response.raise_for_status()
+            if response.status_code == 206 and \
+                    _content_range_start(response) != offset:
+                part.unlink()
+                raise DownloadError(
+                    f"{url}: asked for byte {offset}, got "
+                    f"{response.headers.get('Content-Range')}")
+            if response.status_code != 206:
+                # Not resumable, or changed since the partial file was
+                # fetched (`If-Range` did not match): start over.
+                offset = 0
+                _save_validator(validator, _if_range(response))
+            expected = response.headers.get("Content-Length")
+
+            nbytes = 0
+            with open(part, "ab" if offset else "wb") as fp:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    self.scheduler.throttle(len(chunk))
+                    fp.write(chunk)
+                    nbytes += len(chunk)
+                    on_chunk(len(chunk))
+
+        if expected is not None and nbytes != int(expected):
+            raise DownloadError(
+                f"{url}: expected {expected} bytes, got {nbytes}")
+
+    def _parse(self, model_cls, payload):
+        with self.metrics.timer("validate", model=model_cls.__name__):
+            return parse_model(model_cls, payload, fast=self.fast_parse)
+
+    @memoize_method
     def get_catalog(self, id: int):
         response = self.get_api_response(f"content/catalog/{id}")
-        return validate_model(Catalog, response)
-
-    @lru_cache()
-    def get_user_subscriptions_list(self):
-        data: List[SubscriptionItem] = []
-        while True:
-            response = self.get_api_response("user/subscriptions-list")
-            subscriptions = validate_model(SubscriptionsList, response)
-            data.extend(subscriptions.data)
+        return self._parse(Catalog, response)
+
+    def iter_catalog(self, id: int) -> Iterator[Tuple[Catalog, Article]]:
+        """Yield `(catalog, article)` for each article of a show while its
+        catalog is still being received.
+
+        `catalog` holds the show's fields and the parts received so far,
+        with empty `part` lists. Articles are parsed one at a time from
+        the response stream, so the first episodes can be processed
+        before a very large catalog has arrived. A fresh cached catalog
+        is used as is; streamed catalogs are not cached.
+        """
+
+        uri = f"content/catalog/{id}"
+        params = {"api_token": self.token}
+
+        cached = self.cache.get(uri, params) if self.cache else None
+        if cached and cached.fresh:
+            yield from self._iter_cached_catalog(cached.data)
+            return
+
+        with self._stream_api(uri, params) as response:
+            yield from self._iter_streamed_catalog(uri, response)
+
+    def _iter_streamed_catalog(self, uri: str, response: requests.Response) \
+            -> Iterator[Tuple[Catalog, Article]]:
+        from .stream import ANY, JSONItemStream
+
+        stream = JSONItemStream(
+            response.iter_content(CHUNK_SIZE),
+            ["data", "catalog", ANY, "part"],
+        )
+        document = None
+        catalog = None
+        # Articles received before the show's own fields (JSON objects
+        # are unordered) wait until the catalog can be parsed.
+        waiting: List[dict] = []
+        try:
+            for article in stream:
+                if stream.document() is not document:
+                    document = stream.document()
+                    catalog = self._partial_catalog(uri, document, response)
+                if catalog is None:
+                    waiting.append(article)
+                    continue
+                for item in [*waiting, article]:
+                    yield catalog, self._parse(Article, item)
+                waiting = []
+            document = stream.document()
+        except json.JSONDecodeError as e:
+            raise APIError(
+                uri, f"invalid JSON: {e}", status_code=response.status_code
+            )
+        data = _payload_data(uri, document, response.status_code)
+        if waiting:
+            catalog = self._parse(Catalog, data)
+            for article in waiting:
+                yield catalog, self._parse(Article, article)
+
+    def _partial_catalog(self, uri: str, document: dict,
+                         response: requests.Response) -> Optional[Catalog]:
+        """The catalog of a partly received response, or `None` until the
+        show's own fields have arrived."""
+        if "status" in document:
+            _payload_data(uri, document, response.status_code)
+        try:
+            return self._parse(Catalog, document["data"])
+        except ValueError:
+            return None
+
+    def _iter_cached_catalog(self, data: dict) -> Iterator[Tuple[Catalog, Article]]:
+        parts = data["catalog"]
+        catalog = self._parse(Catalog, dict(
+            data, catalog=[dict(part, part=[]) for part in parts]
+        ))
+        for part in parts:
+            for article in part["part"]:
+                yield catalog, self._parse(Article, article)
+
+    def _stream_api(self, uri: str, params: dict) -> requests.Response:
+        """Start a streamed API request, retrying while throttled."""
+
+        url = urljoin(self.base_url, uri)
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            logger.debug(f"Streaming {url}")
+            with self.metrics.timer("api.request", endpoint=endpoint(uri)):
+                response = self.session.get(
+                    url, params=params, timeout=self.timeout, stream=True
+                )
+            if response.status_code == 200:
+                self.limiter.success()
+                return response
+            try:
+                _response_data(uri, response)
+            except ThrottledError as e:
+                self.limiter.throttle()
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"{e}; slowing down to {self.limiter.rate}/s")
+                time.sleep(e.retry_after or 0)
+                continue
+            finally:
+                response.close()
             break
-        return data
+        raise APIError(
+            uri, f"HTTP {response.status_code}",
+            status_code=response.status_code,
+        )
+
+    def iter_pages(self, uri: str, model_cls, params: Optional[dict] = None,
+                   jobs: int = 4) -> Iterator:
+        """Lazily yield the items of every page of a paginated endpoint.
+
+        The first page tells us `last_page`; the remaining pages are then
+        fetched concurrently on up to `jobs` threads but still yielded in
+        order. Endpoints that only report `next_page_url` are walked one
+        page at a time.
+        """
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        params = dict(params or {})
+
+        def _get_page(page: int):
+            response = self.get_api_response(uri, dict(params, page=page))
+            return self._parse(model_cls, response)
+
+        first = self._parse(model_cls, self.get_api_response(uri, params))
+        yield from first.data
+
+        current = first.current_page or 1
+        if first.last_page:
+            pages = range(current + 1, first.last_page + 1)
+            with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+                for result in executor.map(_get_page, pages):
+                    yield from result.data
+            return
+
+        result = first
+        while result.next_page_url and result.data:
+            current += 1
+            result = _get_page(current)
+            yield from result.data
+
+    def iter_user_subscriptions(self, jobs: int = 4) \
+            -> Iterator[SubscriptionItem]:
+        return self.iter_pages(
+            "user/subscriptions-list", SubscriptionsList, jobs=jobs
+        )
+
+    def iter_search(self, keyword: str, jobs: int = 4) -> Iterator[SearchItem]:
+        return self.iter_pages(
+            "search/web", SearchResult, {"keyword": keyword}, jobs=jobs
+        )
+
+    @memoize_method
+    def get_user_subscriptions_list(self) -> List[SubscriptionItem]:
+        return list(self.iter_user_subscriptions())
 
-    @lru_cache()
-    def search(self, keyword: str) -> list:
-        response = self.get_api_response("search/web", {'keyword': keyword})
-        result = validate_model(SearchResult, response)
-        return result.data
+    @memoize_method
+    def search(self, keyword: str) -> List[SearchItem]:
+        return list(self.iter_search(keyword))
 
-    @lru_cache()
+    @memoize_method
     def get_content_show(self, id: int):
         response = self.get_api_response(f"content/content-show/{id}")
-        return validate_model(ContentShow, response)
+        with self.metrics.timer("validate", model=ContentShow.__name__):
+            return validate_model(ContentShow, response)
+
+    def prefetch(self, ids: Sequence[int], series: bool = True,
+                 jobs: Optional[int] = None) -> None:
+        """Fetch the catalogs (and content-show records) of `ids`
+        concurrently, so that later calls are served from memory."""
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        methods = [self.get_catalog]
+        if series:
+            methods.append(self.get_content_show)
+
+        with ThreadPoolExecutor(max_workers=jobs or self.pool_size) as executor:
+            futures = [
+                executor.submit(method, id) for id in ids for method in methods
+            ]
+            for future in futures:
+                future.result()
 
     def save_show(self, id: int,
                   no_tag: bool = False, no_cover: bool = False,
-                  episodes: Optional[set] = None):
+                  episodes: EpisodeSpec = None, jobs: int = 1,
+                  stream: bool = False):
+        return self.save_shows(
+            [id], no_tag=no_tag, no_cover=no_cover,
+            episodes=episodes, jobs=jobs, stream=stream,
+        )
+
+    def save_shows(self, ids: Sequence[int],
+                   no_tag: bool = False, no_cover: bool = False,
+                   episodes: EpisodeSpec = None, jobs: int = 1,
+                   stream: bool = False):
+        """Save several shows, sharing one pool of `jobs` workers.
+
+        `episodes` selects the episodes to save (see `vistopia.selector`).
+        With `stream`, catalogs are read with `iter_catalog` and each
+        episode is queued as soon as it has been parsed.
+        """
 
-        from pathlib import Path
+        selector = as_selector(episodes)
+        if stream and selector and not selector.streamable:
+            logger.info(f"Episodes {selector.text!r} need whole catalogs; not streaming")
+            stream = False
 
+        tasks: Iterable[Task]
+        if stream:
+            tasks = (
+                task for id in ids
+                for task in self._stream_show_tasks(
+                    id, no_tag, no_cover, selector)
+            )
+        else:
+            self.prefetch(ids)
+            tasks = []
+            for id in ids:
+                tasks += self._show_tasks(id, no_tag, no_cover, selector)
+        stats = self.scheduler.run(tasks, jobs)
+
+        logger.info(stats.summary())
+        return stats
+
+    def _show_tasks(self, id: int, no_tag: bool, no_cover: bool,
+                    episodes: Optional[Selector]):
         catalog = self.get_catalog(id)
         series = self.get_content_show(id)
 
         show_dir = Path(catalog.title)
         show_dir.mkdir(exist_ok=True)
 
-        for part in catalog.catalog:
-            for article in part.part:
+        return [
+            Task(f"{catalog.title}: {article.title}", partial(
+                self._save_episode, show_dir, article,
+                catalog, series, no_tag, no_cover
+            ), self.scheduler.priority(AUDIO, article.sort_number))
+            for article in catalog.select(episodes)
+        ]
 
-                if episodes and \
-                        int(article.sort_number) not in episodes:
-                    continue
+    def _stream_show_tasks(self, id: int, no_tag: bool, no_cover: bool,
+                           episodes: Optional[Selector]):
+        series = self.get_content_show(id)
+        show_dir = None
+        selected = episodes.predicate() if episodes else None
 
-                fname = show_dir / "{}.mp3".format(
-                    sanitize_filename(article.title)
-                )
-                if not fname.exists():
-                    urlretrieve(article.media_key_full_url, fname)
+        for catalog, article in self.iter_catalog(id):
+            if selected and not selected(article):
+                continue
+            if show_dir is None:
+                show_dir = Path(catalog.title)
+                show_dir.mkdir(exist_ok=True)
+            yield Task(f"{catalog.title}: {article.title}", partial(
+                self._save_episode, show_dir, article,
+                catalog, series, no_tag, no_cover
+            ), self.scheduler.priority(AUDIO, article.sort_number))
+
+    def _save_episode(self, show_dir, article, catalog: Catalog,
+                      series, no_tag: bool, no_cover: bool):
+        """Download and tag one episode.
+
+        Returns the number of bytes fetched, or `None` if the file
+        already existed.
+        """
+
+        fname = show_dir / "{}.mp3".format(
+            sanitize_filename(article.title)
+        )
+        nbytes = None
+        if not fname.exists():
+            nbytes = self.download(article.media_key_full_url, fname)
+
+        self.tag_episode(
+            fname, article, catalog, series,
+            no_tag=no_tag, no_cover=no_cover,
+        )
+
+        return nbytes
+
+    def plan_sync(self, ids: Optional[Sequence[int]] = None,
+                  no_tag: bool = False,
+                  manifests: Optional[Dict[int, ShowManifest]] = None) \
+            -> List[SyncAction]:
+        """Diff the catalogs of `ids` against their show manifests.
+
+        Defaults to all subscribed shows. Only articles that are new,
+        whose media URL changed, whose file went missing or whose tags
+        are out of date are returned.
+
+        Callers that plan the same shows repeatedly while earlier actions
+        are still being carried out pass a dict in `manifests`, so that
+        every plan records into, and saves, the same manifest of a show.
+        """
+
+        if ids is None:
+            ids = [
+                item.content_id
+                for item in self.get_user_subscriptions_list()
+            ]
+        self.prefetch(ids)
+
+        actions = []
+        for id in ids:
+            catalog = self.get_catalog(id)
+            series = self.get_content_show(id)
+            manifest = _show_manifest(catalog, id, manifests)
+
+            for part in catalog.catalog:
+                for article in part.part:
+                    if not article.media_key_full_url:
+                        continue
+                    fname = manifest.show_dir / "{}.mp3".format(
+                        sanitize_filename(article.title)
+                    )
+                    entry = manifest.get(article.article_id)
+                    download = not fname.exists() or (
+                        entry is not None and
+                        entry.media_url != article.media_key_full_url
+                    )
+                    signature = None if no_tag else \
+                        self._tag_signature(article, catalog, series)
+                    retag = signature if signature and (
+                        download or entry is None or entry.tags != signature
+                    ) else None
+                    if entry is None or download or retag:
+                        actions.append(SyncAction(
+                            manifest, fname, article, catalog, series,
+                            download, retag,
+                        ))
+
+        return actions
+
+    @staticmethod
+    def _tag_signature(article, catalog, series) -> str:
+        return tag_signature(
+            article.title, series.title, series.author,
+            article.sort_number, article.content_url,
+            catalog.background_img,
+        )
+
+    def content_length(self, url: str) -> Optional[int]:
+        """Size of the resource at `url` according to a HEAD request."""
+        response = self.session.head(
+            url, allow_redirects=True, timeout=self.timeout,
+            headers={"Accept-Encoding": "identity"},
+        )
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        return int(length) if length is not None else None
+
+    def sync(self, actions: Sequence[SyncAction],
+             jobs: int = 1) -> TransferStats:
+        """Carry out the actions returned by `plan_sync`."""
+
+        manifests = {id(action.manifest): action.manifest
+                     for action in actions}
+        for manifest in manifests.values():
+            manifest.show_dir.mkdir(exist_ok=True)
+
+        tasks = [
+            Task(action.article.title, partial(self._sync_article, action),
+                 self.scheduler.priority(AUDIO, action.article.sort_number))
+            for action in actions
+        ]
+        try:
+            stats = self.scheduler.run(tasks, jobs)
+        finally:
+            for manifest in manifests.values():
+                manifest.save()
+
+        logger.info(f"Sync: {stats.summary()}")
+        return stats
+
+    def _sync_article(self, action: SyncAction) -> Optional[int]:
+        article = action.article
+        entry = action.manifest.get(article.article_id)
+
+        nbytes = None
+        if action.download and article.media_key_full_url:
+            # The new file replaces the old one only once it is complete.
+            nbytes = self.download(article.media_key_full_url, action.fname)
+
+        if action.retag:
+            self.tag_episode(
+                action.fname, article, action.catalog, action.series
+            )
+
+        self._record(
+            action, inspect_file(action.fname),
+            tags=action.retag or (entry.tags if entry else None),
+        )
+        return nbytes
+
+    @staticmethod
+    def _record(action: SyncAction, report: FileReport,
+                tags: Optional[str]) -> None:
+        article = action.article
+        action.manifest.record(ManifestEntry(
+            article_id=article.article_id,
+            sort_number=article.sort_number,
+            title=article.title,
+            file=action.fname.name,
+            media_url=article.media_key_full_url,
+            size=report.size,
+            sha256=report.sha256,
+            audio_sha256=report.audio_sha256,
+            tags=tags,
+        ))
+
+    def media_layout(self, url: str) -> Tuple[Optional[int], int]:
+        """Size of the resource at `url` and of its leading ID3v2 tag.
+
+        Only the first 10 bytes are requested, so that the length of the
+        audio can be compared with a local file whose tags were rewritten.
+        """
+        with self.session.get(
+            url, stream=True, timeout=self.timeout,
+            headers={"Range": "bytes=0-9", "Accept-Encoding": "identity"},
+        ) as response:
+            response.raise_for_status()
+            if response.status_code == 206:
+                total = _content_range_total(response)
+            else:
+                length = response.headers.get("Content-Length")
+                total = int(length) if length is not None else None
+            head = next(response.iter_content(10), b"")
+        return total, id3_size(head)
+
+    def verify(self, ids: Optional[Sequence[int]] = None,
+               jobs: Optional[int] = None,
+               remote: bool = True) -> List[Verification]:
+        """Check every downloaded episode of `ids` (default: all
+        subscribed shows).
+
+        Files are hashed and their MPEG frames checked on `jobs` processes.
+        A file is bad if its audio is truncated, if its checksum differs
+        from the one in the show manifest, or, with `remote`, if its audio
+        is not as long as the server's or the server could not be asked.
+        Good files are recorded in the manifest so that later runs can
+        compare against them.
+        """
 
-                if not no_tag:
-                    self.retag(str(fname), article, catalog, series)
+        actions = self._downloaded(ids)
+        reports = inspect_files([action.fname for action in actions], jobs)
 
-                if not no_cover:
-                    self.retag_cover(str(fname), article, catalog, series)
+        layouts: List[Union[Tuple[Optional[int], int], str]] = []
+        if remote:
+            from concurrent.futures import ThreadPoolExecutor
 
-    def save_transcript(self, id: int, episodes: Optional[set] = None):
+            with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+                layouts = list(executor.map(self._remote_layout, actions))
 
-        from pathlib import Path
+        results = []
+        for i, (action, report) in enumerate(zip(actions, reports)):
+            found = [report.problem]
+            entry = action.manifest.get(action.article.article_id)
+            if entry and entry.media_url == action.article.media_key_full_url:
+                found.append(_manifest_problem(entry, report))
+            if layouts:
+                found.append(_remote_problem(layouts[i], report))
+            problems = [problem for problem in found if problem]
 
+            if not problems:
+                self._record(action, report, entry.tags if entry else None)
+            results.append(Verification(action, problems))
+
+        manifests = {action.manifest.path: action.manifest for action in actions}
+        for manifest in manifests.values():
+            manifest.save()
+
+        bad = sum(1 for result in results if result.problems)
+        logger.info(f"Verified {len(results)} files, {bad} bad")
+        return results
+
+    def _downloaded(self, ids: Optional[Sequence[int]]) -> List[SyncAction]:
+        """Actions re-downloading every episode of `ids` that is on disk."""
+
+        if ids is None:
+            ids = [
+                item.content_id
+                for item in self.get_user_subscriptions_list()
+            ]
+        self.prefetch(ids)
+
+        actions = []
+        for id in ids:
+            catalog = self.get_catalog(id)
+            series = self.get_content_show(id)
+            manifest = ShowManifest(Path(catalog.title), id)
+            for part in catalog.catalog:
+                for article in part.part:
+                    fname = manifest.show_dir / "{}.mp3".format(
+                        sanitize_filename(article.title)
+                    )
+                    if article.media_key_full_url and fname.exists():
+                        actions.append(SyncAction(
+                            manifest, fname, article, catalog, series,
+                            True, None,
+                        ))
+        return actions
+
+    def _remote_layout(self, action: SyncAction) \
+            -> Union[Tuple[Optional[int], int], str]:
+        """`media_layout` of an action's URL, or why it could not be
+        checked, so that one failure does not end the whole run."""
+        url = action.article.media_key_full_url
+        assert url is not None
+        try:
+            return self.media_layout(url)
+        except requests.RequestException as e:
+            logger.warning(f"Checking {action.fname} against the server failed: {e}")
+            return f"server check failed: {e}"
+
+    def repair(self, results: Sequence[Verification], jobs: int = 1,
+               no_tag: bool = False) -> TransferStats:
+        """Download (and tag) the files that failed verification again."""
+        actions = []
+        for result in results:
+            if not result.problems:
+                continue
+            action = result.action
+            logger.warning(
+                f"Re-downloading {action.fname}: {'; '.join(result.problems)}"
+            )
+            retag = None if no_tag else self._tag_signature(
+                action.article, action.catalog, action.series)
+            actions.append(action._replace(retag=retag))
+        return self.sync(actions, jobs)
+
+    def save_transcript(self, id: int, episodes: EpisodeSpec = None,
+                        jobs: int = 1, local_css: bool = False):
+        return self.save_transcripts(
+            [id], episodes=episodes, jobs=jobs, local_css=local_css
+        )
+
+    def save_transcripts(self, ids: Sequence[int],
+                         episodes: EpisodeSpec = None,
+                         jobs: int = 1, local_css: bool = False):
+        """Save the transcript HTML of each article of several shows.
+
+        The stylesheet link is rewritten while streaming. It points to the
+        host the page came from by default; with `local_css` the stylesheet
+        is saved once into each show directory and linked relatively
+        instead.
+        """
+
+        self.prefetch(ids, series=False)
+
+        selector = as_selector(episodes)
+        tasks = []
+        for id in ids:
+            tasks += self._transcript_tasks(id, selector, local_css)
+        stats = self.scheduler.run(tasks, jobs)
+
+        logger.info(stats.summary())
+        return stats
+
+    def _transcript_tasks(self, id: int, episodes: Optional[Selector],
+                          local_css: bool):
         catalog = self.get_catalog(id)
 
         show_dir = Path(catalog.title)
         show_dir.mkdir(exist_ok=True)
 
-        for part in catalog.catalog:
-            for article in part.part:
+        articles = [
+            article for article in catalog.select(episodes)
+            if article.content_url
+        ]
+        tasks = []
+        css = show_dir / Path(COURSE_CSS).name
+        if local_css and articles and not css.exists():
+            # A task of its own, so that failing to fetch it fails only
+            # this task; it is tried again by the next run.
+            tasks.append(Task(f"{catalog.title}: {css.name}", partial(
+                self.download, _stylesheet_url(articles[0]), css,
+            ), self.scheduler.priority(TRANSCRIPT)))
 
-                if episodes and \
-                        int(article.sort_number) not in episodes:
-                    continue
+        for article in articles:
+            fname = show_dir / "{}.html".format(
+                sanitize_filename(article.title)
+            )
+            if not fname.exists():
+                css_href = css.name if local_css else _stylesheet_url(article)
+                tasks.append(Task(f"{catalog.title}: {article.title}", partial(
+                    self._save_html, article.content_url, fname,
+                    COURSE_CSS, css_href,
+                ), self.scheduler.priority(TRANSCRIPT, article.sort_number)))
+        return tasks
 
-                fname = show_dir / "{}.html".format(
-                    sanitize_filename(article.title)
-                )
-                if not fname.exists():
-                    urlretrieve(article.content_url, fname)
+    def _save_html(self, url: str, fname: Path, old: str, new: str) -> int:
+        """Stream a page to `fname`, replacing `old` with `new` on the way."""
 
-                    with open(fname) as f:
-                        content = f.read()
+        replacer = StreamReplacer(old.encode(), new.encode())
+        part = fname.with_name(fname.name + ".part")
 
-                    content = content.replace(
-                        "/assets/article/course.css",
-                        "https://api.vistopia.com.cn/assets/article/course.css"
-                    )
+        nbytes = 0
+        with self.metrics.timer("transcript"), \
+                self.scheduler.transfer(url), \
+                self.session.get(url, stream=True, timeout=self.timeout) \
+                as response:
+            response.raise_for_status()
+            with open(part, "wb") as fp:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    self.scheduler.throttle(len(chunk))
+                    fp.write(replacer.feed(chunk))
+                    nbytes += len(chunk)
+                fp.write(replacer.flush())
 
-                    with open(fname, "w") as f:
-                        f.write(content)
+        os.replace(part, fname)
+        self.metrics.count("transcript.bytes", nbytes)
+        return nbytes
 
     def save_transcript_with_single_file(self, id: int,
-                                         episodes: Optional[set] = None,
+                                         episodes: EpisodeSpec = None,
                                          single_file_exec_path: str = "",
-                                         cookie_file_path: str = ""):
-        import subprocess
-        from pathlib import Path
-        logger.debug(f"save_transcript_with_single_file id {id}")
+                                         cookie_file_path: str = "",
+                                         jobs: int = 1,
+                                         timeout: Optional[float] = None,
+                                         retries: int = 0):
+        return self.save_transcripts_with_single_file(
+            [id], episodes=episodes,
+            single_file_exec_path=single_file_exec_path,
+            cookie_file_path=cookie_file_path,
+            jobs=jobs, timeout=timeout, retries=retries,
+        )
 
-        catalog = self.get_catalog(id)
-        show_dir = Path(catalog.title)
-        show_dir.mkdir(exist_ok=True)
+    def save_transcripts_with_single_file(self, ids: Sequence[int],
+                                          episodes: EpisodeSpec = None,
+                                          single_file_exec_path: str = "",
+                                          cookie_file_path: str = "",
+                                          jobs: int = 1,
+                                          timeout: Optional[float] = None,
+                                          retries: int = 0):
+        logger.debug(f"save_transcript_with_single_file ids {ids}")
 
-        for part in catalog.catalog:
-            for article in part.part:
-                if episodes and int(article.sort_number) not in episodes:
-                    continue
+        self.prefetch(ids, series=False)
 
+        selector = as_selector(episodes)
+        commands = []
+        for id in ids:
+            catalog = self.get_catalog(id)
+            show_dir = Path(catalog.title)
+            show_dir.mkdir(exist_ok=True)
+
+            for article in catalog.select(selector):
                 fname = show_dir / "{}.html".format(
                     sanitize_filename(article.title)
                 )
@@ -161,58 +1072,112 @@ class Visitor:
                         "--browser-cookies-file=" + cookie_file_path
                     ]
                     logger.debug(f"singlefile command {command}")
-                    try:
-                        subprocess.run(command, check=True)
-                        print(
-                            f"Successfully fetched and saved to {fname}")
-                    except subprocess.CalledProcessError as e:
-                        print(f"Failed to fetch page using single-file: {e}")
+                    commands.append(Command(
+                        f"{catalog.title}: {article.title}", command, fname,
+                    ))
+
+        return run_commands(
+            commands, jobs=jobs, timeout=timeout, retries=retries
+        )
+
+    def get_cover(self, url: str) -> Cover:
+        return self.covers.get(url, self._fetch)
+
+    def _fetch(self, url: str) -> bytes:
+        logger.debug(f"Fetching {url}")
+        with self.metrics.timer("cover.fetch"):
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        self.metrics.count("cover.bytes", len(response.content))
+        return response.content
+
+    def tag_episode(self, fname, article, catalog: Catalog, series,
+                    no_tag: bool = False, no_cover: bool = False) -> bool:
+        """Write text tags and cover art to `fname` in a single save.
+
+        Returns `False` if the file already carried the same tags.
+        """
+
+        frames = []
+        if not no_tag:
+            frames += text_frames(
+                title=article.title,
+                album=series.title,
+                artist=series.author,
+                track=article.sort_number,
+                website=article.content_url,
+            )
+        if not no_cover and catalog.background_img:
+            cover = self.get_cover(catalog.background_img)
+            frames.append(cover_frame(cover.data, cover.mime))
+
+        with self.metrics.timer("tag"):
+            return write_tags(fname, frames)
+
+    def retag_show(self, id: int, episodes: EpisodeSpec = None,
+                   no_cover: bool = False, jobs: int = 1) -> TransferStats:
+        """Re-tag the already downloaded episodes of a show."""
+
+        catalog = self.get_catalog(id)
+        series = self.get_content_show(id)
+        show_dir = Path(catalog.title)
+
+        tasks = []
+        for article in catalog.select(episodes):
+            fname = show_dir / "{}.mp3".format(
+                sanitize_filename(article.title)
+            )
+            if not fname.exists():
+                continue
+            tasks.append(Task(article.title, partial(
+                self._retag_episode, fname, article, catalog, series,
+                no_cover
+            )))
+
+        stats = self.scheduler.run(tasks, jobs)
+        logger.info(f"{catalog.title}: {stats.summary()}")
+        return stats
+
+    def _retag_episode(self, fname, article, catalog, series,
+                       no_cover) -> Optional[int]:
+        changed = self.tag_episode(
+            fname, article, catalog, series, no_cover=no_cover
+        )
+        return 0 if changed else None
 
     @staticmethod
     def retag(
         fname: str,
-        article_info: RetagArticle,
+        article_info: Union[Article, RetagArticle],
         catalog_info: Catalog,
-        series_info: RetagSeries
+        series_info: Union[ContentShow, RetagSeries]
     ):
 
-        from mutagen.easyid3 import EasyID3
-        from mutagen.id3 import ID3NoHeaderError
+        frames = text_frames(
+            title=article_info.title,
+            album=series_info.title,
+            artist=series_info.author,
+            track=article_info.sort_number,
+            website=article_info.content_url,
+        )
 
         try:
-            track = EasyID3(fname)
-        except ID3NoHeaderError:
-            # No ID3 tag found, creating a new ID3 tag
-            # See: https://github.com/quodlibet/mutagen/issues/327
-            track = EasyID3()
-
-        track['title'] = article_info.title
-        track['album'] = series_info.title
-        track['artist'] = series_info.author
-        track['tracknumber'] = str(article_info.sort_number)
-        track['website'] = article_info.content_url
-
-        try:
-            track.save(fname)
+            write_tags(fname, frames)
         except Exception as e:
             print(f"Error saving ID3 tags: {e}")
 
     @staticmethod
-    def retag_cover(fname, article_info, catalog_info: Catalog, series_info):
-
-        from mutagen.id3 import ID3, APIC
+    def retag_cover(fname, article_info, catalog_info: Catalog, series_info,
+                    session: Optional[requests.Session] = None,
+                    covers: Optional[CoverCache] = None, timeout: float = 30):
 
-        @lru_cache()
-        def _get_cover(url: str) -> bytes:
-            cover_fname, _ = urlretrieve(url)
-            with open(cover_fname, "rb") as fp:
-                cover = fp.read()
-            urlcleanup()
-            return cover
+        if not catalog_info.background_img:
+            return
 
-        cover = _get_cover(catalog_info.background_img)
+        def fetch(url: str) -> bytes:
+            response = (session or requests).get(url, timeout=timeout)
+            response.raise_for_status()
+            return response.content
 
-        track = ID3(fname)
-        track["APIC"] = APIC(encoding=3, mime="image/jpeg",
-                             type=3, desc="Cover", data=cover)
-        track.save()
+        cover = (covers or DEFAULT_COVERS).get(catalog_info.background_img, fetch)
+        write_tags(fname, [cover_frame(cover.data, cover.mime)])